@@ -1,19 +1,39 @@
 from fyers_apiv3 import fyersModel
-from flask import Flask, redirect, request, render_template_string
+from fyers_apiv3.FyersWebsocket import data_ws
+from flask import Flask, Response, redirect, request
+from werkzeug.serving import make_server
 import webbrowser
 import pandas as pd
+import numpy as np
 import os
 import math
+import gzip
+import hashlib
+import zlib
+import mmap
+import multiprocessing
+import socket
+import sqlite3
 import traceback
 import json
+import bisect
+import ctypes
+import signal
+import queue
+import re
+import asyncio
+import threading
+import time
 from datetime import datetime
-from collections import deque
+from collections import OrderedDict, deque
 import pytz  # Added for timezone handling
 
 # ---- Timezone Function ----
 def get_mumbai_time():
-    """Get current time in Mumbai (IST) timezone"""
+    """Get current time in Mumbai (IST) timezone, or the replay clock while replaying"""
     ist = pytz.timezone('Asia/Kolkata')
+    if replay_clock is not None:
+        return datetime.fromtimestamp(replay_clock, ist)
     return datetime.now(ist)
 
 # ---- Credentials ----
@@ -44,17 +64,255 @@ symbols_map = {
     "MIDCAPNIFTY": "NSE:MIDCPNIFTY-INDEX",
     "SENSEX": "BSE:SENSEX-INDEX"
 }
+symbol_indexes = {symbol: index_name for index_name, symbol in symbols_map.items()}
+
+CHAIN_COLUMNS = ["ask", "bid", "ltp", "ltpch", "volume", "vol_change", "oi", "oi_change", "oich", "oichp", "prev_oi",
+                 "iv", "delta", "gamma", "theta", "vega"]
+CHANGE_COLUMNS = ("vol_change", "oi_change")
+GREEK_COLUMNS = ("iv", "delta", "gamma", "theta", "vega")
+GREEK_FORMATS = {"iv": "%.2f", "delta": "%.2f", "gamma": "%.4f", "theta": "%.2f", "vega": "%.2f"}
+CHAIN_NUMERIC_COLUMNS = ["strike_price", "ask", "bid", "ltp", "oi", "oich", "oichp", "prev_oi", "volume", "ltpch"]
+CRORE_COLUMNS = ("volume", "oi")
+CHAIN_WINDOW = 3  # Strikes shown either side of ATM on /chain
+CHAIN_WINDOWS = [3, 5, 10, 0]  # Choices for the strikes dropdown, 0 = full chain
+SCALPING_WINDOW = 2  # Strikes shown either side of ATM in scalping opportunities
+SCALPING_WINDOWS = [2, 3, 5, 10]
+ATM_ROW_STYLE = "class='atm'"  # Row classes are styled once in the /chain page CSS
+TOTALS_ROW_STYLE = "class='tot'"
+ITM_TOTALS_ROW_STYLE = "class='itm'"
+ALL_TOTALS_ROW_STYLE = "class='all'"
+VOLUME_TREND_LABELS = {"bullish": "CE Volume > PE Volume → Bullish", "bearish": "PE Volume > CE Volume → Bearish"}
+BIAS_LABELS = {"bearish": "Bearish 📉", "bullish": "Bullish 📈", "neutral": "Neutral ⚖️", None: ""}
 
 display_cols = ["ask", "bid", "ltp", "ltpch", "option_type", "strike_price",
                 "oi", "oich", "oichp", "prev_oi", "volume"]
 
-previous_data = {}  # Store previous rows for diff
-scalping_positions = {}  # Store active scalping positions
+# ---- Scalping Position Book ----
+POSITIONS_DB = os.environ.get("POSITIONS_DB", "positions.db")  # SQLite WAL file; empty keeps positions in memory only
+POSITION_FLUSH_INTERVAL = 0.1  # Seconds the writer waits so a burst of changes shares one transaction
+LOT_SIZES = {"NIFTY50": 75, "BANKNIFTY": 35, "FINNIFTY": 65, "MIDCAPNIFTY": 140, "SENSEX": 20}  # Units per lot
 
 # ---- Historical Data Storage ----
-# Structure: {index_name: {strike_type_key: deque([(timestamp, volume, oi), ...])}}
+# Structure: {index_name: TieredHistory} for nearest expiries, other expiries are in expiry_histories
 historical_data = {}
-TRACKING_INTERVALS = [1, 2, 5, 10]  # Minutes to track
+TRACKING_INTERVALS = [1, 2, 5, 10, 15, 30, 60, 0]  # Minutes to track, 0 = since day open
+DAY_OPEN = 0
+SAMPLE_INTERVAL = 1  # Seconds between history samples, independent of request rate
+# (seconds per sample, samples kept): 1s for 10 min, 10s for 1 hour, 1 min for a 7 hour session
+# One extra sample per tier so the full span fits between the oldest and newest sample
+HISTORY_TIERS = [(1, 601), (10, 361), (60, 421)]
+HISTORY_KEYS = 256  # Strike/type rows per index (strikecount 50 -> 202 rows)
+sampler_thread = None
+
+# ---- Shared Option Chain Snapshots ----
+# Structure: {chain key: {"version": int, "timestamp": float, "data": data_section, "key": chain key,
+#                          "expiry": expiry timestamp of the contract in data_section, None if unlisted}}
+chain_snapshots = {}
+snapshot_condition = threading.Condition()
+poller_threads = {}
+poll_errors = {}  # Last broker error per index
+POLL_INTERVAL = 1  # Seconds between broker fetches per index
+SNAPSHOT_WAIT = 2  # Seconds after a chain key is first asked for during which requests wait for its first snapshot
+snapshot_waits = {}  # {chain key: monotonic time a request first waited for it}
+STREAM_KEEPALIVE = 15  # Seconds between keepalive comments on idle streams
+stream_clients = {}  # Connected /stream clients per index
+parsed_chains = {}  # {index_name: latest snapshot parsed into typed columns, see parse_chain}
+AGGREGATE_COLUMNS = ["ask", "bid", "ltp", "ltpch", "volume", "oi", "oich", "oichp", "prev_oi"]
+OI_COLUMN = AGGREGATE_COLUMNS.index("oi")
+AGGREGATE_REBUILD = 600  # Versions folded from deltas between full recomputes of the totals
+OI_BAND = (0.25, 0.75)  # Cumulative OI shares bounding the support and resistance bands
+
+# ---- Rendered Chain Frames ----
+# Structure: {(index_name, vol_interval, oi_interval, window): deque([frame, ...])}
+chain_frames = OrderedDict()
+frames_lock = threading.Lock()
+FRAME_HISTORY = 30  # Versions kept per view for cell deltas; older clients get a full frame
+FRAME_SAMPLE_BITS = 32  # View versions are snapshot version << FRAME_SAMPLE_BITS | history samples
+MAX_FRAME_VIEWS = 64  # Least recently used views are dropped beyond this
+frame_locks = {}  # {view: Lock held while the view renders}, so concurrent viewers wait instead of re-rendering
+CELL_SEPARATOR = "\x1f"  # Splits records formatted in one go back into cells; never part of a value
+record_templates = {}  # {(column formats, records): %-template formatting every record of a chain at once}
+
+# ---- Render Cache ----
+# Page shells and polling payloads are rendered once per view and snapshot version and shared by every viewer
+MAX_RENDERED = 256  # Least recently used entries are dropped beyond this
+render_stats = {"hits": 0, "renders": 0}
+
+# ---- HTTP Caching ----
+# Polling endpoints send strong ETags derived from the snapshot version, answer repeat polls
+# with 304 and gzip bodies once per ETag; page shells are cacheable since they carry no data
+SERVER_EPOCH = f"{int(time.time()):x}"  # Prefixes every ETag so versions restarting at 1 never collide
+GZIP_MIN_BYTES = 512  # Smaller bodies go out uncompressed
+GZIP_LEVEL = 6
+SHELL_MAX_AGE = 300  # Seconds browsers may reuse a /chain or /scalping page without asking
+compressed_bodies = OrderedDict()  # {etag: gzipped body}
+compressed_lock = threading.Lock()
+MAX_COMPRESSED_BODIES = 256  # Least recently used bodies are dropped beyond this
+
+# ---- On-disk Tick Archive ----
+# One append-only file per column under ARCHIVE_DIR/<chain key>/<YYYY-MM-DD>/, read back with np.memmap
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")  # Empty disables archiving
+# "expiry" is the contract's expiry timestamp, 0 when unknown (and in days archived before it was recorded)
+ARCHIVE_COLUMNS = [("timestamp", "<f8"), ("expiry", "<i8"), ("strike", "<f8"), ("option_type", "i1"),
+                   ("ltp", "<f4"), ("ltpch", "<f4"), ("bid", "<f4"), ("ask", "<f4"), ("volume", "<i8"),
+                   ("oi", "<i8"), ("oich", "<i8")]
+OPTION_TYPE_CODES = {"CE": 1, "PE": 2}  # 0 marks the underlying's own row
+ARCHIVE_QUEUE_SIZE = 1000  # Snapshots waiting for the writer before new ones are dropped
+archive_queue = queue.Queue(maxsize=ARCHIVE_QUEUE_SIZE)
+archive_thread = None
+archive_stats = {"written": 0, "dropped": 0}
+
+# ---- Metrics ----
+# Structure: {(stage, chain key): [count per bucket..., count above the last bucket]}, plus sums
+METRIC_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]  # Seconds
+stage_counts = {}
+stage_sums = {}
+broker_errors = {}  # Failed broker fetches per chain key
+broker_timeouts = {}  # Broker fetches abandoned after FETCH_TIMEOUT per chain key
+metrics_lock = threading.Lock()
+
+# ---- Tiered Strike Refresh ----
+# The ATM window is fetched every tick and merged over a full chain refreshed less often
+FULL_STRIKECOUNT = 50  # Strikes either side of ATM in a full fetch
+HOT_STRIKECOUNT = 10  # Strikes either side of ATM fetched every tick, covers the widest ATM view
+FULL_REFRESH_INTERVAL = 10  # Seconds between full-chain fetches per index
+strike_caches = {}  # {index_name: StrikeCache}
+
+# ---- Broker Rate Limits ----
+# Fyers allows 10 calls in any second and 200 in any minute; every optionchain call takes a token from each
+BROKER_LIMITS = [(1, 10), (60, 200)]  # (window seconds, calls allowed per window)
+IDLE_POLL_INTERVAL = 10  # Seconds between fetches for indices nobody is watching or trading
+VIEWER_TIMEOUT = 30  # Seconds a page view keeps an index hot; open streams renew it on every keepalive
+SCHEDULER_TICK = 0.05  # Seconds between scheduling passes
+viewer_times = np.zeros(len(symbols_map))  # Last page view per index (epoch seconds), shared across workers
+
+# ---- Expiry Selection ----
+# Every index's nearest expiry is always fetched under the plain index name. Other expiries are chain
+# keys "INDEX@expiry" fetched only while someone views or trades them, each in one of a few slots per
+# index with its own snapshot, strike cache and history.
+EXPIRY_SLOTS = 2  # Other expiries tracked at once per index
+EXPIRY_REFRESH_INTERVAL = 900  # Seconds an index's expiry list is reused before it is re-read
+expiry_lists = {}  # {index_name: (monotonic time listed, [(date label, expiry timestamp), ...])}
+expiry_views = np.zeros((len(symbols_map), EXPIRY_SLOTS, 2))  # [expiry, last view] per slot, shared across workers
+expiry_histories = {}  # {(index_name, slot): TieredHistory}
+
+# ---- Multi-process Serving ----
+# WORKERS > 0 forks one chain fetcher plus that many web workers sharing one listening socket; 0 serves from one process.
+# Snapshots, history, the login token and alerts live in one anonymous shared mapping; positions are in POSITIONS_DB.
+WORKERS = int(os.environ.get("WORKERS", 0))
+SHARED_MEMORY_BYTES = 512 * 1024 * 1024  # Reserved up front; pages are only committed when touched
+SNAPSHOT_BYTES = 4 * 1024 * 1024  # Largest JSON snapshot per index
+SHARED_SYNC_INTERVAL = 0.05  # Seconds between checks for state published by other processes
+serve_role = None  # None for the single-process dev server, else "fetcher" or "worker"
+shared_snapshots = {}  # {index_name or (index_name, expiry slot): SharedBlob}
+shared_token = None
+shared_status = None  # Fetcher's poll errors and fetch stats for the workers
+shared_metrics = []  # One blob per child slot holding that process's counters, summed by /metrics
+metrics_slot = None  # This process's index into shared_metrics
+METRICS_SHARE_INTERVAL = 1  # Seconds between publishes of a process's counters
+shared_alert_rules = None  # Alert rules, edited by any worker and evaluated by the fetcher
+shared_alerts = None  # Recent alerts fired by the fetcher
+shared_sequences = {}  # Last sequence this process read per shared blob
+state_lock = threading.Lock()  # Guards login, alert rules, expiry slot claims and stream client counts; shared by workers
+sync_thread = None
+serve_parent = None  # pid of the serving parent; children exit once it is gone
+PR_SET_PDEATHSIG = 1  # prctl option asking Linux to signal a child when its parent exits
+SHUTDOWN_TIMEOUT = 5  # Seconds children get to exit on SIGTERM before they are killed
+
+# ---- Async Fetch Engine ----
+fyers_async = None  # FyersModel(is_async=True), created at login next to the sync client
+MAX_PARALLEL_FETCHES = 5  # Concurrent optionchain calls in flight
+FETCH_TIMEOUT = 3  # Seconds before a single optionchain call is abandoned
+fetch_stats = {}  # Wall time and finish time of the last all-index refresh
+
+# ---- Tick Data Source ----
+# "async" fetches every index concurrently per tick, "rest" runs one blocking poller per index,
+# "ticks" streams the data socket with periodic REST resyncs
+CHAIN_SOURCE = os.environ.get("CHAIN_SOURCE", "async")
+TICK_SOCKET_ADDRESS = os.environ.get("TICK_SOCKET_ADDRESS")  # host:port of a local JSON tick feed instead of Fyers
+TICK_RESYNC_INTERVAL = 15  # Seconds between REST resyncs per chain key in tick mode, of the ATM window unless a full one is due
+TICK_FULL_RESYNC_INTERVAL = 60  # Seconds between full-chain resyncs per chain key in tick mode
+TICK_PUBLISH_INTERVAL = 0.2  # Seconds between snapshots of tick-patched chains, however busy the socket is
+# Data socket field -> option chain record field
+TICK_FIELDS = {"ltp": "ltp", "vol_traded_today": "volume", "bid_price": "bid", "ask_price": "ask",
+               "OI": "oi", "oi": "oi", "ch": "ltpch"}
+TICK_COLUMNS = ["ltp", "volume", "bid", "ask", "oi", "ltpch", "oich", "oichp"]  # Record fields ticks patch
+TICK_INT_COLUMNS = ("volume", "oi", "oich")
+tick_chains = {}  # {chain key: TickChain}
+tick_symbols = {}  # {strike_symbol: (TickChain, ...)}, the underlying's symbol feeds every chain of its index
+tick_resyncs = {}  # {chain key: monotonic time its next REST resync is due}
+tick_feed = None
+tick_feed_lock = threading.Lock()
+
+# ---- Replay Mode ----
+# Replays an archived session through the normal fetch/render paths instead of the broker
+REPLAY_DAY = os.environ.get("REPLAY_DAY")  # YYYY-MM-DD of an archived session, no login needed
+REPLAY_SPEED = os.environ.get("REPLAY_SPEED", "1")  # "1", "10" or "max"
+REPLAY_STAGES = ("fetch", "history", "render")
+REPLAY_TIMINGS = 1000  # Recent ticks kept per stage for the timing report
+replay_clock = None  # Recorded timestamp the replay has reached
+replay_stats = {}
+
+# ---- Implied Volatility and Greeks ----
+# Solved once per snapshot for every listed CE/PE strike of the nearest expiry
+RISK_FREE_RATE = 0.065  # Annualised, continuously compounded
+EXPIRY_CLOSE = (15, 30)  # IST hour and minute options stop trading on expiry day
+MIN_EXPIRY_SECONDS = 60  # Floor on time to expiry so expiry-day afternoons stay solvable
+YEAR_SECONDS = 365 * 86400
+IV_BOUNDS = (0.005, 5.0)  # Bisection bracket for volatility (0.5% to 500%)
+IV_GUESS = 0.2  # Starting volatility for strikes without a previous solution
+IV_TOLERANCE = 1e-4  # Rupees between model and market price
+IV_STEP_TOLERANCE = 1e-6  # Volatility change below which a Newton step is final
+IV_ITERATIONS = 40  # Each step at least halves the bracket, so this always converges
+implied_vols = {}  # {index_name: (strike values, (CE/PE, strike) IV of the last solve)} for warm starts
+
+# ---- Alert Rules ----
+# Rules like "CE vol Δ(2m) > 50000", "NIFTY50 oi Δ(5m) < -1L" or "BANKNIFTY pcr crosses 1.0",
+# compiled once and evaluated on every history sample; fired alerts are queued for subscribers
+ALERT_COOLDOWN = 60  # Seconds before a rule can fire again for the same strike or index
+ALERT_QUEUE_SIZE = 500  # Recent alerts kept for polling and reconnecting subscribers
+MAX_ALERT_RULES = 500
+ALERT_UNITS = {"": 1, "k": 1e3, "l": 1e5, "cr": 1e7}
+# Comparisons fire when they turn true; crossings need a previous sample on the other side.
+# (sign, inclusive, fires on rise, fires on fall, crossing)
+ALERT_OPERATORS = {
+    ">": (1, False, True, False, False),
+    ">=": (1, True, True, False, False),
+    "<": (-1, False, True, False, False),
+    "<=": (-1, True, True, False, False),
+    "crosses above": (1, True, True, False, True),
+    "crosses below": (1, True, False, True, True),
+    "crosses": (1, True, True, True, True),
+}
+ALERT_RULE_PATTERN = re.compile(
+    r"^\s*(?:(?P<index>" + "|".join(map(re.escape, symbols_map)) + r")\s+)?"
+    r"(?:(?P<strike>\d+(?:\.\d+)?)\s+)?(?:(?P<side>CE|PE)\s+)?"
+    r"(?P<metric>vol(?:ume)?|oi|pcr)\s*(?:(?:Δ|chg|change)\s*\(?\s*(?P<minutes>\d+)\s*m?\s*\)?)?\s*"
+    r"(?P<op>>=|<=|>|<|crosses(?:\s+(?:above|below))?)\s*"
+    r"(?P<value>[-−+]?\d[\d,]*(?:\.\d+)?(?:e[-+]?\d+)?)\s*(?P<unit>k|l|cr)?\s*$",
+    re.IGNORECASE)
+
+def observe_stage(stage, index_name, started):
+    """Record the seconds since `started` (a perf_counter value) in a stage latency histogram"""
+    observe_seconds(stage, index_name, time.perf_counter() - started)
+
+def observe_seconds(stage, index_name, elapsed):
+    # Unknown indices are served NIFTY50 data, and keeping them out bounds the label set.
+    # Other expiries keep their own chain key and are labelled with their expiry.
+    key = (stage, index_name if split_chain_key(index_name)[0] in symbols_map else "NIFTY50")
+    with metrics_lock:
+        counts = stage_counts.get(key)
+        if counts is None:
+            counts = stage_counts[key] = [0] * (len(METRIC_BUCKETS) + 1)
+        counts[bisect.bisect_left(METRIC_BUCKETS, elapsed)] += 1
+        stage_sums[key] = stage_sums.get(key, 0) + elapsed
+
+def record_broker_error(index_name, error, timeout=False):
+    """Remember the last broker error for an index and count it"""
+    poll_errors[index_name] = f"Timed out after {FETCH_TIMEOUT}s" if timeout else str(error)
+    counter = broker_timeouts if timeout else broker_errors
+    with metrics_lock:
+        counter[index_name] = counter.get(index_name, 0) + 1
 
 def format_to_crore(value):
     """Format a number to crore (10 million) units"""
@@ -62,60 +320,2061 @@ def format_to_crore(value):
         return "0.00"
     return f"{value/10000000:.2f} Cr"
 
+def interval_label(minutes):
+    """Short label for a tracking interval"""
+    return "day" if minutes == DAY_OPEN else f"{minutes}m"
+
+def interval_options(selected):
+    """Dropdown options for the tracking intervals"""
+    return "".join(
+        f'<option value="{m}" {"selected" if m == selected else ""}>{"Day open" if m == DAY_OPEN else f"{m} min"}</option>'
+        for m in TRACKING_INTERVALS
+    )
+
 def get_strike_key(strike, option_type):
     """Generate unique key for strike-option combination"""
-    return f"{strike}_{option_type}"
+    return f"{float(strike)}_{option_type}"
 
-def update_historical_data(index_name, strike, option_type, volume, oi):
-    """Store historical volume and OI data"""
-    if index_name not in historical_data:
-        historical_data[index_name] = {}
+class HistoryBuffer:
+    """Columnar ring buffer of volume and OI samples for one index
 
-    key = get_strike_key(strike, option_type)
-    if key not in historical_data[index_name]:
-        historical_data[index_name][key] = deque(maxlen=600)  # Keep 10 minutes at 1sec intervals
+    Rows are strike/type keys and columns are samples, preallocated up front.
+    Each sample is written twice (at slot i and i + capacity) so the newest
+    `capacity` samples are always one contiguous, time-sorted slice that
+    searchsorted can run on without copying.
 
-    # Use Mumbai time instead of local time
-    timestamp = get_mumbai_time().timestamp()
-    historical_data[index_name][key].append((timestamp, volume, oi))
+    All state, including the row of each key, lives in arrays from `allocate`
+    so the buffer can sit in shared memory and be read by other processes.
+    """
 
-def get_change_data(index_name, strike, option_type, minutes):
-    """Calculate volume and OI change over specified minutes"""
-    if index_name not in historical_data:
-        return None, None
+    def __init__(self, capacity, max_keys=HISTORY_KEYS, allocate=None):
+        allocate = allocate or np.empty
+        self.capacity = capacity
+        self.timestamps = allocate(2 * capacity, float)
+        self.volumes = allocate((max_keys, 2 * capacity), float)
+        self.ois = allocate((max_keys, 2 * capacity), float)
+        self.keys = allocate(max_keys, "S32")  # Strike key held by each row, empty when free
+        self.state = allocate(2, np.int64)  # [samples written, row assignment generation]
+        self.state[1] = 0
+        self.cached_rows = (None, {})
+        self.cached_key_rows = (None, None, None)
+        self.clear()
+
+    def clear(self):
+        self.timestamps[:] = 0
+        self.volumes[:] = np.nan
+        self.ois[:] = np.nan
+        self.keys[:] = b""
+        self.state[0] = 0
+        self.state[1] += 1
+
+    @property
+    def count(self):
+        """Samples written so far"""
+        return int(self.state[0])
+
+    @property
+    def rows(self):
+        """Strike key -> row, rebuilt from the key column whenever rows are claimed or freed"""
+        generation = int(self.state[1])
+        if self.cached_rows[0] != generation:
+            self.cached_rows = (generation, {key.decode(): row for row, key in enumerate(self.keys.tolist()) if key})
+        return self.cached_rows[1]
+
+    def key_rows(self, keys):
+        """Row of each key (-1 when unknown), cached for the last key list while rows stay put"""
+        generation = int(self.state[1])
+        cached = self.cached_key_rows
+        if cached[1] != generation or (cached[0] is not keys and cached[0] != keys):
+            known = self.rows
+            cached = self.cached_key_rows = (keys, generation,
+                                             np.array([known.get(key, -1) for key in keys], dtype=np.intp))
+        return cached[2]
+
+    def window(self):
+        """Return the (start, stop) slice holding the samples in time order"""
+        if self.count < self.capacity:
+            return 0, self.count
+        start = self.count % self.capacity
+        return start, start + self.capacity
+
+    def row_for(self, key):
+        """Return the row for a key, claiming a free one for new strikes"""
+        row = self.rows.get(key)
+        if row is None:
+            if len(self.rows) >= self.volumes.shape[0]:
+                self.reclaim_rows()
+                if len(self.rows) >= self.volumes.shape[0]:
+                    return None
+            row = int(np.flatnonzero(self.keys == b"")[0])
+            self.volumes[row] = np.nan
+            self.ois[row] = np.nan
+            self.keys[row] = key.encode()
+            self.state[1] += 1
+        return row
+
+    def reclaim_rows(self):
+        """Free rows of strikes that have no sample left in the window"""
+        start, stop = self.window()
+        stale = np.isnan(self.volumes[:, start:stop]).all(axis=1)
+        self.keys[stale] = b""
+        self.state[1] += 1
+
+    def append(self, timestamp, keys, volumes, ois):
+        """Write one sample for a batch of keys; keys not given become NaN"""
+        known = self.rows
+        rows = [known.get(key) for key in keys]
+        if None in rows:
+            rows = [self.row_for(key) if row is None else row for key, row in zip(keys, rows)]
+        present = np.array([row is not None for row in rows], dtype=bool)
+        rows = np.array([row for row in rows if row is not None], dtype=np.intp)
+        slot = self.count % self.capacity
+        for column in (slot, slot + self.capacity):
+            self.timestamps[column] = timestamp
+            self.volumes[:, column] = np.nan
+            self.ois[:, column] = np.nan
+            self.volumes[rows, column] = np.asarray(volumes, dtype=float)[present]
+            self.ois[rows, column] = np.asarray(ois, dtype=float)[present]
+        self.state[0] += 1
+
+    def samples_at(self, keys, targets):
+        """Volume and OI per key (rows) at the first sample at or after each target time (columns)
+
+        Targets older than the window fall back to the oldest sample and
+        targets past the newest one get the newest. Missing data is NaN.
+        """
+        shape = (len(keys), len(targets))
+        volumes = np.full(shape, np.nan)
+        ois = np.full(shape, np.nan)
+        start, stop = self.window()
+        if stop == start:
+            return volumes, ois
+
+        rows = self.key_rows(keys)
+        known = rows >= 0
+        columns = start + np.minimum(np.searchsorted(self.timestamps[start:stop], targets), stop - start - 1)
+        known_rows = rows[known][:, None]
+        volumes[known] = self.volumes[known_rows, columns]
+        ois[known] = self.ois[known_rows, columns]
+        return volumes, ois
+
+    def changes(self, keys, minutes, now):
+        """Volume and OI change per key (rows) and interval (columns) in one pass"""
+        start, stop = self.window()
+        if stop - start < 2:
+            return np.full((len(keys), len(minutes)), np.nan), np.full((len(keys), len(minutes)), np.nan)
+
+        old_volumes, old_ois = self.samples_at(keys, now - np.asarray(minutes, dtype=float) * 60)
+        new_volumes, new_ois = self.samples_at(keys, [math.inf])
+        return new_volumes - old_volumes, new_ois - old_ois
+
+class TieredHistory:
+    """Multi-resolution history for one index: fine samples plus coarser rollups
+
+    Volume and OI are cumulative for the day, so a rollup only needs the
+    first sample of each coarser bucket. Lookups use the finest tier that
+    spans the requested interval. Everything resets when the trading day
+    changes, so the coarsest tier's oldest sample is the day open, and when
+    the sampled expiry changes.
+
+    Appends bump a sequence number before and after writing (odd while a
+    write is in progress) so readers in other threads or processes can
+    retry instead of seeing half an append.
+    """
 
-    key = get_strike_key(strike, option_type)
-    if key not in historical_data[index_name]:
-        return None, None
+    def __init__(self, tiers=HISTORY_TIERS, max_keys=HISTORY_KEYS, allocate=None):
+        self.tier_specs = tiers
+        self.max_keys = max_keys
+        self.tiers = [(resolution, HistoryBuffer(capacity, max_keys, allocate)) for resolution, capacity in tiers]
+        self.sequence = (allocate or np.empty)(1, np.int64)
+        self.sequence[0] = 0
+        self.expiry = (allocate or np.empty)(1, np.int64)  # Expiry of the contracts sampled, 0 when unknown
+        self.expiry[0] = 0
+        self.day = None
+        self.reset()
+
+    def reset(self):
+        for _, buffer in self.tiers:
+            buffer.clear()
+        self.last_buckets = [None] * len(self.tiers)
+
+    def append(self, timestamp, keys, volumes, ois, expiry=0):
+        day = datetime.fromtimestamp(timestamp, pytz.timezone('Asia/Kolkata')).date()
+        self.sequence[0] += 1
+        try:
+            # A new day or a rollover to other contracts starts over, so deltas never mix expiries
+            if (self.day is not None and day != self.day) or (expiry and self.expiry[0] and expiry != self.expiry[0]):
+                self.reset()
+            self.day = day
+            if expiry:
+                self.expiry[0] = expiry
+
+            for i, (resolution, buffer) in enumerate(self.tiers):
+                bucket = int(timestamp // resolution)
+                if bucket != self.last_buckets[i]:
+                    self.last_buckets[i] = bucket
+                    buffer.append(timestamp, keys, volumes, ois)
+        finally:
+            self.sequence[0] += 1
+
+    def tier_for(self, minutes):
+        """Pick the finest tier whose span covers the interval"""
+        for resolution, buffer in self.tiers:
+            if minutes != DAY_OPEN and resolution * (buffer.capacity - 1) >= minutes * 60:
+                return buffer
+        return self.tiers[-1][1]
+
+    def changes(self, keys, minutes, now, current=None):
+        """Volume and OI change per key and interval, retried if an append lands mid-read"""
+        while True:
+            sequence = int(self.sequence[0])
+            if sequence % 2 == 0:
+                result = self.read_changes(keys, minutes, now, current)
+                if int(self.sequence[0]) == sequence:
+                    return result
+            time.sleep(0)
+
+    def read_changes(self, keys, minutes, now, current=None):
+        """Volume and OI change per key and interval
+
+        Changes run up to `current`, the (volumes, ois) per key of the snapshot
+        being shown, or else up to the newest sample in the finest tier.
+        """
+        vol_changes = np.full((len(keys), len(minutes)), np.nan)
+        oi_changes = np.full((len(keys), len(minutes)), np.nan)
+        finest = self.tiers[0][1]
+        start, stop = finest.window()
+        if stop - start < (2 if current is None else 1):
+            return vol_changes, oi_changes
+
+        if current is None:
+            new_volumes, new_ois = finest.samples_at(keys, [math.inf])
+        else:
+            new_volumes, new_ois = (np.asarray(values, dtype=float)[:, None] for values in current)
+        tiers = [self.tier_for(m) for m in minutes]
+        for buffer in set(tiers):
+            columns = [i for i, tier in enumerate(tiers) if tier is buffer]
+            targets = [-math.inf if minutes[i] == DAY_OPEN else now - minutes[i] * 60 for i in columns]
+            old_volumes, old_ois = buffer.samples_at(keys, targets)
+            vol_changes[:, columns] = new_volumes - old_volumes
+            oi_changes[:, columns] = new_ois - old_ois
+        return vol_changes, oi_changes
+
+    def nbytes(self):
+        return sum(buffer.timestamps.nbytes + buffer.volumes.nbytes + buffer.ois.nbytes for _, buffer in self.tiers)
+
+def chain_history(key, create=False):
+    """History of a chain key, None when it has none (or its expiry slot moved on to another expiry)"""
+    index_name, expiry = split_chain_key(key)
+    if expiry is None:
+        if create and index_name not in historical_data:
+            historical_data[index_name] = TieredHistory()
+        return historical_data.get(index_name)
+
+    slot = expiry_slot(index_name, expiry)
+    if slot is None:
+        return None
+    history = expiry_histories.get((index_name, slot))
+    if history is None and create:
+        history = expiry_histories[(index_name, slot)] = TieredHistory()
+    # A reused slot still holds the previous expiry's samples until its first append
+    if history is None or (not create and history.expiry[0] != int(expiry)):
+        return None
+    return history
+
+def update_historical_data(index_name, keys, volumes, ois, timestamp=None, expiry=0):
+    """Store one historical volume and OI sample for a batch of strike keys of a chain key"""
+    history = chain_history(index_name, create=True)
+    if history is None:
+        return
 
-    data_queue = historical_data[index_name][key]
-    if len(data_queue) < 2:
-        return None, None
+    # Use Mumbai time instead of local time
+    if timestamp is None:
+        timestamp = get_mumbai_time().timestamp()
+    history.append(timestamp, keys, volumes, ois, int(split_chain_key(index_name)[1] or expiry))
+
+def chain_history_arrays(data_section):
+    """Extract strike keys, volumes and OI from a raw chain snapshot"""
+    keys, volumes, ois = [], [], []
+    for record in data_section.get("optionsChain") or data_section.get("options_chain") or []:
+        option_type = record.get("option_type")
+        if option_type not in ("CE", "PE") or record.get("strike_price") is None:
+            continue
+        keys.append(get_strike_key(record["strike_price"], option_type))
+        volumes.append(record.get("volume") or 0)
+        ois.append(record.get("oi") or 0)
+    return keys, np.array(volumes, dtype=float), np.array(ois, dtype=float)
+
+class TickArchive:
+    """Append-only, fixed-width column files holding every snapshot of one chain key for one day
+
+    Each row is one strike/type record of one snapshot. Readers map the
+    files with np.memmap and only trust the shortest column, so a reader
+    never sees a half-written row and nothing is copied into Python objects.
+    A column missing from an older day reads as zeros.
+    """
+
+    def __init__(self, key, day, root=None):
+        self.path = os.path.join(root or ARCHIVE_DIR, key, day.isoformat())
+        self.files = {}
+
+    def align(self):
+        """Cut every column to the complete rows and zero-fill columns the day's files lack, before appending"""
+        rows = self.rows()
+        for name, dtype in ARCHIVE_COLUMNS:
+            with open(os.path.join(self.path, f"{name}.bin"), "ab") as handle:
+                handle.truncate(rows * np.dtype(dtype).itemsize)
+
+    def append(self, columns):
+        """Append one batch of rows, given as {column: array}"""
+        os.makedirs(self.path, exist_ok=True)
+        if not self.files:
+            self.align()
+        for name, dtype in ARCHIVE_COLUMNS:
+            handle = self.files.get(name)
+            if handle is None:
+                handle = self.files[name] = open(os.path.join(self.path, f"{name}.bin"), "ab")
+            handle.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+        for handle in self.files.values():
+            handle.flush()
+
+    def rows(self):
+        """Number of complete rows on disk"""
+        counts = []
+        for name, dtype in ARCHIVE_COLUMNS:
+            path = os.path.join(self.path, f"{name}.bin")
+            if os.path.exists(path):
+                counts.append(os.path.getsize(path) // np.dtype(dtype).itemsize)
+        return min(counts) if counts else 0
+
+    def read(self, start=None, end=None):
+        """Memory-mapped columns for rows with start <= timestamp < end, None when empty"""
+        rows = self.rows()
+        if rows == 0:
+            return None
+        columns = {}
+        for name, dtype in ARCHIVE_COLUMNS:
+            path = os.path.join(self.path, f"{name}.bin")
+            if os.path.exists(path):
+                columns[name] = np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+            else:
+                columns[name] = np.zeros(rows, dtype=dtype)
+        timestamps = columns["timestamp"]
+        first = 0 if start is None else np.searchsorted(timestamps, start)
+        last = rows if end is None else np.searchsorted(timestamps, end)
+        return {name: values[first:last] for name, values in columns.items()}
+
+    def close(self):
+        for handle in self.files.values():
+            handle.close()
+        self.files = {}
+
+def archive_day(timestamp):
+    return datetime.fromtimestamp(timestamp, pytz.timezone('Asia/Kolkata')).date()
+
+def chain_archive_columns(timestamp, data_section, expiry=None):
+    """Flatten a raw chain snapshot of the contract expiring at `expiry` into archive columns, one row per record"""
+    records = [
+        record for record in data_section.get("optionsChain") or data_section.get("options_chain") or []
+        if record.get("strike_price") is not None
+    ]
+    columns = {
+        "timestamp": np.full(len(records), timestamp),
+        "expiry": np.full(len(records), int(expiry or 0), dtype=np.int64),
+        "strike": np.array([record["strike_price"] for record in records], dtype=float),
+        "option_type": np.array([OPTION_TYPE_CODES.get(record.get("option_type"), 0) for record in records],
+                                dtype=np.int8),
+    }
+    for name, dtype in ARCHIVE_COLUMNS[4:]:
+        columns[name] = np.array([record.get(name) or 0 for record in records], dtype=dtype)
+    return columns
+
+def archive_snapshot(key, timestamp, data_section, expiry=None):
+    """Queue a chain key's snapshot for the archive writer without blocking the caller"""
+    if not ARCHIVE_DIR or replay_clock is not None:
+        return
+    try:
+        archive_queue.put_nowait((key, timestamp, data_section, expiry))
+    except queue.Full:
+        archive_stats["dropped"] += 1
+
+def write_archive():
+    """Drain queued snapshots into today's archive files for each chain key"""
+    archives = {}  # (chain key, day) -> TickArchive
+    while True:
+        key, timestamp, data_section, expiry = archive_queue.get()
+        try:
+            day = archive_day(timestamp)
+            if (key, day) not in archives:
+                # Files of other days, and of expiries no longer fetched once the day turns, are closed
+                for old_key in [k for k in archives if k[0] == key or k[1] != day]:
+                    archives.pop(old_key).close()
+                archives[key, day] = TickArchive(key, day)
+            archives[key, day].append(chain_archive_columns(timestamp, data_section, expiry))
+            archive_stats["written"] += 1
+        except Exception:
+            traceback.print_exc()
+
+def read_archive(key, day=None, start=None, end=None):
+    """Zero-copy columns of a chain key's archived snapshots for a day (today by default)"""
+    day = day or get_mumbai_time().date()
+    return TickArchive(key, day).read(start, end)
+
+def archived_expiry_keys(index_name, day):
+    """Chain keys of the index's other expiries archived on a day, "INDEX@expiry" by expiry"""
+    if not ARCHIVE_DIR or not os.path.isdir(ARCHIVE_DIR):
+        return []
+    keys = [name for name in os.listdir(ARCHIVE_DIR) if split_chain_key(name)[0] == index_name
+            and split_chain_key(name)[1] and os.path.isdir(os.path.join(ARCHIVE_DIR, name, day.isoformat()))]
+    return sorted(keys, key=lambda key: int(split_chain_key(key)[1]))
+
+def restore_history(index_name):
+    """Rebuild today's volume/OI history for an index from its archive after a restart"""
+    columns = read_archive(index_name)
+    if columns is None:
+        return 0
+
+    options = columns["option_type"] != 0
+    timestamps = columns["timestamp"][options]
+    if len(timestamps) == 0:
+        return 0
+    starts = np.flatnonzero(np.diff(timestamps, prepend=-math.inf) > 0)
+    stops = np.append(starts[1:], len(timestamps))
+    sample_times = timestamps[starts]
+
+    # Only the first snapshot of each bucket still inside a tier's span ends up in the history
+    keep = np.zeros(len(starts), dtype=bool)
+    for resolution, capacity in HISTORY_TIERS:
+        buckets = np.floor(sample_times / resolution)
+        first = np.diff(buckets, prepend=-math.inf) > 0
+        keep |= first & (buckets > buckets[-1] - capacity)
+
+    strikes = columns["strike"][options]
+    option_types = np.where(columns["option_type"][options] == OPTION_TYPE_CODES["CE"], "CE", "PE")
+    volumes = columns["volume"][options]
+    ois = columns["oi"][options]
+    expiries = columns["expiry"][options]
+    for start, stop in zip(starts[keep], stops[keep]):
+        keys = [get_strike_key(strike, option_type)
+                for strike, option_type in zip(strikes[start:stop].tolist(), option_types[start:stop])]
+        # Tagged with its expiry, so a rollover during the day starts over and the next live sample carries on
+        update_historical_data(index_name, keys, volumes[start:stop], ois[start:stop], timestamps[start],
+                               int(expiries[start]))
+    return int(keep.sum())
+
+def frame_version(key, snapshot):
+    """Version of everything a view of a chain key shows: its snapshot and the history samples its changes read
+
+    Changes move when a sample lands even if the snapshot is unchanged. Both
+    parts only grow and are the same in every worker, so the combined integer
+    orders a view's frames and names them to clients.
+    """
+    if snapshot is None:
+        return 0
+    history = chain_history(key)
+    samples = int(history.sequence[0]) // 2 if history is not None else 0
+    return (snapshot["version"] << FRAME_SAMPLE_BITS) | samples
+
+def get_change_matrix(index_name, keys, minutes, current=None):
+    """Calculate volume and OI change for many strike keys over many intervals
+
+    `current` is the (volumes, ois) per key of the snapshot being rendered. The
+    sampler runs on its own cadence, so without it the changes end at the last
+    sample and lag the snapshot on screen.
+    """
+    shape = (len(keys), len(minutes))
+    history = chain_history(index_name)
+    if history is None:
+        return np.full(shape, np.nan), np.full(shape, np.nan)
 
     # Use Mumbai time instead of local time
     current_time = get_mumbai_time().timestamp()
-    target_time = current_time - (minutes * 60)
+    return history.changes(keys, minutes, current_time, current)
 
-    # Get most recent data
-    current_timestamp, current_volume, current_oi = data_queue[-1]
+def listed_expiries(data_section):
+    """[(date label, expiry timestamp string)] listed in a data section, nearest first"""
+    expiries = []
+    for item in data_section.get("expiryData") or []:
+        try:
+            expiries.append((item.get("date", ""), str(int(float(item["expiry"])))))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return sorted(expiries, key=lambda expiry: int(expiry[1]))
 
-    # Find data point closest to target time
-    old_data = None
-    for timestamp, volume, oi in data_queue:
-        if timestamp >= target_time:
-            old_data = (timestamp, volume, oi)
-            break
+def get_expiries(index_name):
+    """Listed expiries of an index, read from its nearest-expiry snapshot and reused for EXPIRY_REFRESH_INTERVAL
+
+    Every nearest-expiry fetch carries the list, so it never costs a broker call.
+    The list is re-read at once when the index rolls over to its next expiry.
+    """
+    cached = expiry_lists.get(index_name)
+    now = time.monotonic()
+    snapshot = chain_snapshots.get(index_name)
+    if (cached is not None and cached[1] and now - cached[0] < EXPIRY_REFRESH_INTERVAL
+            and (snapshot is None or cached[1][0][1] == snapshot.get("expiry"))):
+        return cached[1]
+    if snapshot is None:
+        return cached[1] if cached is not None else []
+    expiries = listed_expiries(snapshot["data"])
+    expiry_lists[index_name] = (now, expiries)
+    return expiries
+
+def chain_index(index_name):
+    """Index of an index name or chain key, NIFTY50 for unknown indices as get_snapshot serves them"""
+    index_name = split_chain_key(index_name)[0]
+    return index_name if index_name in symbols_map else "NIFTY50"
+
+def chain_key(index_name, expiry=None):
+    """Chain key of an index and expiry: the index name for its nearest expiry, else "INDEX@expiry"
+
+    Unknown indices fall back to NIFTY50, unlisted expiries to the nearest one,
+    and asking for the nearest expiry by timestamp gives the plain index name so
+    it is never fetched twice. A chain key passed as the index is normalized the
+    same way, so request input never names a key that is not fetched.
+    Chain keys are accepted everywhere an index name is.
+    """
+    expiry = expiry or split_chain_key(index_name)[1]
+    index_name = chain_index(index_name)
+    if not expiry:
+        return index_name
+    listed = [timestamp for _, timestamp in get_expiries(index_name)]
+    if expiry not in listed[1:]:
+        return index_name
+    return f"{index_name}@{expiry}"
+
+def split_chain_key(key):
+    """(index_name, expiry timestamp string or None for the nearest expiry) of a chain key"""
+    index_name, _, expiry = key.partition("@")
+    return index_name, expiry or None
+
+def chain_expiry(key, data_section):
+    """Expiry timestamp of the contract a chain key fetched, the nearest one listed in the fetch for plain keys"""
+    expiry = split_chain_key(key)[1]
+    if expiry is None:
+        listed = listed_expiries(data_section)
+        expiry = listed[0][1] if listed else None
+    return expiry
+
+def position_contract(key):
+    """(index_name, expiry timestamp) of the contract a chain key's latest snapshot holds
+
+    Positions are kept by contract, so a plain index's positions stay with
+    their expiry when the index rolls over to the next one.
+    """
+    index_name, expiry = split_chain_key(key)
+    if expiry is None:
+        snapshot = chain_snapshots.get(index_name)
+        expiry = snapshot.get("expiry") if snapshot is not None else None
+    return chain_index(index_name), expiry
+
+def chain_request(symbol, strikecount=FULL_STRIKECOUNT, expiry=None):
+    """Request parameters for an option chain fetch, of the nearest expiry unless one is given"""
+    request = {"symbol": symbol, "strikecount": strikecount}
+    if expiry:
+        request["timestamp"] = expiry
+    return request
+
+def fetched_key(symbol, expiry=None):
+    """Chain key a fetch of `symbol` and `expiry` is published under, without re-listing expiries"""
+    index_name = symbol_indexes.get(symbol, symbol)
+    return f"{index_name}@{expiry}" if expiry else index_name
+
+def fetch_chain_data(symbol, strikecount=FULL_STRIKECOUNT, expiry=None):
+    """Fetch the option chain data section for a symbol from the broker"""
+    started = time.perf_counter()
+    response = fyers.optionchain(data=chain_request(symbol, strikecount, expiry))
+    observe_stage("fetch", fetched_key(symbol, expiry), started)
+    return response.get("data", {}) if isinstance(response, dict) else {}
+
+def publish_snapshot(index_name, data_section):
+    """Store a fetched chain as the latest snapshot and wake up waiting readers"""
+    timestamp = get_mumbai_time().timestamp()
+    with snapshot_condition:
+        previous = chain_snapshots.get(index_name)
+        if previous is not None and previous["data"] == data_section:
+            # Nothing changed, keep the version so readers can skip re-rendering
+            previous["timestamp"] = timestamp
+            snapshot = previous
+        else:
+            version = previous["version"] + 1 if previous is not None else 1
+            snapshot = chain_snapshots[index_name] = {"version": version, "timestamp": timestamp, "data": data_section,
+                                                      "key": index_name, "expiry": chain_expiry(index_name, data_section)}
+            snapshot_condition.notify_all()
+    blob = snapshot_blob(index_name)
+    if blob is not None:
+        blob.write(json.dumps(snapshot).encode())
+    return snapshot["version"]
+
+def snapshot_blob(key):
+    """Shared blob carrying a chain key's snapshots to the workers, None when not serving with workers"""
+    index_name, expiry = split_chain_key(key)
+    if expiry is None:
+        return shared_snapshots.get(index_name)
+    slot = expiry_slot(index_name, expiry)
+    return shared_snapshots.get((index_name, slot)) if slot is not None else None
+
+class TokenBucket:
+    """Refilling token bucket that never allows more than `calls` takes in any `window` seconds"""
+
+    def __init__(self, window, calls):
+        self.window = window
+        # Burst plus refill over one window adds up to the limit exactly
+        self.capacity = max(1, calls // 10)
+        self.rate = (calls - self.capacity) / window
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class BrokerScheduler:
+    """Hands out broker calls within the rate limits, most valuable indices first
+
+    Indices with open positions come first, then indices someone is viewing;
+    both refresh every POLL_INTERVAL while idle ones drop to
+    IDLE_POLL_INTERVAL. The time an index waits past its due time for a
+    token is its queueing delay.
+    """
+
+    def __init__(self, limits=BROKER_LIMITS):
+        self.buckets = [TokenBucket(window, calls) for window, calls in limits]
+        self.last_fetch = {}  # index_name -> monotonic time of the last granted call
+        self.queue_delays = {}  # index_name -> queueing delay of the last granted call
+        self.lock = threading.Lock()
+
+    def take(self, now, reserve=0):
+        """Take one token from every bucket, or none if any bucket would drop below `reserve`"""
+        for bucket in self.buckets:
+            bucket.refill(now)
+        if any(bucket.tokens < 1 + reserve for bucket in self.buckets):
+            return False
+        for bucket in self.buckets:
+            bucket.tokens -= 1
+        return True
+
+    def priority(self, index_name):
+        if position_book.has_open(position_contract(index_name)):
+            return 2
+        if time.time() - view_time(index_name) < VIEWER_TIMEOUT:
+            return 1
+        return 0
+
+    def next_batch(self, index_names=None):
+        """Due chain keys (fetch_targets() by default) that got a token, hottest and most overdue first"""
+        position_book.sync()
+        now = time.monotonic()
+        # Hold back tokens for hotter indices that fall due before the next token arrives
+        horizon = now + 1 / min(bucket.rate for bucket in self.buckets)
+        with self.lock:
+            due, upcoming = [], []
+            for index_name in fetch_targets() if index_names is None else index_names:
+                priority = self.priority(index_name)
+                due_at = self.last_fetch.get(index_name, now) + (POLL_INTERVAL if priority else IDLE_POLL_INTERVAL)
+                if index_name not in self.last_fetch or now >= due_at:
+                    due.append((-priority, due_at, index_name))
+                elif due_at < horizon:
+                    upcoming.append(priority)
+
+            batch = []
+            for negative_priority, due_at, index_name in sorted(due):
+                reserve = sum(1 for priority in upcoming if priority > -negative_priority)
+                if not self.take(now, reserve):
+                    break
+                delay = max(0.0, now - due_at)
+                self.last_fetch[index_name] = now
+                self.queue_delays[index_name] = delay
+                observe_seconds("queue", index_name, delay)
+                batch.append(index_name)
+            return batch
+
+    def wait_turn(self, index_name):
+        """Block a per-index poller until its index is due and a token is free"""
+        while not self.next_batch([index_name]):
+            time.sleep(SCHEDULER_TICK)
+
+broker_scheduler = BrokerScheduler()
+
+def note_view(index_name):
+    """Mark an index or chain key as watched so the scheduler keeps it at full refresh rate"""
+    index_name, expiry = split_chain_key(index_name)
+    if index_name in symbols_map:
+        position = list(symbols_map).index(index_name)
+        viewer_times[position] = time.time()
+        slot = expiry_slot(index_name, expiry, claim=True) if expiry is not None else None
+        if slot is not None:
+            expiry_views[position, slot, 1] = time.time()
+
+def view_time(key):
+    """Last page view (epoch seconds) of a chain key, 0 if it never had one"""
+    index_name, expiry = split_chain_key(key)
+    if index_name not in symbols_map:
+        return 0
+    position = list(symbols_map).index(index_name)
+    if expiry is None:
+        return viewer_times[position]
+    slot = expiry_slot(index_name, expiry)
+    return expiry_views[position, slot, 1] if slot is not None else 0
+
+def expiry_slot(index_name, expiry, claim=False):
+    """Slot tracking an expiry of an index, or None; `claim` takes the least recently viewed slot for it
+
+    Slots whose expiry has open positions are only taken when every slot has some.
+    """
+    slots = expiry_views[list(symbols_map).index(index_name)]
+    matches = np.flatnonzero(slots[:, 0] == int(expiry))
+    if len(matches) or not claim:
+        return int(matches[0]) if len(matches) else None
+    with state_lock:
+        matches = np.flatnonzero(slots[:, 0] == int(expiry))
+        if len(matches):
+            return int(matches[0])
+        held = [bool(slots[slot, 0]) and position_book.has_open((index_name, str(int(slots[slot, 0]))))
+                for slot in range(EXPIRY_SLOTS)]
+        slot = min(range(EXPIRY_SLOTS), key=lambda slot: (held[slot], slots[slot, 1]))
+        slots[slot] = (int(expiry), 0)
+        return slot
+
+def fetch_targets():
+    """Chain keys to fetch: every index's nearest expiry plus the other expiries being viewed or traded
+
+    An expiry that has become the nearest one is fetched under the plain index name only.
+    """
+    keys = list(symbols_map)
+    now = time.time()
+    for index_name, slots in zip(symbols_map, expiry_views.tolist()):
+        nearest = position_contract(index_name)[1]
+        for expiry, viewed in slots:
+            expiry = str(int(expiry))
+            if expiry != "0" and expiry != nearest and (
+                    now - viewed < VIEWER_TIMEOUT or position_book.has_open((index_name, expiry))):
+                keys.append(f"{index_name}@{expiry}")
+    return keys
+
+class StrikeCache:
+    """Full option chain of one index, kept current by two refresh tiers
+
+    Most ticks fetch only the ATM window (the broker recentres it on spot)
+    and every `full_interval` seconds the whole chain is fetched.
+    Each fetch is merged over the last full one, so full-chain views and
+    analytics always see every strike, with outer strikes at most one full
+    refresh old.
+    """
+
+    def __init__(self, full_interval=FULL_REFRESH_INTERVAL):
+        self.full_interval = full_interval
+        self.records = {}  # (strike, option_type) -> latest record
+        self.full_at = None  # monotonic time of the last full fetch
+
+    def next_strikecount(self, now):
+        if self.full_at is None or now - self.full_at >= self.full_interval:
+            return FULL_STRIKECOUNT
+        return HOT_STRIKECOUNT
 
-    if old_data is None:
-        # Use oldest available data if not enough history
-        old_data = data_queue[0]
+    def patch(self, records):
+        """Fold records updated since their fetch (by ticks) into the cache, so the next merge keeps them"""
+        for record in records:
+            if record.get("option_type") in ("CE", "PE") and record.get("strike_price") is not None:
+                self.records[(float(record["strike_price"]), record["option_type"])] = record
 
-    old_timestamp, old_volume, old_oi = old_data
+    def merge(self, data_section, strikecount, now):
+        """Fold a fetch into the cache and return the merged data section to publish"""
+        options_data = data_section.get("optionsChain") or data_section.get("options_chain") or []
+        if not options_data:
+            return data_section
+        if strikecount >= FULL_STRIKECOUNT:
+            # Strikes that left the full range are dropped along with the old full fetch
+            self.records = {}
+            self.full_at = now
+
+        underlying = []
+        for record in options_data:
+            if record.get("option_type") in ("CE", "PE") and record.get("strike_price") is not None:
+                self.records[(float(record["strike_price"]), record["option_type"])] = record
+            else:
+                underlying.append(record)
+        merged = {key: value for key, value in data_section.items() if key != "options_chain"}
+        merged["optionsChain"] = underlying + [self.records[key] for key in sorted(self.records)]
+        return merged
+
+def refresh_chain(index_name, fetch):
+    """Fetch the tier that is due for an index with `fetch(strikecount)` and return the merged chain"""
+    cache = strike_caches.setdefault(index_name, StrikeCache())
+    now = time.monotonic()
+    strikecount = cache.next_strikecount(now)
+    return cache.merge(fetch(strikecount), strikecount, now)
+
+def poll_option_chain(index_name, symbol):
+    """Fetch one index's chains (nearest expiry plus any selected ones) per tick for every viewer to share"""
+    while True:
+        if fyers is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+        batch = broker_scheduler.next_batch([key for key in fetch_targets() if split_chain_key(key)[0] == index_name])
+        if not batch:
+            time.sleep(SCHEDULER_TICK)
+            continue
+        for key in batch:
+            expiry = split_chain_key(key)[1]
+            try:
+                data_section = refresh_chain(key, lambda strikecount: fetch_chain_data(symbol, strikecount, expiry))
+                publish_snapshot(key, data_section)
+                poll_errors.pop(key, None)
+            except Exception as e:
+                record_broker_error(key, e)
+                traceback.print_exc()
+
+class TickChain:
+    """In-memory option chain of one chain key, patched in place by ticks
+
+    Ticks write into typed columns (one row per record) and only mark their
+    row, so a tick costs the same however large the chain is. flush() turns
+    the marked rows into new records and publishes one snapshot for all the
+    ticks since the last one; published records are never mutated.
+    """
 
-    volume_change = current_volume - old_volume
-    oi_change = current_oi - old_oi
+    def __init__(self, key):
+        self.key = key
+        self.data_section = {}
+        self.records = []
+        self.positions = {}  # strike symbol -> position in records
+        self.values = np.empty((0, len(TICK_COLUMNS)))  # TICK_COLUMNS per record, NaN when absent
+        self.prev_ois = np.empty(0)
+        self.dirty = np.zeros(0, dtype=bool)  # Rows patched since the last flush
+        self.lock = threading.Lock()
+
+    def resync(self, fetch):
+        """Re-read the chain with `fetch(strikecount)`, the ATM window or the full chain as its StrikeCache decides
+
+        Tick updates of strikes a window fetch leaves out are kept. Returns
+        (symbols added, symbols dropped) so the caller can route the socket.
+        """
+        cache = strike_caches.setdefault(self.key, StrikeCache(TICK_FULL_RESYNC_INTERVAL))
+        now = time.monotonic()
+        strikecount = cache.next_strikecount(now)
+        fetched = fetch(strikecount)
+        with self.lock:
+            self.flush_rows()
+            cache.patch(self.records)
+            data_section = cache.merge(fetched, strikecount, now)
+            records = data_section.get("optionsChain") or data_section.get("options_chain") or []
+            previous = set(self.positions)
+            self.data_section, self.records = data_section, list(records)
+            self.positions = {record["symbol"]: i for i, record in enumerate(records) if record.get("symbol")}
+            self.values = np.array([[record.get(field) for field in TICK_COLUMNS] for record in records],
+                                   dtype=float).reshape(len(records), len(TICK_COLUMNS))
+            self.prev_ois = np.array([record.get("prev_oi") or 0 for record in records], dtype=float)
+            self.dirty = np.zeros(len(records), dtype=bool)
+            publish_snapshot(self.key, data_section)
+        return set(self.positions) - previous, previous - set(self.positions)
+
+    def apply_tick(self, message):
+        """Apply one LTP/volume/OI update to the live columns; flush() publishes it"""
+        updates = [(TICK_COLUMNS.index(field), message[key]) for key, field in TICK_FIELDS.items()
+                   if message.get(key) is not None]
+        if not updates:
+            return False
+
+        with self.lock:
+            position = self.positions.get(message.get("symbol"))
+            if position is None:
+                return False
+            row = self.values[position]
+            for column, value in updates:
+                row[column] = value
+            prev_oi = self.prev_ois[position]
+            if prev_oi and any(column == TICK_COLUMNS.index("oi") for column, _ in updates):
+                oich = row[TICK_COLUMNS.index("oi")] - prev_oi
+                row[TICK_COLUMNS.index("oich")] = oich
+                row[TICK_COLUMNS.index("oichp")] = round(oich / prev_oi * 100, 2)
+            self.dirty[position] = True
+        return True
+
+    def flush_rows(self):
+        """Copy the patched rows into fresh records and a fresh data section; hold the lock"""
+        rows = np.flatnonzero(self.dirty)
+        if not len(rows):
+            return False
+        self.dirty[rows] = False
+        records = list(self.records)
+        for position, values in zip(rows.tolist(), self.values[rows].tolist()):
+            record = dict(records[position])
+            for field, value in zip(TICK_COLUMNS, values):
+                if value == value:
+                    record[field] = int(value) if field in TICK_INT_COLUMNS else value
+            records[position] = record
+        self.records = records
+        self.data_section = dict(self.data_section, optionsChain=records)
+        return True
+
+    def flush(self):
+        """Publish the ticks applied since the last flush as one snapshot"""
+        with self.lock:
+            if self.flush_rows():
+                publish_snapshot(self.key, self.data_section)
+
+class FyersTickSocket:
+    """Tick feed backed by the fyers_apiv3 market data socket"""
+
+    def __init__(self, access_token, on_tick):
+        self.socket = data_ws.FyersDataSocket(
+            access_token=access_token,
+            litemode=False,
+            write_to_file=False,
+            reconnect=True,
+            on_message=on_tick,
+            on_error=lambda message: print(f"Tick socket error: {message}"),
+        )
+        self.socket.connect()
+
+    def subscribe(self, symbols):
+        self.socket.subscribe(symbols=symbols, data_type="SymbolUpdate")
+
+    def unsubscribe(self, symbols):
+        self.socket.unsubscribe(symbols=symbols, data_type="SymbolUpdate")
+
+class LocalTickSocket:
+    """Tick feed reading newline-delimited JSON ticks from a local TCP server
+
+    Used to run tick mode against a fake feed. Subscriptions are sent as
+    {"subscribe": [symbols]} or {"unsubscribe": [symbols]} lines and every
+    received line is one tick dict.
+    """
+
+    def __init__(self, address, on_tick):
+        host, port = address.rsplit(":", 1)
+        self.address = (host, int(port))
+        self.on_tick = on_tick
+        self.symbols = set()
+        self.conn = None
+        self.closed = False
+        self.lock = threading.Lock()
+        threading.Thread(target=self.run, name="local-tick-socket", daemon=True).start()
+
+    def send_subscription(self, symbols, action="subscribe"):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.sendall((json.dumps({action: sorted(symbols)}) + "\n").encode())
+
+    def subscribe(self, symbols):
+        self.symbols.update(symbols)
+        self.send_subscription(symbols)
+
+    def unsubscribe(self, symbols):
+        self.symbols.difference_update(symbols)
+        self.send_subscription(symbols, "unsubscribe")
+
+    def close(self):
+        """Disconnect and stop reconnecting"""
+        with self.lock:
+            self.closed = True
+            if self.conn is not None:
+                self.conn.shutdown(socket.SHUT_RDWR)
+
+    def run(self):
+        while not self.closed:
+            try:
+                with socket.create_connection(self.address) as conn:
+                    with self.lock:
+                        if self.closed:
+                            break
+                        self.conn = conn
+                    self.send_subscription(self.symbols)
+                    for line in conn.makefile("r", encoding="utf-8"):
+                        if line.strip():
+                            self.on_tick(json.loads(line))
+            except Exception:
+                if not self.closed:
+                    traceback.print_exc()
+            with self.lock:
+                self.conn = None
+            time.sleep(1)
+
+def dispatch_tick(message):
+    """Route a data socket message to the chains holding its symbol"""
+    if isinstance(message, dict):
+        for chain in tick_symbols.get(message.get("symbol"), ()):
+            chain.apply_tick(message)
+
+def get_tick_feed():
+    """Open the tick feed once, on first use"""
+    global tick_feed
+    with tick_feed_lock:
+        if tick_feed is None:
+            if TICK_SOCKET_ADDRESS:
+                tick_feed = LocalTickSocket(TICK_SOCKET_ADDRESS, dispatch_tick)
+            else:
+                tick_feed = FyersTickSocket(f"{client_id}:{fyers.token}", dispatch_tick)
+        return tick_feed
+
+def route_ticks(chain, added, dropped):
+    """Route socket symbols a chain gained to it, subscribing new ones, and unsubscribe symbols no chain holds"""
+    subscribe, unsubscribe = [], []
+    # Tuples are replaced, never mutated, so dispatch_tick can read them without a lock
+    for symbol in added:
+        chains = tick_symbols.get(symbol, ())
+        if not chains:
+            subscribe.append(symbol)
+        if chain not in chains:
+            tick_symbols[symbol] = chains + (chain,)
+    for symbol in dropped:
+        chains = tuple(other for other in tick_symbols.get(symbol, ()) if other is not chain)
+        if chains:
+            tick_symbols[symbol] = chains
+        elif tick_symbols.pop(symbol, None) is not None:
+            unsubscribe.append(symbol)
+    if subscribe:
+        get_tick_feed().subscribe(subscribe)
+    if unsubscribe:
+        get_tick_feed().unsubscribe(unsubscribe)
+
+def stream_option_chain(index_name, symbol):
+    """Keep one index's chains (nearest expiry plus any selected ones) live from ticks, resyncing each over REST"""
+    while True:
+        if fyers is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+        keys = [key for key in fetch_targets() if split_chain_key(key)[0] == index_name]
+        # Expiries nobody views or trades any more stop taking ticks
+        for key in [key for key in list(tick_chains) if split_chain_key(key)[0] == index_name and key not in keys]:
+            chain = tick_chains.pop(key)
+            tick_resyncs.pop(key, None)
+            route_ticks(chain, (), list(chain.positions))
+
+        now = time.monotonic()
+        due = [key for key in keys if now >= tick_resyncs.get(key, 0)]
+        for key in broker_scheduler.next_batch(due) if due else []:
+            expiry = split_chain_key(key)[1]
+            chain = tick_chains.setdefault(key, TickChain(key))
+            tick_resyncs[key] = now + TICK_RESYNC_INTERVAL
+            try:
+                route_ticks(chain, *chain.resync(lambda strikecount: fetch_chain_data(symbol, strikecount, expiry)))
+                poll_errors.pop(key, None)
+            except Exception as e:
+                record_broker_error(key, e)
+                traceback.print_exc()
+        time.sleep(SCHEDULER_TICK)
+
+def publish_ticks():
+    """Publish every tick-patched chain at most once per TICK_PUBLISH_INTERVAL"""
+    while True:
+        started = time.monotonic()
+        for chain in list(tick_chains.values()):
+            try:
+                chain.flush()
+            except Exception:
+                traceback.print_exc()
+        time.sleep(max(0, TICK_PUBLISH_INTERVAL - (time.monotonic() - started)))
+
+def compile_alert_rule(text, cooldown=ALERT_COOLDOWN):
+    """Parse one alert rule into a JSON-ready spec, ValueError when it does not read as a rule
+
+    Strike rules compare volume or OI, or their change over N minutes (0 =
+    since day open), for every strike of one index or all of them, optionally
+    narrowed to a strike and side. PCR rules compare the index's OI put-call
+    ratio. Thresholds take k, L and Cr suffixes.
+    """
+    match = ALERT_RULE_PATTERN.match(text or "")
+    if match is None:
+        raise ValueError(f"Cannot read alert rule {text!r}, expected e.g. 'CE vol Δ(2m) > 50000' or 'pcr crosses 1.0'")
+    metric = match["metric"].lower()
+    metric = "volume" if metric.startswith("vol") else metric
+    minutes = int(match["minutes"]) if match["minutes"] is not None else None
+    if metric == "pcr" and (match["strike"] or match["side"] or minutes is not None):
+        raise ValueError("PCR rules apply to a whole index, without strike, side or interval")
+    if minutes is not None and minutes != DAY_OPEN and minutes * 60 > HISTORY_TIERS[-1][0] * (HISTORY_TIERS[-1][1] - 1):
+        raise ValueError(f"Interval {minutes}m is longer than the history kept")
+    value = float(match["value"].replace("−", "-").replace(",", "")) * ALERT_UNITS[(match["unit"] or "").lower()]
+    return {
+        "text": " ".join(text.split()),
+        "index": match["index"].upper() if match["index"] else None,
+        "strike": float(match["strike"]) if match["strike"] else None,
+        "side": match["side"].upper() if match["side"] else None,
+        "metric": metric,
+        "minutes": minutes,
+        "op": " ".join(match["op"].lower().split()),
+        "threshold": value,
+        "cooldown": float(cooldown),
+    }
+
+class AlertEngine:
+    """Alert rules compiled into per-index sorted threshold groups, evaluated on every history sample
+
+    Rules on the same metric, interval, operator and strikes form a group
+    whose thresholds are sorted, so each group costs two searchsorted calls
+    over the sampled strikes per tick, and one history lookup serves every
+    interval in use, however many rules there are. A rule fires when its
+    condition turns true for a strike (or the index), not while it stays
+    true, and then stays quiet for that strike until its cooldown has
+    passed. Fired alerts get increasing sequence numbers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.condition = threading.Condition()  # Notified whenever alerts are queued
+        self.rules = {}  # rule id -> spec from compile_alert_rule
+        self.next_id = 1
+        self.generation = 0  # Bumped on every rule change so compiled arrays are rebuilt
+        self.compiled = {}  # index_name -> (generation, rule groups, change intervals in use)
+        self.layouts = {}  # index_name -> (keys, strikes, option types, PE mask, rows per scope) of the last sample
+        self.index_keys = {}  # index_name -> [index_name], the single row of PCR groups
+        # (index_name, group key) -> (row keys, rule ids, last signed value and threshold count per row,
+        #                             last fired per rule and row)
+        self.states = {}
+        self.alerts = deque(maxlen=ALERT_QUEUE_SIZE)
+        self.sequence = 0
+
+    def add(self, text, cooldown=ALERT_COOLDOWN):
+        rule = compile_alert_rule(text, cooldown)
+        with self.lock:
+            if len(self.rules) >= MAX_ALERT_RULES:
+                raise ValueError(f"At most {MAX_ALERT_RULES} alert rules")
+            rule["id"] = self.next_id
+            self.next_id += 1
+            self.rules[rule["id"]] = rule
+            self.generation += 1
+        return rule
+
+    def remove(self, rule_id):
+        with self.lock:
+            removed = self.rules.pop(rule_id, None)
+            self.generation += 1
+        return removed
+
+    def export(self):
+        with self.lock:
+            return {"next_id": self.next_id, "rules": list(self.rules.values())}
+
+    def load(self, exported):
+        """Replace the rules with ones exported by another process"""
+        with self.lock:
+            self.rules = {rule["id"]: rule for rule in exported["rules"]}
+            self.next_id = exported["next_id"]
+            self.generation += 1
+
+    def compile_index(self, index_name):
+        """Rule groups that apply to an index and the change intervals they use
+
+        Rules comparing the same metric over the same interval with the same
+        operator on the same strikes form one group, see compile_group.
+        """
+        with self.lock:
+            compiled = self.compiled.get(index_name)
+            if compiled is not None and compiled[0] == self.generation:
+                return compiled
+            groups = {}
+            for rule in self.rules.values():
+                if rule["index"] in (None, index_name):
+                    key = (rule["metric"], rule["minutes"], rule["op"], rule.get("side"), rule.get("strike"))
+                    groups.setdefault(key, []).append(rule)
+            minutes = sorted({key[1] for key in groups if key[1] is not None})
+            compiled = self.compiled[index_name] = (
+                self.generation, [self.compile_group(key, rules) for key, rules in groups.items()], minutes)
+            return compiled
+
+    @staticmethod
+    def compile_group(key, rules):
+        """One group's rules sorted by threshold
+
+        "<" compares negated values so every rule is one "signed value >
+        threshold" test, and inclusive thresholds step down to the next float
+        so ">" also covers equality. The rules holding for a value are then
+        the ones below np.searchsorted(thresholds, value).
+        """
+        sign, inclusive, rise, fall, crossing = ALERT_OPERATORS[key[2]]
+        thresholds = sign * np.array([rule["threshold"] for rule in rules], dtype=float)
+        if inclusive:
+            thresholds = np.nextafter(thresholds, -np.inf)
+        order = np.argsort(thresholds, kind="stable")
+        rules = [rules[i] for i in order.tolist()]
+        return {
+            "key": key,
+            "metric": key[0],
+            "minutes": key[1],
+            "side": key[3],
+            "strike": key[4],
+            "sign": sign,
+            "rise": rise,
+            "fall": fall,
+            "crossing": crossing,
+            "rules": rules,
+            "ids": [rule["id"] for rule in rules],
+            "thresholds": thresholds[order],
+            "cooldowns": np.array([rule["cooldown"] for rule in rules], dtype=float),
+        }
+
+    def layout(self, index_name, keys):
+        """PE mask of the sampled keys and a cache of the rows each (side, strike) scope covers
+
+        Rebuilt only when the keys change.
+        """
+        cached = self.layouts.get(index_name)
+        if cached is None or (cached[0] is not keys and cached[0] != keys):
+            parts = [key.rsplit("_", 1) for key in keys]
+            strikes = np.array([float(strike) for strike, _ in parts])
+            types = np.array([option_type for _, option_type in parts])
+            cached = self.layouts[index_name] = (keys, strikes, types, types == "PE", {})
+        return cached
+
+    @staticmethod
+    def scope_rows(layout, group):
+        """(positions or None for every key, keys) of the sampled keys a strike group covers"""
+        keys, strikes, types, _, scopes = layout
+        scope = (group["side"], group["strike"])
+        rows = scopes.get(scope)
+        if rows is None:
+            mask = np.ones(len(keys), dtype=bool)
+            if group["side"] is not None:
+                mask &= types == group["side"]
+            if group["strike"] is not None:
+                mask &= strikes == group["strike"]
+            positions = None if mask.all() else np.flatnonzero(mask)
+            rows = scopes[scope] = (positions, keys if positions is None else [keys[i] for i in positions.tolist()])
+        return rows
+
+    def transitions(self, state_key, keys, group, values, timestamp):
+        """(rules, rows) that fire: the rule's condition turned on (or off, for falling crossings)
+        since the last sample and the rule has not fired for that row within its cooldown
+
+        `values` are signed, one per row, -inf where missing. Each row keeps
+        how many of the sorted thresholds its last value was above; the rules
+        whose condition changed lie between that count and the new one, so a
+        tick costs one searchsorted call per group however many rules it
+        holds, and only the (rule, row) cells that moved are looked at.
+        """
+        thresholds = group["thresholds"]
+        counts = thresholds.searchsorted(values)
+        previous = self.states.get(state_key)
+        fresh = []
+        if previous is not None and (previous[0] is keys or previous[0] == keys) and previous[1] is group["ids"]:
+            before, fired_at = previous[3], previous[4]
+        else:
+            # Rows or rules are new: crossings start from the current side, comparisons from false
+            last = values if group["crossing"] else np.full(len(keys), -np.inf)
+            fired_at = np.full((len(group["ids"]), len(keys)), -np.inf)
+            if previous is not None:
+                previous_rules = {rule: i for i, rule in enumerate(previous[1])}
+                previous_rows = {key: j for j, key in enumerate(previous[0])}
+                rules = np.array([previous_rules.get(rule, -1) for rule in group["ids"]], dtype=np.intp)
+                rows = np.array([previous_rows.get(key, -1) for key in keys], dtype=np.intp)
+                last = np.where(rows >= 0, previous[2][np.maximum(rows, 0)], last)
+                seen = (rules >= 0)[:, None] & (rows >= 0)[None, :]
+                if seen.any():
+                    fired_at = np.where(seen, previous[4][np.ix_(np.maximum(rules, 0), np.maximum(rows, 0))], fired_at)
+                fresh = np.flatnonzero(rules < 0)
+            before = thresholds.searchsorted(last)
+        self.states[state_key] = (keys, group["ids"], values, counts, fired_at)
+
+        changed = counts != before
+        if not len(fresh) and not changed.any():
+            return (), ()
+        # Row j moved past thresholds low[j] .. low[j] + lengths[j] - 1. Flatten those runs into (rule, row)
+        # pairs: a pair's rule is its run's first threshold plus its offset into the run, where the run starts
+        # at starts[j] in the flat list. E.g. lengths [2, 3] and low [4, 0] give rules [4, 5, 0, 1, 2].
+        moved = np.flatnonzero(changed)
+        low = np.minimum(counts, before)[moved]
+        lengths = np.abs(counts - before)[moved]
+        starts = np.cumsum(lengths) - lengths
+        rows = np.repeat(moved, lengths)
+        rules = np.repeat(low, lengths) + np.arange(len(rows)) - np.repeat(starts, lengths)
+        rising = np.repeat(counts[moved] > before[moved], lengths)
+        keep = rising if not group["fall"] else ~rising if not group["rise"] else np.ones(len(rows), dtype=bool)
+        if len(fresh):
+            # New rules take no part in the moves: comparisons fire wherever they hold, crossings wait for one
+            keep &= ~np.isin(rules, fresh)
+            if not group["crossing"]:
+                holding = counts[None, :] > fresh[:, None]
+                fresh_rules, fresh_rows = np.nonzero(holding)
+                rules = np.concatenate([rules[keep], fresh[fresh_rules]])
+                rows = np.concatenate([rows[keep], fresh_rows])
+                keep = np.ones(len(rows), dtype=bool)
+        rules, rows = rules[keep], rows[keep]
+        cooled = timestamp - fired_at[rules, rows] >= group["cooldowns"][rules]
+        rules, rows = rules[cooled], rows[cooled]
+        fired_at[rules, rows] = timestamp
+        return rules.tolist(), rows.tolist()
+
+    def evaluate(self, index_name, keys, volumes, ois, timestamp):
+        """Evaluate every rule that applies to an index against one sample and queue what fires"""
+        _, groups, minutes = self.compile_index(index_name)
+        if not groups:
+            return []
+        layout = self.layout(index_name, keys)
+
+        # One history lookup serves every interval in use
+        metrics = {("volume", None): volumes, ("oi", None): ois}
+        if minutes:
+            history = historical_data.get(index_name)
+            if history is not None:
+                vol_changes, oi_changes = history.changes(keys, minutes, timestamp)
+            else:
+                vol_changes = oi_changes = np.full((len(keys), len(minutes)), np.nan)
+            for j, interval in enumerate(minutes):
+                metrics["volume", interval] = vol_changes[:, j]
+                metrics["oi", interval] = oi_changes[:, j]
+        puts = layout[3]
+        call_oi = ois[~puts].sum()
+        metrics["pcr", None] = np.array([ois[puts].sum() / call_oi if call_oi > 0 else np.nan])
+
+        fired = []
+        signed_metrics = {}
+        for group in groups:
+            if group["metric"] == "pcr":
+                positions, row_keys = None, self.index_keys.setdefault(index_name, [index_name])
+            else:
+                positions, row_keys = self.scope_rows(layout, group)
+            column = (group["metric"], group["minutes"], group["sign"])
+            values = signed_metrics.get(column)
+            if values is None:
+                values = signed_metrics[column] = np.multiply(metrics[column[:2]], group["sign"], dtype=float)
+                values[np.isnan(values)] = -np.inf  # A missing value meets no condition
+            if positions is not None:
+                values = values[positions]
+            rules, rows = self.transitions((index_name, group["key"]), row_keys, group, values, timestamp)
+            if rules:
+                unsigned = (values[rows] * group["sign"]).tolist()
+                fired.extend((group["rules"][rule], None if group["metric"] == "pcr" else row_keys[row], value)
+                             for rule, row, value in zip(rules, rows, unsigned))
+        return self.queue(index_name, fired, timestamp)
+
+    def queue(self, index_name, fired, timestamp):
+        """Queue fired (rule, strike key or None, value) as alerts and wake up subscribers"""
+        if not fired:
+            return []
+        alerts = []
+        clock = datetime.fromtimestamp(timestamp, pytz.timezone('Asia/Kolkata')).strftime("%H:%M:%S")
+        for rule, key, value in fired:
+            strike, option_type = key.rsplit("_", 1) if key else (None, None)
+            alerts.append({
+                "time": clock,
+                "timestamp": timestamp,
+                "index": index_name,
+                "rule": rule["id"],
+                "text": rule["text"],
+                "strike": float(strike) if strike is not None else None,
+                "type": option_type,
+                "value": float(value),
+            })
+        with self.condition:
+            for alert in alerts:
+                self.sequence += 1
+                alert["seq"] = self.sequence
+                self.alerts.append(alert)
+            self.condition.notify_all()
+        return alerts
+
+    def receive(self, alerts):
+        """Queue alerts fired in another process, keeping their sequence numbers"""
+        with self.condition:
+            fresh = [alert for alert in alerts if alert["seq"] > self.sequence]
+            if fresh:
+                self.alerts.extend(fresh)
+                self.sequence = fresh[-1]["seq"]
+                self.condition.notify_all()
+
+    def since(self, sequence, index_name=None):
+        """(latest sequence, queued alerts after `sequence`), optionally for one index"""
+        with self.condition:
+            return self.sequence, [alert for alert in self.alerts
+                                   if alert["seq"] > sequence and index_name in (None, alert["index"])]
+
+alert_engine = AlertEngine()
+
+def sample_snapshots(sampled, timestamp):
+    """Record one volume/OI sample of every index's latest snapshot and evaluate alert rules on it
+
+    New versions of every chain key are archived here too, with the expiry of
+    the contract they hold, so the archive grows at the sampling cadence
+    however often a chain source publishes.
+    """
+    for index_name, snapshot in list(chain_snapshots.items()):
+        try:
+            cached = sampled.get(index_name)
+            if cached is None or cached[0] != snapshot["version"]:
+                if split_chain_key(index_name)[0] in symbols_map:
+                    archive_snapshot(index_name, snapshot["timestamp"], snapshot["data"], snapshot.get("expiry"))
+                # The nearest expiry's history is tagged with its expiry so a rollover starts it over
+                expiries = listed_expiries(snapshot["data"])
+                cached = (snapshot["version"],) + chain_history_arrays(snapshot["data"]) + (
+                    int(expiries[0][1]) if expiries else 0,)
+                sampled[index_name] = cached
+            if cached[1]:
+                update_historical_data(index_name, cached[1], cached[2], cached[3], timestamp, cached[4])
+                if index_name in symbols_map:
+                    alert_engine.evaluate(index_name, cached[1], cached[2], cached[3], timestamp)
+        except Exception:
+            traceback.print_exc()
+
+def sample_history():
+    """Record one volume/OI sample per index per tick at a fixed cadence"""
+    sampled = {}  # chain key -> (version, keys, volumes, ois, expiry)
+    for index_name in symbols_map:
+        try:
+            restore_history(index_name)
+        except Exception:
+            traceback.print_exc()
+    while True:
+        started = time.monotonic()
+        sample_snapshots(sampled, get_mumbai_time().timestamp())
+        time.sleep(max(0, SAMPLE_INTERVAL - (time.monotonic() - started)))
+
+async def fetch_chain_async(symbol, semaphore, strikecount=FULL_STRIKECOUNT, expiry=None):
+    """Fetch one chain with bounded parallelism and a timeout"""
+    async with semaphore:
+        if fyers_async is None:
+            # Sync-only clients run on the default executor so indices still overlap
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(loop.run_in_executor(None, fetch_chain_data, symbol, strikecount, expiry),
+                                          FETCH_TIMEOUT)
+        started = time.perf_counter()
+        response = await asyncio.wait_for(fyers_async.optionchain(data=chain_request(symbol, strikecount, expiry)),
+                                          FETCH_TIMEOUT)
+        observe_stage("fetch", fetched_key(symbol, expiry), started)
+    return response.get("data", {}) if isinstance(response, dict) else {}
+
+async def fetch_all_chains(semaphore, index_names=None):
+    """Fetch a batch of chain keys (fetch_targets() by default) concurrently and publish the results"""
+    index_names = fetch_targets() if index_names is None else index_names
+    started = time.monotonic()
+    caches = [strike_caches.setdefault(index_name, StrikeCache()) for index_name in index_names]
+    strikecounts = [cache.next_strikecount(started) for cache in caches]
+    results = await asyncio.gather(
+        *(fetch_chain_async(symbols_map[split_chain_key(index_name)[0]], semaphore, strikecount,
+                            split_chain_key(index_name)[1])
+          for index_name, strikecount in zip(index_names, strikecounts)),
+        return_exceptions=True
+    )
+    for index_name, cache, strikecount, result in zip(index_names, caches, strikecounts, results):
+        if isinstance(result, asyncio.TimeoutError):
+            record_broker_error(index_name, result, timeout=True)
+        elif isinstance(result, Exception):
+            record_broker_error(index_name, result)
+        else:
+            publish_snapshot(index_name, cache.merge(result, strikecount, started))
+            poll_errors.pop(index_name, None)
+    fetch_stats["wall_ms"] = (time.monotonic() - started) * 1000
+    fetch_stats["finished"] = get_mumbai_time().strftime("%H:%M:%S")
+    fetch_stats["indices"] = len(index_names)
+    fetch_stats["queue_ms"] = max(broker_scheduler.queue_delays.get(i, 0) for i in index_names) * 1000
+
+async def fetch_batch(semaphore, batch, in_flight):
+    try:
+        await fetch_all_chains(semaphore, batch)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        in_flight.difference_update(batch)
+
+async def poll_all_chains():
+    """Fetch whatever the scheduler grants, without waiting for slow batches to finish"""
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_FETCHES)
+    in_flight = set()
+    tasks = set()
+    while True:
+        if fyers is not None:
+            batch = broker_scheduler.next_batch([i for i in fetch_targets() if i not in in_flight])
+            if batch:
+                in_flight.update(batch)
+                task = asyncio.create_task(fetch_batch(semaphore, batch, in_flight))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        await asyncio.sleep(SCHEDULER_TICK)
+
+def run_fetch_engine():
+    """Run the all-index fetch loop on its own asyncio event loop"""
+    asyncio.run(poll_all_chains())
+
+class ReplayFyers:
+    """Stands in for FyersModel, answering optionchain from an archived day at the replay clock
+
+    Each archived chain key answers for its expiry: the plain index for
+    requests without one, "INDEX@expiry" for requests naming that expiry.
+    Responses list the expiries archived that day that have not expired
+    yet, so replayed chains carry an expiry for positions and Greeks.
+    """
+
+    def __init__(self, day):
+        self.day = day
+        self.chains = {}  # (symbol, expiry or None) -> (index_name, archive columns, snapshot start rows, times)
+        self.expiries = {}  # symbol -> expiry timestamps of the index's other archived expiries
+        for index_name, symbol in symbols_map.items():
+            expiry_keys = archived_expiry_keys(index_name, day)
+            self.expiries[symbol] = [int(split_chain_key(key)[1]) for key in expiry_keys]
+            for key in [index_name] + expiry_keys:
+                columns = read_archive(key, day)
+                if columns is None:
+                    continue
+                starts = np.flatnonzero(np.diff(columns["timestamp"], prepend=-math.inf) > 0)
+                times = columns["timestamp"][starts]
+                self.chains[symbol, split_chain_key(key)[1]] = (index_name, columns, starts, times)
+
+    def timeline(self):
+        """Every recorded snapshot time across all indices, in order"""
+        if not self.chains:
+            return np.array([])
+        return np.unique(np.concatenate([times for _, _, _, times in self.chains.values()]))
+
+    def snapshot_rows(self, chain):
+        """Archive rows of a chain's latest snapshot at the replay clock, None before its first one"""
+        _, columns, starts, times = chain
+        position = np.searchsorted(times, get_mumbai_time().timestamp(), side="right") - 1
+        if position < 0:
+            return None
+        stop = starts[position + 1] if position + 1 < len(starts) else len(columns["timestamp"])
+        return {name: values[starts[position]:stop] for name, values in columns.items()}
+
+    def optionchain(self, data=None):
+        symbol, expiry = (data or {}).get("symbol"), (data or {}).get("timestamp")
+        nearest = self.chains.get((symbol, None))
+        nearest_rows = self.snapshot_rows(nearest) if nearest is not None else None
+        current = int(nearest_rows["expiry"][0]) if nearest_rows is not None and len(nearest_rows["expiry"]) else 0
+        # An expiry that has become the nearest one is answered from the plain index's archive
+        chain = nearest if not expiry or int(expiry) == current else self.chains.get((symbol, str(expiry)))
+        if chain is None:
+            return {"code": -1, "s": "error", "message": f"Nothing archived for {self.day}", "data": {}}
+        rows = nearest_rows if chain is nearest else self.snapshot_rows(chain)
+        if rows is None:
+            return {"code": -1, "s": "error", "message": "No snapshot recorded yet", "data": {}}
+        listed = sorted({current} | {other for other in self.expiries.get(symbol, ()) if other > current} - {0})
+        ist = pytz.timezone('Asia/Kolkata')
+        return {"code": 200, "s": "ok", "message": "",
+                "data": {"optionsChain": self.records(chain[0], rows),
+                         "expiryData": [{"date": datetime.fromtimestamp(other, ist).strftime("%d-%m-%Y"),
+                                         "expiry": str(other)} for other in listed]}}
+
+    def records(self, index_name, columns):
+        """Rebuild optionchain records from one snapshot's archive rows"""
+        option_types = {code: option_type for option_type, code in OPTION_TYPE_CODES.items()}
+        prices = {name: np.round(columns[name].astype(float), 2).tolist() for name in ("ltp", "ltpch", "bid", "ask")}
+        records = []
+        for i, (strike, code, volume, oi, oich) in enumerate(zip(
+                columns["strike"].tolist(), columns["option_type"].tolist(), columns["volume"].tolist(),
+                columns["oi"].tolist(), columns["oich"].tolist())):
+            option_type = option_types.get(code, "")
+            symbol = f"{index_name}{strike:g}{option_type}" if option_type else symbols_map[index_name]
+            record = {"symbol": symbol, "strike_price": strike,
+                      "option_type": option_type, "ltp": prices["ltp"][i], "ltpch": prices["ltpch"][i],
+                      "bid": prices["bid"][i], "ask": prices["ask"][i]}
+            if option_type:
+                prev_oi = oi - oich
+                record.update(volume=volume, oi=oi, oich=oich, prev_oi=prev_oi,
+                              oichp=round(oich / prev_oi * 100, 2) if prev_oi else 0)
+            records.append(record)
+        return records
+
+def enable_replay(day, speed=REPLAY_SPEED):
+    """Swap the broker client for an archived session so the pages run without a login"""
+    global fyers
+    fyers = ReplayFyers(datetime.strptime(day, "%Y-%m-%d").date())
+    replay_stats.update(day=day, speed=speed, ticks=0, total=len(fyers.timeline()), finished=False,
+                        stages={stage: deque(maxlen=REPLAY_TIMINGS) for stage in REPLAY_STAGES})
+
+def run_replay():
+    """Step through the recorded session, timing fetch, history and render for every tick"""
+    global replay_clock
+    timeline = fyers.timeline()
+    speed = None if replay_stats["speed"] == "max" else float(replay_stats["speed"])
+    sampled = {}
+    started = time.monotonic()
+    for step in timeline.tolist():
+        if speed:
+            time.sleep(max(0, (step - timeline[0]) / speed - (time.monotonic() - started)))
+        replay_clock = step
+
+        tick_started = time.perf_counter()
+        # Every index's nearest expiry plus the archived expiries being viewed or traded, as the pollers fetch
+        for key in fetch_targets():
+            index_name, expiry = split_chain_key(key)
+            data_section = fetch_chain_data(symbols_map[index_name], FULL_STRIKECOUNT, expiry)
+            if data_section:
+                publish_snapshot(key, data_section)
+        fetched = time.perf_counter()
+        sample_snapshots(sampled, step)
+        sampled_at = time.perf_counter()
+        for index_name in list(chain_snapshots):
+            try:
+                get_chain_frame(index_name, 1, 1)
+                build_scalping_update(index_name, 1, 1)
+            except Exception:
+                traceback.print_exc()
+        rendered = time.perf_counter()
+
+        stages = replay_stats["stages"]
+        stages["fetch"].append((fetched - tick_started) * 1000)
+        stages["history"].append((sampled_at - fetched) * 1000)
+        stages["render"].append((rendered - sampled_at) * 1000)
+        replay_stats["ticks"] += 1
+
+    replay_stats["finished"] = True
+    print(f"Replay of {replay_stats['day']} finished: {replay_stats['ticks']} ticks in "
+          f"{time.monotonic() - started:.1f}s, " +
+          ", ".join(f"{stage} {ms['mean']:.2f} ms" for stage, ms in replay_timings().items()))
+
+def replay_timings():
+    """Mean/p50/p95/max milliseconds per stage over the recent replay ticks"""
+    timings = {}
+    for stage, values in replay_stats.get("stages", {}).items():
+        values = np.array(values)
+        if len(values):
+            timings[stage] = {"mean": values.mean(), "p50": np.percentile(values, 50),
+                              "p95": np.percentile(values, 95), "max": values.max()}
+    return timings
+
+# Pluggable per-index chain sources, selected with CHAIN_SOURCE ("async" runs one engine for all indices)
+CHAIN_SOURCES = {"rest": poll_option_chain, "ticks": stream_option_chain}
+
+def start_pollers():
+    """Start the background chain sources and history sampler (safe to call repeatedly)"""
+    global sampler_thread, archive_thread
+    source = CHAIN_SOURCES.get(CHAIN_SOURCE, poll_option_chain)
+    global sync_thread
+    with snapshot_condition:
+        if serve_role == "worker":
+            # Workers never call the broker; they mirror what the fetcher publishes
+            if sync_thread is None or not sync_thread.is_alive():
+                sync_thread = threading.Thread(target=sync_shared_state, name="shared-sync", daemon=True)
+                sync_thread.start()
+            return
+        if isinstance(fyers, ReplayFyers):
+            # The replay thread fetches, samples history and renders in tick order by itself
+            if "replay" not in poller_threads:
+                poller_threads["replay"] = threading.Thread(target=run_replay, name="replay", daemon=True)
+                poller_threads["replay"].start()
+            return
+        if sampler_thread is None or not sampler_thread.is_alive():
+            sampler_thread = threading.Thread(target=sample_history, name="history-sampler", daemon=True)
+            sampler_thread.start()
+        if ARCHIVE_DIR and (archive_thread is None or not archive_thread.is_alive()):
+            archive_thread = threading.Thread(target=write_archive, name="archive-writer", daemon=True)
+            archive_thread.start()
+        if CHAIN_SOURCE == "async":
+            thread = poller_threads.get("*")
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=run_fetch_engine, name="fetch-engine", daemon=True)
+                poller_threads["*"] = thread
+                thread.start()
+            return
+        if CHAIN_SOURCE == "ticks":
+            thread = poller_threads.get("ticks")
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=publish_ticks, name="tick-publisher", daemon=True)
+                poller_threads["ticks"] = thread
+                thread.start()
+        for index_name, symbol in symbols_map.items():
+            thread = poller_threads.get(index_name)
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=source, args=(index_name, symbol),
+                                          name=f"poller-{index_name}", daemon=True)
+                poller_threads[index_name] = thread
+                thread.start()
+
+def get_snapshot(index_name, wait=SNAPSHOT_WAIT):
+    """Return the latest snapshot for an index or chain key, None when there is none yet
+
+    Only a cold start waits: requests in the first SNAPSHOT_WAIT seconds after
+    a key is first asked for block (at most `wait`) for its first fetch. Later,
+    or while nobody is logged in to fetch it, a missing snapshot returns at once.
+    """
+    if index_name not in chain_snapshots:
+        index_name = chain_key(index_name)
+    start_pollers()
+    with snapshot_condition:
+        snapshot = chain_snapshots.get(index_name)
+        if snapshot is not None or fyers is None or not wait:
+            return snapshot
+        now = time.monotonic()
+        deadline = snapshot_waits.setdefault(index_name, now) + SNAPSHOT_WAIT
+        snapshot_condition.wait_for(lambda: index_name in chain_snapshots, timeout=min(wait, deadline - now))
+        return chain_snapshots.get(index_name)
+
+class SharedArena:
+    """Anonymous shared memory mapped before forking, handed out as NumPy arrays"""
+
+    def __init__(self, size):
+        self.buffer = mmap.mmap(-1, size)  # MAP_SHARED, so forked children see every write
+        self.offset = 0
+
+    def allocate(self, shape, dtype):
+        dtype = np.dtype(dtype)
+        start = -(-self.offset // 64) * 64  # Cache-line aligned
+        end = start + int(np.prod(shape)) * dtype.itemsize
+        if end > len(self.buffer):
+            raise MemoryError("Shared memory arena is full, raise SHARED_MEMORY_BYTES")
+        self.offset = end
+        return np.ndarray(shape, dtype=dtype, buffer=self.buffer, offset=start)
+
+class SharedBlob:
+    """Length-prefixed bytes in shared memory with a sequence number (odd while a write is in progress)
+
+    Readers copy the payload and retry if the sequence moved, so they never
+    see a torn write. Concurrent writers must hold state_lock.
+    """
+
+    def __init__(self, arena, capacity):
+        self.header = arena.allocate(2, np.int64)  # [sequence, length]
+        self.payload = arena.allocate(capacity, np.uint8)
+
+    def write(self, data):
+        if len(data) > len(self.payload):
+            raise ValueError(f"{len(data)} bytes do not fit a {len(self.payload)} byte shared blob")
+        self.header[0] += 1
+        self.payload[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+        self.header[1] = len(data)
+        self.header[0] += 1
+
+    def read(self, since=None):
+        """Return (sequence, payload), with payload None when the sequence is still `since`"""
+        while True:
+            sequence = int(self.header[0])
+            if sequence == since:
+                return sequence, None
+            if sequence % 2 == 0:
+                data = self.payload[:int(self.header[1])].tobytes()
+                if int(self.header[0]) == sequence:
+                    return sequence, data
+            time.sleep(0)
+
+def read_shared(name, blob):
+    """Payload of a shared blob if it changed since this process last read it, else None"""
+    sequence, data = blob.read(shared_sequences.get(name))
+    shared_sequences[name] = sequence
+    return data or None
+
+def login_with_token(access_token):
+    """Create the broker clients for an access token"""
+    global fyers, fyers_async
+    fyers = fyersModel.FyersModel(client_id=client_id, token=access_token, is_async=False)
+    fyers_async = fyersModel.FyersModel(client_id=client_id, token=access_token, is_async=True)
+
+def share_token(access_token):
+    """Hand a fresh login to every other process"""
+    if shared_token is not None:
+        with state_lock:
+            shared_token.write(access_token.encode())
+        read_shared("token", shared_token)  # This process is already logged in
+
+def sync_token():
+    if shared_token is not None:
+        access_token = read_shared("token", shared_token)
+        if access_token:
+            login_with_token(access_token.decode())
+
+def share_status():
+    """Publish the fetcher's poll errors and fetch stats for the workers"""
+    status = {"poll_errors": poll_errors, "fetch_stats": fetch_stats}
+    shared_status.write(json.dumps(status).encode())
+
+def sync_status():
+    status = read_shared("status", shared_status)
+    if not status:
+        return
+    status = json.loads(status)
+    for name, target in (("poll_errors", poll_errors), ("fetch_stats", fetch_stats)):
+        target.clear()
+        target.update(status[name])
+
+def process_metrics():
+    """This process's own counters and histograms, as published for /metrics"""
+    with metrics_lock:
+        stages = [[stage, key, list(counts), stage_sums[(stage, key)]] for (stage, key), counts in stage_counts.items()]
+        return {"stages": stages, "broker_errors": dict(broker_errors), "broker_timeouts": dict(broker_timeouts),
+                "render": dict(render_stats), "stream_clients": dict(stream_clients),
+                "archive_dropped": archive_stats["dropped"]}
+
+def share_metrics():
+    """Publish this process's counters into its slot, at most every METRICS_SHARE_INTERVAL"""
+    now = time.monotonic()
+    if metrics_slot is not None and now - shared_sequences.get("metrics_published", 0) >= METRICS_SHARE_INTERVAL:
+        shared_sequences["metrics_published"] = now
+        shared_metrics[metrics_slot].write(json.dumps(process_metrics()).encode())
+
+def collect_metrics():
+    """Counters of every serving process: this one live, the others as last published"""
+    collected = [process_metrics()]
+    for slot, blob in enumerate(shared_metrics):
+        if slot != metrics_slot:
+            payload = blob.read()[1]
+            if payload:
+                collected.append(json.loads(payload))
+    return collected
+
+def share_alert_rules():
+    """Publish this process's alert rules; call with state_lock held after sync_alert_rules"""
+    if shared_alert_rules is not None:
+        shared_alert_rules.write(json.dumps(alert_engine.export()).encode())
+        read_shared("alert_rules", shared_alert_rules)
+
+def sync_alert_rules():
+    if shared_alert_rules is not None:
+        rules = read_shared("alert_rules", shared_alert_rules)
+        if rules:
+            alert_engine.load(json.loads(rules))
+
+def share_alerts():
+    """Publish the alerts fired in the fetcher for the workers' subscribers"""
+    if alert_engine.sequence != shared_sequences.get("alerts_published"):
+        shared_sequences["alerts_published"] = alert_engine.sequence
+        shared_alerts.write(json.dumps(alert_engine.since(0)[1]).encode())
+
+def sync_alerts():
+    alerts = read_shared("alerts", shared_alerts)
+    if alerts:
+        alert_engine.receive(json.loads(alerts))
+
+def sync_shared_state():
+    """Worker loop mirroring the fetcher's snapshots, status and the shared login into this process"""
+    while True:
+        check_parent()
+        try:
+            sync_token()
+            sync_status()
+            sync_alert_rules()
+            sync_alerts()
+            share_metrics()
+            for name, blob in shared_snapshots.items():
+                payload = read_shared(name, blob)
+                if not payload:
+                    continue
+                snapshot = json.loads(payload)
+                # Expiry slots carry whichever chain key the fetcher last put in them
+                key = snapshot["key"]
+                with snapshot_condition:
+                    current = chain_snapshots.get(key)
+                    if current is not None and current["version"] == snapshot["version"]:
+                        current["timestamp"] = snapshot["timestamp"]
+                    else:
+                        chain_snapshots[key] = snapshot
+                        snapshot_condition.notify_all()
+        except Exception:
+            traceback.print_exc()
+        time.sleep(SHARED_SYNC_INTERVAL)
 
-    return volume_change, oi_change
+def setup_shared_state(processes=1):
+    """Move snapshots, history, expiry slots, the token, alerts and `processes` metrics slots into shared memory
+
+    Call before forking.
+    """
+    global shared_token, shared_status, shared_alert_rules, shared_alerts, state_lock, viewer_times, expiry_views
+    arena = SharedArena(SHARED_MEMORY_BYTES)
+    viewer_times = arena.allocate(len(symbols_map), float)
+    viewer_times[:] = 0
+    expiry_views = arena.allocate((len(symbols_map), EXPIRY_SLOTS, 2), float)
+    expiry_views[:] = 0
+    for index_name in symbols_map:
+        shared_snapshots[index_name] = SharedBlob(arena, SNAPSHOT_BYTES)
+        historical_data[index_name] = TieredHistory(allocate=arena.allocate)
+        for slot in range(EXPIRY_SLOTS):
+            shared_snapshots[index_name, slot] = SharedBlob(arena, SNAPSHOT_BYTES)
+            expiry_histories[index_name, slot] = TieredHistory(allocate=arena.allocate)
+    shared_token = SharedBlob(arena, 4096)
+    shared_status = SharedBlob(arena, 256 * 1024)
+    shared_alert_rules = SharedBlob(arena, 512 * 1024)
+    shared_alerts = SharedBlob(arena, 512 * 1024)
+    shared_metrics[:] = [SharedBlob(arena, 256 * 1024) for _ in range(processes)]
+    state_lock = multiprocessing.get_context("fork").Lock()
+
+def follow_parent(parent, slot):
+    """Make a freshly forked child exit with the serving parent and publish its metrics in `slot`"""
+    global serve_parent, metrics_slot
+    serve_parent, metrics_slot = parent, slot
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        ctypes.CDLL(None, use_errno=True).prctl(PR_SET_PDEATHSIG, signal.SIGTERM)
+    except (OSError, AttributeError):
+        pass  # Not Linux: the sync loops' parent check still catches it
+    check_parent()  # The parent may have died before prctl took effect
+
+def check_parent():
+    if serve_parent is not None and os.getppid() != serve_parent:
+        os._exit(0)
+
+def run_fetcher():
+    """Fetcher process: the only one talking to the broker, publishing into shared memory"""
+    global serve_role
+    serve_role = "fetcher"
+    sync_alerts()  # A restarted fetcher continues the alert sequence the workers have seen
+    start_pollers()
+    while True:
+        check_parent()
+        try:
+            sync_token()
+            sync_alert_rules()
+            share_status()
+            share_alerts()
+            share_metrics()
+        except Exception:
+            traceback.print_exc()
+        time.sleep(SHARED_SYNC_INTERVAL * 10)
+
+def run_worker(listener, port):
+    """Web worker process: serves every page from the shared snapshots"""
+    global serve_role
+    serve_role = "worker"
+    start_pollers()
+    make_server("0.0.0.0", port, app, threaded=True, fd=listener.fileno()).serve_forever()
+
+def stop_children(children):
+    """SIGTERM every child and reap them, killing any still running after SHUTDOWN_TIMEOUT"""
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+    while children:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            children.pop(pid, None)
+        elif time.monotonic() < deadline:
+            time.sleep(0.05)
+        else:
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            deadline = float("inf")
+
+def serve(workers, port):
+    """Fork one fetcher and `workers` web workers on one listening socket, restarting any that exit"""
+    setup_shared_state(workers + 1)
+    listener = socket.create_server(("0.0.0.0", port), backlog=128)
+    listener.set_inheritable(True)
+    children = {}  # pid -> (role, metrics slot)
+    parent = os.getpid()
+
+    def spawn(role, slot):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                follow_parent(parent, slot)
+                run_fetcher() if role == "fetcher" else run_worker(listener, port)
+            finally:
+                os._exit(1)
+        children[pid] = role, slot
+
+    def shutdown(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    spawn("fetcher", 0)
+    for slot in range(1, workers + 1):
+        spawn("worker", slot)
+    print(f"Serving on port {port} with {workers} workers and one fetcher")
+    try:
+        while True:
+            pid, status = os.wait()
+            child = children.pop(pid, None)
+            if child is not None:
+                print(f"{child[0]} {pid} exited with status {status}, restarting")
+                time.sleep(1)
+                spawn(*child)
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        stop_children(children)
+
+def conditional_response(etag, build, mimetype="application/json", cache_control="no-cache"):
+    """Answer with 304 when the client already holds `etag`, else build() the body
+
+    Bodies go out gzipped when the client accepts it, compressed once per ETag
+    so every client of the same view and version shares one compression. The
+    gzip variant gets its own ETag, as strong ETags must differ per encoding.
+    """
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    for tag in (etag, f"{etag}-gz"):
+        if request.if_none_match.contains(tag):
+            return Response(status=304, headers={**headers, "ETag": f'"{tag}"'})
+
+    accepts_gzip = request.accept_encodings["gzip"] > 0
+    if accepts_gzip:
+        with compressed_lock:
+            body = compressed_bodies.get(etag)
+            if body is not None:
+                compressed_bodies.move_to_end(etag)
+                return Response(body, mimetype=mimetype,
+                                headers={**headers, "ETag": f'"{etag}-gz"', "Content-Encoding": "gzip"})
+
+    body = build()
+    body = body.encode() if isinstance(body, str) else body
+    if not accepts_gzip or len(body) < GZIP_MIN_BYTES:
+        return Response(body, mimetype=mimetype, headers={**headers, "ETag": f'"{etag}"'})
+    body = gzip.compress(body, GZIP_LEVEL, mtime=0)
+    with compressed_lock:
+        compressed_bodies[etag] = body
+        while len(compressed_bodies) > MAX_COMPRESSED_BODIES:
+            compressed_bodies.popitem(last=False)
+    return Response(body, mimetype=mimetype, headers={**headers, "ETag": f'"{etag}-gz"', "Content-Encoding": "gzip"})
+
+class RenderCache:
+    """Bounded LRU of rendered fragments, each rendered once per key and version
+
+    A request finding a stale or missing entry takes the key's render lock, so
+    concurrent viewers of the same view wait for one render instead of each
+    repeating it.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (version, value)
+        self.render_locks = {}  # key -> Lock held while the key renders
+        self.lock = threading.Lock()
+
+    def lookup(self, key, version):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def get(self, key, version, render):
+        with self.lock:
+            entry = self.lookup(key, version)
+            if entry is None:
+                render_lock = self.render_locks.setdefault(key, threading.Lock())
+        if entry is None:
+            with render_lock:
+                with self.lock:
+                    entry = self.lookup(key, version)
+                if entry is None:
+                    entry = (version, render())
+                    with self.lock:
+                        self.entries[key] = entry
+                        self.entries.move_to_end(key)
+                        while len(self.entries) > self.max_entries:
+                            evicted, _ = self.entries.popitem(last=False)
+                            self.render_locks.pop(evicted, None)
+                        render_stats["renders"] += 1
+                    return entry[1]
+        with self.lock:
+            render_stats["hits"] += 1
+        return entry[1]
+
+render_cache = RenderCache(MAX_RENDERED)
+
+def shell_response(template, **context):
+    """Serve a page shell (no live data in it) as cacheable, with an ETag of its content
+
+    The shell depends only on the template and its context, so it is rendered
+    once per distinct view.
+    """
+    def render():
+        started = time.perf_counter()
+        page = template.render(**context).encode()
+        observe_stage("template", context["index_name"], started)
+        return page, f"{SERVER_EPOCH}-{hashlib.md5(page, usedforsecurity=False).hexdigest()}"
+
+    page, etag = render_cache.get(("shell", template, *sorted(context.items())), None, render)
+    return conditional_response(etag, lambda: page, "text/html", f"public, max-age={SHELL_MAX_AGE}")
+
+def compact_json(payload):
+    """JSON without padding or \\u escapes for the polling endpoints"""
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
 
 @app.route("/")
 def home():
@@ -123,9 +2382,10 @@ def home():
     <h1 style="fond-size:80;color:green">Sajid Shaikh Algo Software : +91 9834370368</h1></center>
     <a href="/login" target="_blank">🔑 Login</a> |
     <a href="/chain?index=NIFTY50" target="_blank">📊 View Option Chain</a> |
-    <a href="/scalping?index=NIFTY50" target="_blank">⚡ Scalping Dashboard</a>
+    <a href="/scalping?index=NIFTY50" target="_blank">⚡ Scalping Dashboard</a> |
+    <a href="/overview" target="_blank">🌐 All Indices Overview</a>
     <hr>
-    <p>Use the dropdown on pages to switch indices. Auto-refresh every second.</p>
+    <p>Use the dropdown on pages to switch indices. Pages update live as soon as new data arrives.</p>
     """
 
 @app.route("/login")
@@ -136,110 +2396,116 @@ def login():
 
 @app.route("/callback")
 def callback():
-    global fyers
     auth_code = request.args.get("auth_code")
     if auth_code:
         try:
             appSession.set_token(auth_code)
             token_response = appSession.generate_token()
             access_token = token_response.get("access_token")
-            fyers = fyersModel.FyersModel(client_id=client_id, token=access_token, is_async=False)
+            login_with_token(access_token)
+            share_token(access_token)
+            start_pollers()
             return "<h2>✅ Authentication Successful! You can return to the app 🚀</h2>"
         except Exception as e:
             return f"<h3>Callback error: {str(e)}</h3>"
     return "❌ Authentication failed. Please retry."
 
-@app.route("/scalping")
-def scalping_dashboard():
-    global fyers
-    if fyers is None:
-        return "<h3>⚠ Please <a href='/login'>login</a> first!</h3>"
-
-    index_name = request.args.get("index", "NIFTY50")
-    vol_interval = int(request.args.get("vol_interval", 1))
-    oi_interval = int(request.args.get("oi_interval", 1))
+# Page templates are compiled once at import; shell_response renders each view of them once
+app.jinja_env.globals.update(interval_label=interval_label, interval_options=interval_options,
+                             CHAIN_WINDOWS=CHAIN_WINDOWS, SCALPING_WINDOWS=SCALPING_WINDOWS)
 
-    html = f"""
+SCALPING_PAGE = app.jinja_env.from_string("""
     <!doctype html>
     <html>
     <head>
-        <title>{index_name} Scalping Dashboard</title>
+        <title>{{ index_name }} Scalping Dashboard</title>
         <style>
-            body {{ font-family: Arial, sans-serif; padding: 16px; background: #f5f5f5; }}
-            h2 {{ text-align:center; color:#1a73e8; }}
-            .container {{ max-width: 1600px; margin: 0 auto; }}
-            .dropdown {{ margin:12px 0; text-align:center; background: white; padding: 15px; border-radius: 8px; }}
-
-            .positions-section {{ background: white; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-            .positions-table {{ width:100%; border-collapse: collapse; font-size:13px; }}
-            .positions-table th {{ background:#1a73e8; color:#fff; padding: 10px; text-align: center; }}
-            .positions-table td {{ border:1px solid #ddd; padding:8px; text-align:center; }}
-            .positions-table tr:nth-child(even) {{ background:#f7f7f7; }}
-
-            .profit {{ color: #0f9d58; font-weight: bold; }}
-            .loss {{ color: #db4437; font-weight: bold; }}
-            .neutral {{ color: #666; }}
-
-            .btn {{ padding: 8px 16px; margin: 4px; border: none; border-radius: 4px; cursor: pointer; font-weight: bold; }}
-            .btn-buy {{ background: #0f9d58; color: white; }}
-            .btn-sell {{ background: #db4437; color: white; }}
-            .btn-exit {{ background: #f4b400; color: white; }}
-            .btn-clear {{ background: #666; color: white; }}
-
-            .opportunities {{ background: white; padding: 20px; border-radius: 8px; margin: 20px 0; overflow-x: auto; }}
-            .opp-table {{ width:100%; border-collapse: collapse; font-size:12px; }}
-            .opp-table th {{ background:#f4b400; color:#000; padding: 10px; text-align: center; }}
-            .opp-table td {{ border:1px solid #ddd; padding:8px; text-align:center; }}
-
-            .stats {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 15px; margin: 20px 0; }}
-            .stat-card {{ background: white; padding: 15px; border-radius: 8px; text-align: center; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
-            .stat-value {{ font-size: 24px; font-weight: bold; margin: 10px 0; }}
-            .stat-label {{ color: #666; font-size: 14px; }}
-
-            .interval-selector {{ display: inline-block; margin: 0 10px; }}
-            .interval-selector label {{ font-weight: bold; margin-right: 5px; }}
-            .interval-selector select {{ padding: 5px; border-radius: 4px; }}
+            body { font-family: Arial, sans-serif; padding: 16px; background: #f5f5f5; }
+            h2 { text-align:center; color:#1a73e8; }
+            .container { max-width: 1600px; margin: 0 auto; }
+            .dropdown { margin:12px 0; text-align:center; background: white; padding: 15px; border-radius: 8px; }
+
+            .positions-section { background: white; padding: 20px; border-radius: 8px; margin: 20px 0; }
+            .positions-table { width:100%; border-collapse: collapse; font-size:13px; }
+            .positions-table th { background:#1a73e8; color:#fff; padding: 10px; text-align: center; }
+            .positions-table td { border:1px solid #ddd; padding:8px; text-align:center; }
+            .positions-table tr:nth-child(even) { background:#f7f7f7; }
+
+            .profit { color: #0f9d58; font-weight: bold; }
+            .loss { color: #db4437; font-weight: bold; }
+            .neutral { color: #666; }
+
+            .btn { padding: 8px 16px; margin: 4px; border: none; border-radius: 4px; cursor: pointer; font-weight: bold; }
+            .btn-buy { background: #0f9d58; color: white; }
+            .btn-sell { background: #db4437; color: white; }
+            .btn-exit { background: #f4b400; color: white; }
+            .btn-clear { background: #666; color: white; }
+
+            .opportunities { background: white; padding: 20px; border-radius: 8px; margin: 20px 0; overflow-x: auto; }
+            .opp-table { width:100%; border-collapse: collapse; font-size:12px; }
+            .opp-table th { background:#f4b400; color:#000; padding: 10px; text-align: center; }
+            .opp-table td { border:1px solid #ddd; padding:8px; text-align:center; }
+
+            .stats { display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 15px; margin: 20px 0; }
+            .stat-card { background: white; padding: 15px; border-radius: 8px; text-align: center; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
+            .stat-value { font-size: 24px; font-weight: bold; margin: 10px 0; }
+            .stat-label { color: #666; font-size: 14px; }
+
+            .interval-selector { display: inline-block; margin: 0 10px; }
+            .interval-selector label { font-weight: bold; margin-right: 5px; }
+            .interval-selector select { padding: 5px; border-radius: 4px; }
 
             /* Highlight styles for highest values */
-            .highest-volume {{ background-color: #e3f2fd !important; font-weight: bold; color: #0d47a1; }}
-            .highest-vol-change {{ background-color: #e8f5e9 !important; font-weight: bold; color: #1b5e20; }}
-            .highest-oi {{ background-color: #fff3e0 !important; font-weight: bold; color: #e65100; }}
-            .highest-oi-change {{ background-color: #fce4ec !important; font-weight: bold: color: #880e4f; }}
+            .highest-volume { background-color: #e3f2fd !important; font-weight: bold; color: #0d47a1; }
+            .highest-vol-change { background-color: #e8f5e9 !important; font-weight: bold; color: #1b5e20; }
+            .highest-oi { background-color: #fff3e0 !important; font-weight: bold; color: #e65100; }
+            .highest-oi-change { background-color: #fce4ec !important; font-weight: bold: color: #880e4f; }
         </style>
     </head>
     <body>
         <div class="container">
         <center><h1 aligh=center style="color:green;fond-size:70">Sajid Shaikh | (+91) 9834370368</h1></center>
-            <h2>⚡ {index_name} Scalping Dashboard</h2>
+            <h2>⚡ {{ index_name }} Scalping Dashboard</h2>
 
             <div class="dropdown">
                 <form method="get" action="/scalping" id="mainForm">
                     <label for="index">Select Index: </label>
                     <select name="index" id="index" onchange="this.form.submit()">
-                        <option value="NIFTY50" {"selected" if index_name=="NIFTY50" else ""}>NIFTY50</option>
-                        <option value="BANKNIFTY" {"selected" if index_name=="BANKNIFTY" else ""}>BANKNIFTY</option>
-                        <option value="FINNIFTY" {"selected" if index_name=="FINNIFTY" else ""}>FINNIFTY</option>
-                        <option value="MIDCAPNIFTY" {"selected" if index_name=="MIDCAPNIFTY" else ""}>MIDCAPNIFTY</option>
-                        <option value="SENSEX" {"selected" if index_name=="SENSEX" else ""}>SENSEX</option>
+                        <option value="NIFTY50" {{ "selected" if index_name == "NIFTY50" }}>NIFTY50</option>
+                        <option value="BANKNIFTY" {{ "selected" if index_name == "BANKNIFTY" }}>BANKNIFTY</option>
+                        <option value="FINNIFTY" {{ "selected" if index_name == "FINNIFTY" }}>FINNIFTY</option>
+                        <option value="MIDCAPNIFTY" {{ "selected" if index_name == "MIDCAPNIFTY" }}>MIDCAPNIFTY</option>
+                        <option value="SENSEX" {{ "selected" if index_name == "SENSEX" }}>SENSEX</option>
                     </select>
 
+                    <div class="interval-selector">
+                        <label for="expiry">Expiry:</label>
+                        <select name="expiry" id="expiry" onchange="this.form.submit()">
+                            {% for label, timestamp in expiries %}
+                            <option value="{{ "" if loop.first else timestamp }}" {{ "selected" if timestamp == expiry or (loop.first and not expiry) }}>
+                                {{ label }}{{ " (nearest)" if loop.first }}</option>
+                            {% else %}<option value="">Nearest</option>{% endfor %}
+                        </select>
+                    </div>
+
                     <div class="interval-selector">
                         <label for="vol_interval">Volume Δ Interval:</label>
                         <select name="vol_interval" id="vol_interval" onchange="this.form.submit()">
-                            <option value="1" {"selected" if vol_interval==1 else ""}>1 min</option>
-                            <option value="2" {"selected" if vol_interval==2 else ""}>2 min</option>
-                            <option value="5" {"selected" if vol_interval==5 else ""}>5 min</option>
-                            <option value="10" {"selected" if vol_interval==10 else ""}>10 min</option>
+                            {{ interval_options(vol_interval)|safe }}
                         </select>
                     </div>
 
                     <div class="interval-selector">
                         <label for="oi_interval">OI Δ Interval:</label>
                         <select name="oi_interval" id="oi_interval" onchange="this.form.submit()">
-                            <option value="1" {"selected" if oi_interval==1 else ""}>1 min</option>
-                            <option value="2" {"selected" if oi_interval==2 else ""}>2 min</option>
-                            <option value="5" {"selected" if oi_interval==5 else ""}>5 min</option>
-                            <option value="10" {"selected" if oi_interval==10 else ""}>10 min</option>
+                            {{ interval_options(oi_interval)|safe }}
+                        </select>
+                    </div>
+
+                    <div class="interval-selector">
+                        <label for="window">Strikes:</label>
+                        <select name="window" id="window" onchange="this.form.submit()">
+                            {% for w in SCALPING_WINDOWS %}<option value="{{ w }}" {{ "selected" if w == window }}>ATM ±{{ w }}</option>{% endfor %}
                         </select>
                     </div>
 
@@ -263,7 +2529,7 @@ def scalping_dashboard():
             </div>
 
             <div class="positions-section">
-                <h3>📊 Active Positions (Qty: 75)</h3>
+                <h3>📊 Active Positions (Lot Size: {{ lot_size }})</h3>
                 <table class="positions-table">
                     <thead>
                         <tr>
@@ -271,7 +2537,7 @@ def scalping_dashboard():
                             <th>Type</th>
                             <th>Entry LTP</th>
                             <th>Current LTP</th>
-                            <th>P&L per Lot</th>
+                            <th>P&L</th>
                             <th>Entry Time (IST)</th>
                             <th>Action</th>
                         </tr>
@@ -282,8 +2548,32 @@ def scalping_dashboard():
                 </table>
             </div>
 
+            <div class="positions-section">
+                <h3>🔔 Alerts</h3>
+                <div>
+                    <input id="alert-rule" size="50" placeholder="CE vol Δ(2m) > 50000 | oi Δ(5m) < -1L | pcr crosses 1.0">
+                    <button type="button" class="btn btn-buy" onclick="addAlert()">Add Rule</button>
+                    <span id="alert-error" class="loss"></span>
+                </div>
+                <div id="alert-rules"></div>
+                <table class="positions-table">
+                    <thead>
+                        <tr>
+                            <th>Time (IST)</th>
+                            <th>Rule</th>
+                            <th>Strike</th>
+                            <th>Type</th>
+                            <th>Value</th>
+                        </tr>
+                    </thead>
+                    <tbody id="alerts-body">
+                        <tr><td colspan="5">No alerts yet.</td></tr>
+                    </tbody>
+                </table>
+            </div>
+
             <div class="opportunities">
-                <h3>🎯 Scalping Opportunities (ATM ±2 strikes)</h3>
+                <h3>🎯 Scalping Opportunities (ATM ±{{ window }} strikes)</h3>
                 <table class="opp-table">
                     <thead>
                         <tr>
@@ -291,9 +2581,9 @@ def scalping_dashboard():
                             <th>Type</th>
                             <th>LTP</th>
                             <th>Volume (Cr)</th>
-                            <th>Vol Δ ({vol_interval}m)</th>
+                            <th>Vol Δ ({{ interval_label(vol_interval) }})</th>
                             <th>OI (Cr)</th>
-                            <th>OI Δ ({oi_interval}m)</th>
+                            <th>OI Δ ({{ interval_label(oi_interval) }})</th>
                             <th>OI Change %</th>
                             <th>Action</th>
                         </tr>
@@ -306,65 +2596,372 @@ def scalping_dashboard():
         </div>
 
         <script>
-            const indexName = "{index_name}";
-            const volInterval = {vol_interval};
-            const oiInterval = {oi_interval};
-            const LOT_SIZE = 75;
-
-            function addPosition(strike, type, ltp) {{
-                fetch(`/add_position?index=${{indexName}}&strike=${{strike}}&type=${{type}}&ltp=${{ltp}}`, {{
+            const indexName = "{{ index_name }}";
+            const expiry = "{{ expiry }}";
+            const volInterval = {{ vol_interval }};
+            const oiInterval = {{ oi_interval }};
+            const strikeWindow = {{ window }};
+            const LOT_SIZE = {{ lot_size }};
+
+            function addPosition(strike, type, ltp) {
+                fetch(`/add_position?index=${indexName}&expiry=${expiry}&strike=${strike}&type=${type}&ltp=${ltp}`, {
                     method: 'POST'
-                }}).then(() => refreshData());
-            }}
+                }).then(() => refreshData());
+            }
 
-            function exitPosition(posId) {{
-                fetch(`/exit_position?index=${{indexName}}&id=${{posId}}`, {{
+            function exitPosition(posId) {
+                fetch(`/exit_position?index=${indexName}&expiry=${expiry}&id=${posId}`, {
                     method: 'POST'
-                }}).then(() => refreshData());
-            }}
+                }).then(() => refreshData());
+            }
 
-            function clearAllPositions() {{
-                if (confirm('Clear all positions for ' + indexName + '?')) {{
-                    fetch(`/clear_positions?index=${{indexName}}`, {{
+            function clearAllPositions() {
+                if (confirm('Clear all positions for ' + indexName + '?')) {
+                    fetch(`/clear_positions?index=${indexName}&expiry=${expiry}`, {
                         method: 'POST'
-                    }}).then(() => refreshData());
-                }}
-            }}
-
-            async function refreshData() {{
-                try {{
-                    const resp = await fetch(`/scalping_data?index=${{indexName}}&vol_interval=${{volInterval}}&oi_interval=${{oiInterval}}`);
-                    const data = await resp.json();
-
-                    document.getElementById('positions-body').innerHTML = data.positions;
-                    document.getElementById('opportunities-body').innerHTML = data.opportunities;
-                    document.getElementById('active-count').innerText = data.active_count;
-                    document.getElementById('total-pnl').innerText = data.total_pnl;
-                    document.getElementById('total-pnl').className = 'stat-value ' + (data.total_pnl_num >= 0 ? 'profit' : 'loss');
-                    document.getElementById('spot-price').innerText = data.spot_price;
-                }} catch (err) {{
+                    }).then(() => refreshData());
+                }
+            }
+
+            async function refreshData() {
+                try {
+                    const resp = await fetch(`/scalping_data?index=${indexName}&expiry=${expiry}&vol_interval=${volInterval}&oi_interval=${oiInterval}&window=${strikeWindow}`);
+                    applyData(await resp.json());
+                } catch (err) {
                     console.error("Error refreshing data:", err);
-                }}
-            }}
-
-            setInterval(refreshData, 1000);
+                }
+            }
+
+            function applyData(data) {
+                document.getElementById('positions-body').innerHTML = data.positions;
+                document.getElementById('opportunities-body').innerHTML = data.opportunities;
+                document.getElementById('active-count').innerText = data.active_count;
+                document.getElementById('total-pnl').innerText = data.total_pnl;
+                document.getElementById('total-pnl').className = 'stat-value ' + (data.total_pnl_num >= 0 ? 'profit' : 'loss');
+                document.getElementById('spot-price').innerText = data.spot_price;
+            }
+
+            const escapeHtml = (text) => text.replace(/&/g, '&amp;').replace(/</g, '&lt;');
+            let alertSeq = 0;
+
+            function addAlert() {
+                const rule = document.getElementById('alert-rule').value;
+                fetch(`/add_alert?rule=${encodeURIComponent(rule)}`, {
+                    method: 'POST'
+                }).then(resp => resp.json()).then(data => {
+                    document.getElementById('alert-error').innerText = data.error || '';
+                    if (!data.error) document.getElementById('alert-rule').value = '';
+                    loadAlertRules();
+                });
+            }
+
+            function removeAlert(ruleId) {
+                fetch(`/remove_alert?id=${ruleId}`, {
+                    method: 'POST'
+                }).then(() => loadAlertRules());
+            }
+
+            async function loadAlertRules() {
+                const rules = await (await fetch('/alert_rules')).json();
+                document.getElementById('alert-rules').innerHTML = rules
+                    .filter(rule => rule.index === null || rule.index === indexName)
+                    .map(rule => `<button type="button" class="btn btn-clear" onclick="removeAlert(${rule.id})">✕ ${escapeHtml(rule.text)}</button>`)
+                    .join('');
+            }
+
+            function showAlert(alert) {
+                const body = document.getElementById('alerts-body');
+                if (alertSeq === 0) body.innerHTML = '';
+                alertSeq = Math.max(alertSeq, alert.seq);
+                const row = body.insertRow(0);
+                row.innerHTML = `<td>${alert.time}</td><td>${escapeHtml(alert.text)}</td><td>${alert.strike ?? '-'}</td>` +
+                    `<td>${alert.type ?? '-'}</td><td>${alert.value.toLocaleString('en-IN', {maximumFractionDigits: 2})}</td>`;
+                while (body.rows.length > 50) body.deleteRow(-1);
+            }
+
+            async function pollAlerts() {
+                const data = await (await fetch(`/alerts?index=${indexName}&since=${alertSeq}`)).json();
+                data.alerts.forEach(showAlert);
+                return data.seq;
+            }
+
+            if (window.EventSource) {
+                const source = new EventSource(`/stream?view=scalping&index=${indexName}&expiry=${expiry}&vol_interval=${volInterval}&oi_interval=${oiInterval}&window=${strikeWindow}`);
+                source.onmessage = (event) => applyData(JSON.parse(event.data));
+                pollAlerts().then(seq => {
+                    const alerts = new EventSource(`/alert_stream?index=${indexName}&since=${seq}`);
+                    alerts.onmessage = (event) => showAlert(JSON.parse(event.data));
+                });
+            } else {
+                setInterval(refreshData, 1000);
+                setInterval(pollAlerts, 1000);
+                pollAlerts();
+            }
             refreshData();
+            loadAlertRules();
         </script>
     </body>
     </html>
+    """)
+
+@app.route("/scalping")
+def scalping_dashboard():
+    global fyers
+    if fyers is None:
+        return "<h3>⚠ Please <a href='/login'>login</a> first!</h3>"
+
+    index_name = chain_index(request.args.get("index", "NIFTY50"))
+    note_view(index_name)
+    vol_interval = int(request.args.get("vol_interval", 1))
+    oi_interval = int(request.args.get("oi_interval", 1))
+    window = int(request.args.get("window", SCALPING_WINDOW))
+    get_snapshot(index_name)  # The expiry list arrives with the first nearest-expiry snapshot
+    key = chain_key(index_name, request.args.get("expiry"))
+    note_view(key)
+    # The page is a shell with no live data, so it is cacheable; rows arrive over /stream or polling
+    return shell_response(SCALPING_PAGE, index_name=index_name, vol_interval=vol_interval, oi_interval=oi_interval,
+                          window=window, lot_size=LOT_SIZES.get(index_name, LOT_SIZES["NIFTY50"]),
+                          expiry=split_chain_key(key)[1] or "", expiries=tuple(get_expiries(index_name)))
+
+class PositionBook:
+    """Open scalping positions by id, with net quantity and average price per (contract, strike, type)
+
+    A contract is (index_name, expiry timestamp), so positions stay with the
+    expiry they were opened in whichever chain key names it later.
+    Changes apply to memory at once and are queued for a writer thread that
+    commits them to a SQLite WAL database in batches, so requests never wait
+    on disk. Commits from other processes show up as a new PRAGMA data_version
+    and trigger a reload, with this process's uncommitted changes replayed on
+    top. An empty path keeps the book in memory only.
     """
-    return render_template_string(html)
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()  # Guards the in-memory book and pending changes
+        self.db_lock = threading.Lock()  # Guards the connection; always taken before self.lock
+        self.positions = {}  # contract -> {id: position}, in opening order
+        self.net = {}  # (contract, strike, option_type) -> [quantity, entry cost]
+        self.pending = []  # (kind, contract, value) changes not committed yet, oldest first
+        self.undated = set()  # Indices with rows stored before positions carried their expiry
+        self.wakeup = threading.Event()
+        self.db = None
+        self.pid = None
+        self.data_version = None
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def after_fork(self):
+        """Start the child with fresh locks; it opens its own connection on first use"""
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    def ensure_open(self):
+        """Open this process's connection and load the book, again after a fork"""
+        if self.pid == os.getpid():
+            return
+        with self.db_lock, self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.pending = []
+            if not self.path:
+                return
+            self.db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS positions (
+                id TEXT PRIMARY KEY, index_name TEXT NOT NULL, strike REAL NOT NULL, option_type TEXT NOT NULL,
+                entry_ltp REAL NOT NULL, entry_time TEXT NOT NULL, lot_size INTEGER NOT NULL,
+                lots INTEGER NOT NULL, opened_at REAL NOT NULL, expiry TEXT)""")
+            self.migrate()
+            self.db.execute("CREATE INDEX IF NOT EXISTS positions_by_index ON positions (index_name)")
+            self.data_version = self.db.execute("PRAGMA data_version").fetchone()[0]
+            self.load()
+            threading.Thread(target=self.write_changes, name="position-writer", daemon=True).start()
+
+    def migrate(self):
+        """Add the expiry column to a database from before it existed
+
+        Rows were keyed by chain key, so "INDEX@expiry" rows split into index
+        and expiry here. Plain index rows meant the nearest expiry, which is
+        only known once a snapshot lists it; date_undated fills those in.
+        """
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            columns = [row[1] for row in self.db.execute("PRAGMA table_info(positions)")]
+            if "expiry" not in columns:
+                self.db.execute("ALTER TABLE positions ADD COLUMN expiry TEXT")
+                self.db.execute("UPDATE positions SET expiry = substr(index_name, instr(index_name, '@') + 1), "
+                                "index_name = substr(index_name, 1, instr(index_name, '@') - 1) "
+                                "WHERE instr(index_name, '@') > 0")
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def date_undated(self):
+        """Give rows stored without an expiry their index's nearest expiry, once a snapshot lists it"""
+        if not self.undated:
+            return
+        expiries = {index_name: position_contract(index_name)[1] for index_name in self.undated}
+        expiries = {index_name: expiry for index_name, expiry in expiries.items() if expiry is not None}
+        if not expiries:
+            return
+        with self.db_lock:
+            for index_name, expiry in expiries.items():
+                self.db.execute("UPDATE positions SET expiry = ? WHERE index_name = ? AND expiry IS NULL",
+                                (expiry, index_name))
+            with self.lock:
+                self.load()
+
+    def load(self):
+        """Rebuild the book from the database plus pending changes; hold both locks"""
+        self.positions, self.net = {}, {}
+        rows = self.db.execute("SELECT id, index_name, expiry, strike, option_type, entry_ltp, entry_time, lot_size, "
+                               "lots, opened_at FROM positions ORDER BY opened_at, rowid")
+        for pos_id, index_name, expiry, strike, option_type, entry_ltp, entry_time, lot_size, lots, opened_at in rows:
+            self.apply(("add", (index_name, expiry),
+                        {"id": pos_id, "strike": strike, "type": option_type, "entry_ltp": entry_ltp,
+                         "entry_time": entry_time, "lot_size": lot_size, "lots": lots, "opened_at": opened_at}))
+        for change in self.pending:
+            self.apply(change)
+        self.undated = {index_name for (index_name, expiry), book in self.positions.items() if book and expiry is None}
+
+    def apply(self, change):
+        kind, contract, value = change
+        book = self.positions.setdefault(contract, {})
+        if kind == "add":
+            self.remove_net(contract, book.get(value["id"]))
+            book[value["id"]] = value
+            self.add_net(contract, value, 1)
+        elif kind == "exit":
+            self.remove_net(contract, book.pop(value, None))
+        elif kind == "clear":
+            book.clear()
+            for key in [key for key in self.net if key[0] == contract]:
+                del self.net[key]
+
+    def remove_net(self, contract, position):
+        if position is not None:
+            self.add_net(contract, position, -1)
+
+    def add_net(self, contract, position, sign):
+        """Add (sign 1) or take out (sign -1) a position's quantity and cost, dropping strikes netted to zero"""
+        key = (contract, float(position["strike"]), position["type"])
+        quantity = sign * position["lot_size"] * position["lots"]
+        net = self.net.setdefault(key, [0, 0.0])
+        net[0] += quantity
+        net[1] += quantity * position["entry_ltp"]
+        if net[0] == 0:
+            del self.net[key]
+
+    def change(self, kind, contract, value=None):
+        """Apply a change now and queue it for the database"""
+        self.ensure_open()
+        with self.lock:
+            self.apply((kind, contract, value))
+            if self.db is not None:
+                self.pending.append((kind, contract, value))
+                self.wakeup.set()
+
+    def add(self, contract, position):
+        self.change("add", contract, position)
+
+    def exit(self, contract, pos_id):
+        self.change("exit", contract, pos_id)
+
+    def clear(self, contract):
+        self.change("clear", contract)
+
+    def write_changes(self):
+        """Writer thread: commit queued changes in one transaction per batch"""
+        while True:
+            self.wakeup.wait()
+            time.sleep(POSITION_FLUSH_INTERVAL)  # Let a burst of clicks share one transaction
+            self.wakeup.clear()
+            with self.lock:
+                batch = list(self.pending)
+            if not batch:
+                continue
+            try:
+                with self.db_lock:
+                    self.db.execute("BEGIN IMMEDIATE")
+                    try:
+                        for kind, (index_name, expiry), value in batch:
+                            if kind == "add":
+                                self.db.execute("INSERT OR REPLACE INTO positions (id, index_name, expiry, strike, "
+                                                "option_type, entry_ltp, entry_time, lot_size, lots, opened_at) "
+                                                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                                (value["id"], index_name, expiry, float(value["strike"]), value["type"],
+                                                 value["entry_ltp"], value["entry_time"], value["lot_size"],
+                                                 value["lots"], value["opened_at"]))
+                            elif kind == "exit":
+                                self.db.execute("DELETE FROM positions WHERE id = ?", (value,))
+                            elif kind == "clear":
+                                self.db.execute("DELETE FROM positions WHERE index_name = ? AND expiry IS ?",
+                                                (index_name, expiry))
+                        self.db.execute("COMMIT")
+                    except Exception:
+                        self.db.execute("ROLLBACK")
+                        raise
+                    with self.lock:
+                        del self.pending[:len(batch)]
+            except Exception:
+                traceback.print_exc()
+                self.wakeup.set()  # Retry the batch on the next pass
+
+    def sync(self):
+        """Reload when another process committed position changes since the last look"""
+        self.ensure_open()
+        if self.db is None:
+            return
+        with self.db_lock:
+            version = self.db.execute("PRAGMA data_version").fetchone()[0]
+            if version != self.data_version:
+                self.data_version = version
+                with self.lock:
+                    self.load()
+        self.date_undated()
+
+    def open_positions(self, contract):
+        with self.lock:
+            return list(self.positions.get(contract, {}).values())
+
+    def net_positions(self, contract):
+        """(strike, option_type, net quantity, average entry price) per held strike of a contract"""
+        with self.lock:
+            return [(strike, option_type, quantity, cost / quantity)
+                    for (held, strike, option_type), (quantity, cost) in self.net.items() if held == contract]
+
+    def has_open(self, contract):
+        return bool(self.positions.get(contract))
+
+    def fingerprint(self, contract):
+        """Checksum of a contract's open position ids, the same in every process holding the same book"""
+        with self.lock:
+            return f"{zlib.crc32(chr(0).join(sorted(self.positions.get(contract, {}))).encode()):08x}"
+
+position_book = PositionBook(POSITIONS_DB)
 
 @app.route("/add_position", methods=["POST"])
 def add_position():
-    global scalping_positions
-    index_name = request.args.get("index", "NIFTY50")
-    strike = float(request.args.get("strike"))
-    option_type = request.args.get("type")
-    ltp = float(request.args.get("ltp"))
-
-    if index_name not in scalping_positions:
-        scalping_positions[index_name] = []
+    index_name = chain_index(request.args.get("index", "NIFTY50"))
+    key = chain_key(index_name, request.args.get("expiry"))
+    try:
+        strike = float(request.args.get("strike", ""))
+        option_type = request.args.get("type")
+        ltp = float(request.args.get("ltp", ""))
+        lots = int(request.args.get("lots", 1))
+        if not math.isfinite(strike) or strike <= 0:
+            raise ValueError(f"Strike must be a positive number, got {strike}")
+        if option_type not in ("CE", "PE"):
+            raise ValueError(f"Option type must be CE or PE, got {option_type!r}")
+        if not math.isfinite(ltp) or ltp < 0:
+            raise ValueError(f"LTP must be a non-negative number, got {ltp}")
+        if lots < 1:
+            raise ValueError(f"Lots must be at least 1, got {lots}")
+    except ValueError as e:
+        return Response(json.dumps({"status": "error", "error": str(e)}), status=400, mimetype="application/json")
 
     # Use Mumbai time instead of local time
     mumbai_time = get_mumbai_time()
@@ -375,629 +2972,1380 @@ def add_position():
         "type": option_type,
         "entry_ltp": ltp,
         "entry_time": mumbai_time.strftime("%H:%M:%S"),
-        "lot_size": 75
+        "lot_size": LOT_SIZES.get(index_name, LOT_SIZES["NIFTY50"]),
+        "lots": lots,
+        "opened_at": mumbai_time.timestamp(),
     }
-    scalping_positions[index_name].append(position)
+    position_book.add(position_contract(key), position)
 
     return json.dumps({"status": "success"})
 
 @app.route("/exit_position", methods=["POST"])
 def exit_position():
-    global scalping_positions
-    index_name = request.args.get("index", "NIFTY50")
+    key = chain_key(request.args.get("index", "NIFTY50"), request.args.get("expiry"))
     pos_id = request.args.get("id")
-
-    if index_name in scalping_positions:
-        scalping_positions[index_name] = [p for p in scalping_positions[index_name] if p["id"] != pos_id]
+    position_book.exit(position_contract(key), pos_id)
 
     return json.dumps({"status": "success"})
 
 @app.route("/clear_positions", methods=["POST"])
 def clear_positions():
-    global scalping_positions
-    index_name = request.args.get("index", "NIFTY50")
-    scalping_positions[index_name] = []
+    key = chain_key(request.args.get("index", "NIFTY50"), request.args.get("expiry"))
+    position_book.clear(position_contract(key))
     return json.dumps({"status": "success"})
 
 @app.route("/scalping_data")
 def scalping_data():
-    global fyers, scalping_positions
-    index_name = request.args.get("index", "NIFTY50")
+    index_name = chain_key(request.args.get("index", "NIFTY50"), request.args.get("expiry"))
+    note_view(index_name)
     vol_interval = int(request.args.get("vol_interval", 1))
     oi_interval = int(request.args.get("oi_interval", 1))
-    symbol = symbols_map.get(index_name, "NSE:NIFTY50-INDEX")
-
+    window = int(request.args.get("window", SCALPING_WINDOW))
+
+    # The payload changes with the snapshot, the history samples its changes read and the open positions
+    snapshot = get_snapshot(index_name)
+    position_book.sync()
+    version = (frame_version(index_name, snapshot), position_book.fingerprint(position_contract(index_name)))
+    etag = f"{SERVER_EPOCH}-scalping-{index_name}-{vol_interval}-{oi_interval}-{window}-{version[0]}-{version[1]}"
+    return conditional_response(etag, lambda: scalping_body(index_name, vol_interval, oi_interval, window, version))
+
+def scalping_body(index_name, vol_interval, oi_interval, window, version):
+    """The scalping payload as JSON, built once per view and (frame version, positions fingerprint)"""
+    return render_cache.get(
+        ("scalping", index_name, vol_interval, oi_interval, window), version,
+        lambda: compact_json(build_scalping_update(index_name, vol_interval, oi_interval, window)))
+
+def build_scalping_update(index_name, vol_interval, oi_interval, window=SCALPING_WINDOW):
+    """Build the positions, opportunities and P&L payload for the scalping dashboard"""
     try:
-        data = {"symbol": symbol, "strikecount": 50}
-        response = fyers.optionchain(data=data)
-        data_section = response.get("data", {}) if isinstance(response, dict) else {}
-        options_data = data_section.get("optionsChain") or data_section.get("options_chain") or []
-
-        if not options_data:
-            return json.dumps({"positions": "", "opportunities": "", "active_count": 0, "total_pnl": "₹0.00", "total_pnl_num": 0, "spot_price": "-"})
-
-        df = pd.json_normalize(options_data)
-        if "strike_price" not in df.columns:
-            possible_strike_cols = [c for c in df.columns if "strike" in c.lower()]
-            if possible_strike_cols:
-                df = df.rename(columns={possible_strike_cols[0]: "strike_price"})
-
-        num_cols = ["strike_price", "ltp", "oi", "oich", "oichp", "volume"]
-        for col in num_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-
-        spot_price = None
-        for key in ("underlying_value", "underlyingValue", "underlying", "underlying_value_instrument"):
-            if data_section.get(key) is not None:
-                try:
-                    spot_price = float(data_section.get(key))
-                    break
-                except Exception:
-                    pass
-
-        strikes_all = sorted(df["strike_price"].dropna().unique())
-        if spot_price is None:
-            spot_price = float(strikes_all[len(strikes_all)//2]) if strikes_all else 0
-
-        atm_strike = min(strikes_all, key=lambda s: abs(s - spot_price)) if strikes_all else 0
-        atm_index = strikes_all.index(atm_strike) if atm_strike in strikes_all else 0
-        low = max(0, atm_index - 2)
-        high = min(len(strikes_all), atm_index + 3)
+        chain = get_parsed_chain(index_name)
+        if chain is None:
+            return {"positions": "", "opportunities": "", "active_count": 0, "total_pnl": "₹0.00", "total_pnl_num": 0, "spot_price": "-"}
+
+        spot_price, strikes_all = chain["spot"], chain["strikes"]
+        atm_index = atm_position(chain["strike_values"], spot_price)
+        low = max(0, atm_index - window)
+        high = min(len(strikes_all), atm_index + window + 1)
         strikes_to_show = strikes_all[low:high]
 
-        # Generate positions HTML
+        # Price every open position with one indexed lookup into the chain
+        # Positions of the contract this chain holds, never of the index's other expiries
+        contract = (chain_index(index_name), chain["contract_expiry"])
+        position_book.sync()
+        active_positions = position_book.open_positions(contract)
         positions_html = ""
         total_pnl = 0
-        active_positions = scalping_positions.get(index_name, [])
-
-        for pos in active_positions:
-            strike = pos["strike"]
-            option_type = pos["type"]
-            entry_ltp = pos["entry_ltp"]
-
-            current_row = df[(df["strike_price"] == strike) & (df["option_type"] == option_type)]
-            current_ltp = current_row["ltp"].values[0] if not current_row.empty and "ltp" in current_row.columns else entry_ltp
-
-            pnl = (current_ltp - entry_ltp) * pos["lot_size"]
-            total_pnl += pnl
-
-            pnl_class = "profit" if pnl >= 0 else "loss"
-            pnl_symbol = "+" if pnl >= 0 else ""
-
-            positions_html += f"""
-            <tr>
-                <td><b>{strike}</b></td>
-                <td>{option_type}</td>
-                <td>₹{entry_ltp:.2f}</td>
-                <td>₹{current_ltp:.2f}</td>
-                <td class="{pnl_class}">{pnl_symbol}₹{pnl:.2f}</td>
-                <td>{pos['entry_time']}</td>
-                <td><button class="btn btn-exit" onclick="exitPosition('{pos['id']}')">Exit</button></td>
-            </tr>
-            """
+        if active_positions:
+            entry_ltps = np.array([pos["entry_ltp"] for pos in active_positions], dtype=float)
+            quantities = np.array([pos["lot_size"] * pos["lots"] for pos in active_positions], dtype=float)
+            found = chain_rows(chain, [pos["strike"] for pos in active_positions],
+                               [pos["type"] for pos in active_positions])
+            current_ltps = np.where(found >= 0, chain_column(chain, "ltp", found), entry_ltps)
+            pnls = (current_ltps - entry_ltps) * quantities
+
+            # Total from the net book: one lookup per held strike, however many positions it has
+            held = position_book.net_positions(contract)
+            held_rows = chain_rows(chain, [strike for strike, _, _, _ in held], [option_type for _, option_type, _, _ in held])
+            net_quantities = np.array([quantity for _, _, quantity, _ in held], dtype=float)
+            average_prices = np.array([price for _, _, _, price in held], dtype=float)
+            net_ltps = np.where(held_rows >= 0, chain_column(chain, "ltp", held_rows), average_prices)
+            total_pnl = float(((net_ltps - average_prices) * net_quantities).sum())
+
+            positions_html = "".join(
+                f"<tr><td><b>{pos['strike']}</b></td><td>{pos['type']}{' ×' + str(pos['lots']) if pos['lots'] != 1 else ''}</td>"
+                f"<td>₹{entry_ltp:.2f}</td><td>₹{current_ltp:.2f}</td>"
+                f"<td class={'profit' if pnl >= 0 else 'loss'}>{'+' if pnl >= 0 else ''}₹{pnl:.2f}</td>"
+                f"<td>{pos['entry_time']}</td><td><button class='btn btn-exit' onclick=\"exitPosition('{pos['id']}')\">Exit</button></td></tr>"
+                for pos, entry_ltp, current_ltp, pnl in zip(active_positions, entry_ltps.tolist(), current_ltps.tolist(), pnls.tolist()))
 
         if not positions_html:
             positions_html = "<tr><td colspan='7'>No active positions. Add from opportunities below.</td></tr>"
 
         # Generate opportunities HTML with change tracking
-        opportunities_html = ""
-        opp_df = df[df["strike_price"].isin(strikes_to_show)]
-
-        # Track highest values
-        highest_volume = {"value": 0, "strike": None, "type": None}
-        highest_vol_change = {"value": 0, "strike": None, "type": None}
-        highest_oi = {"value": 0, "strike": None, "type": None}
-        highest_oi_change = {"value": 0, "strike": None, "type": None}
-
-        # First pass to collect all data and find highest values
-        temp_data = []
-        for _, row in opp_df.iterrows():
-            strike = row.get("strike_price", 0)
-            option_type = row.get("option_type", "")
-            ltp = row.get("ltp", 0)
-            volume = row.get("volume", 0)
-            oi = row.get("oi", 0)
-            oichp = row.get("oichp", 0)
-
-            # Update historical data
-            update_historical_data(index_name, strike, option_type, volume, oi)
-
-            # Get volume and OI changes
-            vol_change, _ = get_change_data(index_name, strike, option_type, vol_interval)
-            _, oi_change = get_change_data(index_name, strike, option_type, oi_interval)
-
-            # Store temp data
-            temp_data.append({
-                "strike": strike,
-                "option_type": option_type,
-                "ltp": ltp,
-                "volume": volume,
-                "vol_change": vol_change,
-                "oi": oi,
-                "oi_change": oi_change,
-                "oichp": oichp
-            })
-
-            # Track highest values
-            if volume > highest_volume["value"]:
-                highest_volume = {"value": volume, "strike": strike, "type": option_type}
-
-            if vol_change is not None and vol_change > highest_vol_change["value"]:
-                highest_vol_change = {"value": vol_change, "strike": strike, "type": option_type}
-
-            if oi > highest_oi["value"]:
-                highest_oi = {"value": oi, "strike": strike, "type": option_type}
-
-            if oi_change is not None and oi_change > highest_oi_change["value"]:
-                highest_oi_change = {"value": oi_change, "strike": strike, "type": option_type}
-
-        # Second pass to generate HTML with highlighting
-        for data in temp_data:
-            strike = data["strike"]
-            option_type = data["option_type"]
-            ltp = data["ltp"]
-            volume = data["volume"]
-            vol_change = data["vol_change"]
-            oi = data["oi"]
-            oi_change = data["oi_change"]
-            oichp = data["oichp"]
-
-            # Format values in crore
-            volume_cr = format_to_crore(volume)
-            oi_cr = format_to_crore(oi)
-
-            # Format changes
-            vol_change_str = f"{vol_change:+,.0f}" if vol_change is not None else "N/A"
-            vol_change_class = "profit" if (vol_change or 0) > 0 else ("loss" if (vol_change or 0) < 0 else "neutral")
-
-            # Check if this is the highest volume
-            if strike == highest_volume["strike"] and option_type == highest_volume["type"]:
-                volume_class = "highest-volume"
-            else:
-                volume_class = ""
-
-            # Check if this is the highest volume change
-            if strike == highest_vol_change["strike"] and option_type == highest_vol_change["type"]:
-                vol_change_class = "highest-vol-change"
-            elif (vol_change or 0) > 0:
-                vol_change_class = "profit"
-            elif (vol_change or 0) < 0:
-                vol_change_class = "loss"
-            else:
-                vol_change_class = "neutral"
-
-            oi_change_str = f"{oi_change:+,.0f}" if oi_change is not None else "N/A"
-
-            # Check if this is the highest OI
-            if strike == highest_oi["strike"] and option_type == highest_oi["type"]:
-                oi_class = "highest-oi"
-            else:
-                oi_class = ""
-
-            # Check if this is the highest OI change
-            if strike == highest_oi_change["strike"] and option_type == highest_oi_change["type"]:
-                oi_change_class = "highest-oi-change"
-            elif (oi_change or 0) > 0:
-                oi_change_class = "profit"
-            elif (oi_change or 0) < 0:
-                oi_change_class = "loss"
-            else:
-                oi_change_class = "neutral"
-
-            opportunities_html += f"""
-            <tr>
-                <td><b>{strike}</b></td>
-                <td>{option_type}</td>
-                <td>₹{ltp:.2f}</td>
-                <td class="{volume_class}">{volume_cr}</td>
-                <td class="{vol_change_class}">{vol_change_str}</td>
-                <td class="{oi_class}">{oi_cr}</td>
-                <td class="{oi_change_class}">{oi_change_str}</td>
-                <td>{oichp:.2f}%</td>
-                <td>
-                    <button class="btn btn-buy" onclick="addPosition({strike}, '{option_type}', {ltp})">Add Position</button>
-                </td>
-            </tr>
-            """
+        rows = np.flatnonzero(np.isin(chain["columns"]["strike_price"], strikes_to_show))
+        strikes = chain["columns"]["strike_price"][rows].tolist()
+        option_types = chain["types"][rows].tolist()
+        ltps = chain_column(chain, "ltp", rows)
+        volumes = chain_column(chain, "volume", rows)
+        ois = chain_column(chain, "oi", rows)
+        oichps = chain_column(chain, "oichp", rows)
+
+        # Look up all volume and OI changes in one pass
+        keys = [get_strike_key(strike, option_type) for strike, option_type in zip(strikes, option_types)]
+        vol_changes, oi_changes = get_change_matrix(index_name, keys, [vol_interval, oi_interval], (volumes, ois))
+        vol_changes, oi_changes = vol_changes[:, 0], oi_changes[:, 1]
+
+        # Highest values (only positive ones are highlighted)
+        highest_volume = highest_row(volumes)
+        highest_vol_change = highest_row(vol_changes)
+        highest_oi = highest_row(ois)
+        highest_oi_change = highest_row(oi_changes)
+
+        vol_change_classes = change_classes(vol_changes, highest_vol_change, "highest-vol-change")
+        oi_change_classes = change_classes(oi_changes, highest_oi_change, "highest-oi-change")
+
+        # One line per row and no empty class attributes: this goes out every tick
+        opportunities_html = "".join(
+            f"<tr><td><b>{strike}</b></td><td>{option_type}</td><td>₹{ltp:.2f}</td>"
+            f"<td{' class=highest-volume' if i == highest_volume else ''}>{format_to_crore(volume)}</td>"
+            f"<td class={vol_change_classes[i]}>{'N/A' if vol_change != vol_change else f'{vol_change:+,.0f}'}</td>"
+            f"<td{' class=highest-oi' if i == highest_oi else ''}>{format_to_crore(oi)}</td>"
+            f"<td class={oi_change_classes[i]}>{'N/A' if oi_change != oi_change else f'{oi_change:+,.0f}'}</td>"
+            f"<td>{oichp:.2f}%</td>"
+            f"<td><button class='btn btn-buy' onclick=\"addPosition({strike}, '{option_type}', {ltp})\">Add Position</button></td></tr>"
+            for i, (strike, option_type, ltp, volume, vol_change, oi, oi_change, oichp) in enumerate(zip(
+                strikes, option_types, ltps.tolist(), volumes.tolist(), vol_changes.tolist(),
+                ois.tolist(), oi_changes.tolist(), oichps.tolist())))
 
         total_pnl_str = f"₹{total_pnl:,.2f}" if total_pnl >= 0 else f"-₹{abs(total_pnl):,.2f}"
 
-        return json.dumps({
+        return {
             "positions": positions_html,
             "opportunities": opportunities_html,
             "active_count": len(active_positions),
             "total_pnl": total_pnl_str,
             "total_pnl_num": total_pnl,
             "spot_price": f"₹{spot_price:,.2f}"
-        })
+        }
 
     except Exception as e:
-        return json.dumps({
+        return {
             "positions": f"<tr><td colspan='7'>Error: {str(e)}</td></tr>",
             "opportunities": f"<tr><td colspan='9'>Error: {str(e)}</td></tr>",
             "active_count": 0,
             "total_pnl": "₹0.00",
             "total_pnl_num": 0,
             "spot_price": "-"
-        })
+        }
 
-@app.route("/chain")
-def fetch_option_chain():
-    global fyers
-    if fyers is None:
-        return "<h3>⚠ Please <a href='/login'>login</a> first!</h3>"
+def get_parsed_chain(index_name, wait=SNAPSHOT_WAIT):
+    """Parse the latest snapshot of an index, see parse_snapshot"""
+    snapshot = get_snapshot(index_name, wait)
+    return parse_snapshot(index_name, snapshot) if snapshot is not None else None
 
-    index_name = request.args.get("index", "NIFTY50")
-    vol_interval = int(request.args.get("vol_interval", 1))
-    oi_interval = int(request.args.get("oi_interval", 1))
-    symbol = symbols_map.get(index_name, "NSE:NIFTY50-INDEX")
+def parse_snapshot(index_name, snapshot):
+    """Parse a snapshot into typed columns indexed by strike and side, once per version
 
-    try:
-        table_html, spot_price, analysis_html, ce_headers, pe_headers = generate_full_table(index_name, symbol, vol_interval, oi_interval)
-    except Exception as e:
-        table_html = f"<p>Error fetching option chain: {str(e)}</p>"
-        spot_price = ""
-        analysis_html = ""
+    The parse and its IV warm starts are kept under the
+    snapshot's own chain key, whatever name it was asked for by.
+    """
+    index_name = snapshot["key"]
+    cached = parsed_chains.get(index_name)
+    if cached is not None and cached["version"] == snapshot["version"]:
+        return cached
+
+    started = time.perf_counter()
+    chain = parse_chain(snapshot["data"])
+    if chain is None:
+        return None
+    expiry = split_chain_key(index_name)[1]
+    if expiry is not None:
+        chain["expiry"] = expiry_close(expiry)
+    chain["contract_expiry"] = snapshot.get("expiry")
+    observe_stage("parse", index_name, started)
+    started = time.perf_counter()
+    chain["insights"] = chain_insights(chain, cached)
+    chain["insights"].update(oi_analytics(chain))
+    observe_stage("insights", index_name, started)
+    started = time.perf_counter()
+    chain["columns"].update(chain_greeks(index_name, chain))
+    observe_stage("greeks", index_name, started)
+    chain["version"] = snapshot["version"]
+    parsed_chains[index_name] = chain
+    return chain
+
+def parse_chain(data_section):
+    """Parse an optionchain data section into columns, strikes and per-side rows
+
+    Returns {"columns": {name: int64 or float64 array}, "types": option_type per
+    record, "strikes": sorted option strikes, "strike_values": the same as floats,
+    "rows": {"CE"/"PE": record row per strike, -1 when missing}, "spot": float,
+    "expiry": close time of the nearest expiry or None}, or None when there are no records.
+    """
+    options_data = data_section.get("optionsChain") or data_section.get("options_chain") or []
+    if not options_data:
+        return None
+
+    parsed = parse_chain_records(options_data)
+    columns, option_types = parsed if parsed is not None else parse_chain_frame(options_data)
+
+    # Only option rows carry strikes; the underlying's own row has strike -1
+    strike_column = columns["strike_price"]
+    strike_floats = strike_column.astype(float)
+    options = np.isin(option_types, ["CE", "PE"]) & ~np.isnan(strike_floats)
+    strikes = np.unique(strike_column[options])
+    strike_values = strikes.astype(float)
+
+    # First record of each strike on each side, aligned to the sorted strikes
+    rows = {}
+    for option_type in ("CE", "PE"):
+        side_rows = np.flatnonzero(options & (option_types == option_type))
+        side_strikes, first = np.unique(strike_floats[side_rows], return_index=True)
+        rows[option_type] = np.full(len(strikes), -1)
+        rows[option_type][np.searchsorted(strike_values, side_strikes)] = side_rows[first]
+
+    strikes_all = strikes.tolist()
+    spot_price = None
+    for key in ("underlying_value", "underlyingValue", "underlying", "underlying_value_instrument"):
+        if data_section.get(key) is not None:
+            try:
+                spot_price = float(data_section.get(key))
+                break
+            except Exception:
+                pass
+    if spot_price is None and "ltp" in columns:
+        # Fyers lists the underlying itself as a record without an option type
+        underlying = columns["ltp"][~np.isin(option_types, ["CE", "PE"])].astype(float)
+        underlying = underlying[underlying > 0]
+        spot_price = float(underlying[0]) if len(underlying) else None
+    if spot_price is None:
+        spot_price = float(strikes_all[len(strikes_all)//2]) if strikes_all else 0
+
+    return {"columns": columns, "types": option_types, "strikes": strikes_all, "strike_values": strike_values,
+            "rows": rows, "spot": spot_price, "expiry": nearest_expiry(data_section, get_mumbai_time().timestamp())}
 
-    html = f"""
+def parse_chain_records(options_data):
+    """Typed columns straight from Fyers records, None when a record is off-schema
+
+    A column stays int64 only when every record carries an integer for it, the
+    same dtypes pandas would infer; missing values become NaN in float64.
+    """
+    if not all(type(record) is dict and "strike_price" in record for record in options_data):
+        return None
+
+    columns = {}
+    for name in CHAIN_NUMERIC_COLUMNS:
+        values = [record.get(name) for record in options_data]
+        column = np.array(values)
+        if column.dtype.kind == "O":
+            if not any(name in record for record in options_data):
+                continue
+            try:
+                column = np.array(values, dtype=float)
+            except (TypeError, ValueError):
+                return None
+        elif column.dtype.kind not in "iuf":
+            return None
+        columns[name] = column
+    return columns, np.array([record.get("option_type", "") for record in options_data])
+
+def parse_chain_frame(options_data):
+    """Pandas fallback for records the fast parser does not recognise, giving the same columns"""
+    df = pd.json_normalize(options_data)
+    if "strike_price" not in df.columns:
+        possible_strike_cols = [c for c in df.columns if "strike" in c.lower()]
+        if possible_strike_cols:
+            df = df.rename(columns={possible_strike_cols[0]: "strike_price"})
+
+    columns = {name: pd.to_numeric(df[name], errors="coerce").to_numpy()
+               for name in CHAIN_NUMERIC_COLUMNS if name in df.columns}
+    columns.setdefault("strike_price", np.full(len(df), np.nan))
+    option_types = df["option_type"].to_numpy() if "option_type" in df.columns else np.full(len(df), "")
+    return columns, option_types
+
+def chain_column(chain, name, rows=None):
+    """Float values of a parsed column, zeros when the broker did not send it"""
+    column = chain["columns"].get(name)
+    if column is None:
+        return np.zeros(len(chain["types"]) if rows is None else len(rows))
+    return (column if rows is None else column[rows]).astype(float)
+
+def atm_position(strike_values, spot_price):
+    """Position of the sorted strike nearest spot, the lower one on a tie (0 when there are none)"""
+    upper = min(int(np.searchsorted(strike_values, spot_price)), max(len(strike_values) - 1, 0))
+    if upper > 0 and spot_price - strike_values[upper - 1] <= strike_values[upper] - spot_price:
+        return upper - 1
+    return upper
+
+def chain_rows(chain, strikes, option_types):
+    """Record row of each (strike, option_type) in a parsed chain, -1 when it is not listed"""
+    strikes = np.asarray(strikes, dtype=float)
+    option_types = np.asarray(option_types)
+    rows = np.full(len(strikes), -1)
+    strike_values = chain["strike_values"]
+    if len(strike_values) == 0:
+        return rows
+    found = np.minimum(np.searchsorted(strike_values, strikes), len(strike_values) - 1)
+    listed = strike_values[found] == strikes
+    for option_type, side_rows in chain["rows"].items():
+        matched = listed & (option_types == option_type)
+        rows[matched] = side_rows[found[matched]]
+    return rows
+
+def nearest_expiry(data_section, now):
+    """Close time (epoch seconds) of the nearest listed expiry still trading, None when none are listed"""
+    closes = [expiry_close(expiry) for _, expiry in listed_expiries(data_section)]
+    upcoming = [close for close in closes if close > now]
+    return min(upcoming) if upcoming else (max(closes) if closes else None)
+
+def expiry_close(expiry):
+    """Close time (epoch seconds) on the day of a broker expiry timestamp"""
+    ist = pytz.timezone('Asia/Kolkata')
+    day = datetime.fromtimestamp(float(expiry), ist).date()
+    return ist.localize(datetime(day.year, day.month, day.day, *EXPIRY_CLOSE)).timestamp()
+
+def norm_cdf(x):
+    """Standard normal CDF to double precision (Hart's rational approximation, as given by West)"""
+    z = np.abs(x)
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        exponential = np.exp(-z * z / 2)
+        near = exponential * ((((((0.0352624965998911 * z + 0.700383064443688) * z + 6.37396220353165) * z
+                                 + 33.912866078383) * z + 112.079291497871) * z + 221.213596169931) * z
+                              + 220.206867912376)
+        near /= (((((((0.0883883476483184 * z + 1.75566716318264) * z + 16.064177579207) * z + 86.7807322029461) * z
+                    + 296.564248779674) * z + 637.333633378831) * z + 793.826512519948) * z + 440.413735824752)
+        far = exponential / (z + 1 / (z + 2 / (z + 3 / (z + 4 / (z + 0.65))))) / 2.506628274631
+    tail = np.where(z > 37, 0.0, np.where(z < 7.07106781186547, near, far))
+    return np.where(x > 0, 1 - tail, tail)
+
+def norm_pdf(x):
+    return np.exp(-x * x / 2) / math.sqrt(2 * math.pi)
+
+def black_scholes(spot, strikes, years, vols, calls):
+    """Black-Scholes prices, vegas (per 1.00 of volatility), d1, N(d1) and N(d2) for arrays of European options"""
+    root = math.sqrt(years)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1 = (np.log(spot / strikes) + (RISK_FREE_RATE + vols * vols / 2) * years) / (vols * root)
+    n1, n2 = norm_cdf(np.concatenate([d1, d1 - vols * root])).reshape(2, -1)  # One pass for both
+    discounted = strikes * math.exp(-RISK_FREE_RATE * years)
+    call = spot * n1 - discounted * n2
+    prices = np.where(calls, call, call - spot + discounted)  # Puts by put-call parity
+    return prices, spot * norm_pdf(d1) * root, d1, n1, n2
+
+def implied_volatility(prices, spot, strikes, years, calls, guess=None):
+    """Volatility matching each market price, NaN where no volatility can
+
+    All options are solved together: each pass takes a Newton step per
+    option and falls back to bisecting its bracket wherever the step would
+    leave it, so deep ITM/OTM strikes with tiny vega still converge. Options
+    drop out of the batch as they converge. `guess` (e.g. the last tick's
+    IVs, NaN where unknown) seeds the search.
+    """
+    discounted = strikes * math.exp(-RISK_FREE_RATE * years)
+    intrinsic = np.where(calls, np.maximum(spot - discounted, 0), np.maximum(discounted - spot, 0))
+    ceiling = np.where(calls, spot, discounted)
+    solvable = (prices > intrinsic) & (prices < ceiling) & (strikes > 0)
+
+    low = np.full(len(prices), IV_BOUNDS[0])
+    high = np.full(len(prices), IV_BOUNDS[1])
+    vols = np.full(len(prices), IV_GUESS)
+    if guess is not None:
+        seeded = (guess > low) & (guess < high)
+        vols[seeded] = guess[seeded]
+
+    pending = np.flatnonzero(solvable)
+    for _ in range(IV_ITERATIONS):
+        if len(pending) == 0:
+            break
+        vol = vols[pending]
+        model, vega = black_scholes(spot, strikes[pending], years, vol, calls[pending])[:2]
+        error = model - prices[pending]
+        rich = error > 0
+        high[pending] = np.where(rich, vol, high[pending])
+        low[pending] = np.where(rich, low[pending], vol)
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            step = vol - error / vega
+        inside = (step > low[pending]) & (step < high[pending])
+        # A Newton step this small lands within tolerance without another pricing pass
+        converged = (np.abs(error) < IV_TOLERANCE) | (inside & (np.abs(step - vol) < IV_STEP_TOLERANCE))
+        vols[pending] = np.where(np.abs(error) < IV_TOLERANCE, vol,
+                                 np.where(inside, step, (low[pending] + high[pending]) / 2))
+        pending = pending[~converged & (high[pending] - low[pending] > 1e-9)]
+    return np.where(solvable, vols, np.nan)
+
+def option_greeks(spot, strikes, years, vols, calls):
+    """IV (%), delta, gamma, theta (per calendar day) and vega (per volatility point)"""
+    _, vega, d1, n1, n2 = black_scholes(spot, strikes, years, vols, calls)
+    root = math.sqrt(years)
+    density = norm_pdf(d1)
+    decay = -spot * density * vols / (2 * root)
+    carry = RISK_FREE_RATE * strikes * math.exp(-RISK_FREE_RATE * years)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gamma = density / (spot * vols * root)
+    return {
+        "iv": vols * 100,
+        "delta": np.where(calls, n1, n1 - 1),
+        "gamma": gamma,
+        "theta": np.where(calls, decay - carry * n2, decay + carry * (1 - n2)) / 365,
+        "vega": vega / 100,
+    }
+
+def chain_greeks(index_name, chain):
+    """IV and Greeks columns for every option record, warm-started from the index's last solve"""
+    columns = {name: np.full(len(chain["types"]), np.nan) for name in GREEK_COLUMNS}
+    if chain["expiry"] is None or "ltp" not in chain["columns"] or not chain["spot"]:
+        return columns
+
+    strike_values = chain["strike_values"]
+    years = max(chain["expiry"] - get_mumbai_time().timestamp(), MIN_EXPIRY_SECONDS) / YEAR_SECONDS
+    rows = np.concatenate([chain["rows"]["CE"], chain["rows"]["PE"]])
+    listed = rows >= 0
+    strikes = np.tile(strike_values, 2)
+    calls = np.repeat([True, False], len(strike_values))
+
+    # The last solve for the same strike and side is usually within a Newton step or two
+    guess = np.full(len(rows), np.nan)
+    previous = implied_vols.get(index_name)
+    if previous is not None and len(previous[0]):
+        old_strikes, old_vols = previous
+        found = np.minimum(np.searchsorted(old_strikes, strike_values), len(old_strikes) - 1)
+        guess = np.where(old_strikes[found] == strike_values, old_vols[:, found], np.nan).ravel()
+
+    prices = np.full(len(rows), np.nan)
+    prices[listed] = chain["columns"]["ltp"][rows[listed]]
+    vols = implied_volatility(prices, chain["spot"], strikes, years, calls, guess)
+    implied_vols[index_name] = (strike_values, vols.reshape(2, -1))
+
+    for name, values in option_greeks(chain["spot"], strikes[listed], years, vols[listed], calls[listed]).items():
+        columns[name][rows[listed]] = values
+    return columns
+
+def chain_block(chain):
+    """(side, strike, column) block of AGGREGATE_COLUMNS aligned to the sorted strikes, NaN where missing"""
+    table = np.column_stack([chain["columns"][c].astype(float) if c in chain["columns"]
+                             else np.full(len(chain["types"]), np.nan) for c in AGGREGATE_COLUMNS])
+    rows = np.stack([chain["rows"]["CE"], chain["rows"]["PE"]])
+    return np.where((rows >= 0)[..., None], table[rows], np.nan)
+
+def sum_aggregates(block, strikes):
+    """Aggregates of a block summed afresh"""
+    present = ~np.isnan(block)
+    return {"strikes": strikes, "block": block, "updates": 0,
+            "totals": np.where(present, block, 0).sum(axis=1),  # (side, column) sums of the values that are not NaN
+            "counts": present.sum(axis=1),  # (side, column) number of values that are not NaN
+            "max_oi": [highest_row(block[side, :, OI_COLUMN]) for side in (0, 1)]}
+
+def fold_aggregates(previous, block):
+    """Aggregates of `block` from the previous version's, moved by the cells that changed between them
+
+    None when the delta touches most of the chain, where summing afresh is cheaper.
+    """
+    old_block = previous["block"]
+    changed = (block != old_block) & ~(np.isnan(block) & np.isnan(old_block))
+    sides, positions, cols = np.nonzero(changed)
+    if len(sides) > changed.size // 4:
+        return None
+    old, new = old_block[changed], block[changed]
+    old_missing, new_missing = np.isnan(old), np.isnan(new)
+    cells = sides * len(AGGREGATE_COLUMNS) + cols
+    shape = previous["totals"].shape
+    deltas = np.where(new_missing, 0, new) - np.where(old_missing, 0, old)
+    totals = previous["totals"] + np.bincount(cells, deltas, block.shape[0] * block.shape[2]).reshape(shape)
+    moved = old_missing.astype(int) - new_missing
+    counts = previous["counts"] + np.bincount(cells, moved, block.shape[0] * block.shape[2]).reshape(shape).astype(int)
+
+    # The max-OI strike only needs a rescan when its own OI fell; otherwise a changed strike can only beat it
+    max_oi = list(previous["max_oi"])
+    oi_cells = cols == OI_COLUMN
+    for side in (0, 1):
+        touched = positions[oi_cells & (sides == side)]
+        if not len(touched):
+            continue
+        best = max_oi[side]
+        oi = block[side, :, OI_COLUMN]
+        if best is not None and best in touched and not oi[best] >= old_block[side, best, OI_COLUMN]:
+            max_oi[side] = highest_row(oi)
+            continue
+        candidates = touched if best is None else np.append(touched, best)
+        values = np.where(np.isnan(oi[candidates]), -np.inf, oi[candidates])
+        top = values.max()
+        if top > 0:
+            max_oi[side] = int(candidates[values == top].min())
+    return {"strikes": previous["strikes"], "block": block, "updates": previous["updates"] + 1,
+            "totals": totals, "counts": counts, "max_oi": max_oi}
+
+def chain_insights(chain, previous=None):
+    """JSON-ready totals, PCR, max-OI strikes and trend labels over the full chain
+
+    Totals, counts and max-OI strikes are carried over from `previous`, the
+    last parsed version of the same chain, and moved by the cells that changed
+    since. A new strike layout, a delta touching most of the chain or every
+    AGGREGATE_REBUILD versions sums the block afresh so float deltas cannot drift.
+    ITM totals depend on spot, so they are summed over their slice every time.
+    """
+    spot_price, strikes_all, strikes = chain["spot"], chain["strikes"], chain["strike_values"]
+    block = chain_block(chain)
+    aggregates = previous.get("aggregates") if previous is not None else None
+    if (aggregates is not None and aggregates["updates"] < AGGREGATE_REBUILD
+            and np.array_equal(aggregates["strikes"], strikes)):
+        aggregates = fold_aggregates(aggregates, block)
+    else:
+        aggregates = None
+    if aggregates is None:
+        aggregates = sum_aggregates(block, strikes)
+    chain["aggregates"] = aggregates
+    totals, counts = aggregates["totals"], aggregates["counts"]
+    names = [c for c in AGGREGATE_COLUMNS if c in chain["columns"]]
+    positions = [AGGREGATE_COLUMNS.index(c) for c in names]
+
+    # CE strikes below spot and PE strikes above it are in the money
+    below = np.searchsorted(strikes, spot_price)
+    above = np.searchsorted(strikes, spot_price, side="right")
+    itm = [np.nansum(block[0, :below], axis=0), np.nansum(block[1, above:], axis=0)]
+
+    def side_values(values):
+        return {name: float(values[i]) for name, i in zip(names, positions)}
+
+    ce_oi, pe_oi = totals[:, OI_COLUMN].tolist()
+    ce_vol, pe_vol = totals[:, AGGREGATE_COLUMNS.index("volume")].tolist()
+    ltpch = AGGREGATE_COLUMNS.index("ltpch")
+    ce_ltpch, pe_ltpch = [totals[side, ltpch] / counts[side, ltpch] if counts[side, ltpch] else math.nan
+                          for side in (0, 1)]
+    pcr = round(pe_oi / ce_oi, 2) if ce_oi > 0 else None
+    max_oi = [strikes_all[best] if best is not None else None for best in aggregates["max_oi"]]
+
+    return {
+        "spot": spot_price,
+        "atm_strike": strikes_all[atm_position(strikes, spot_price)] if strikes_all else None,
+        "strikes": len(strikes_all),
+        "totals": {"CE": side_values(totals[0]), "PE": side_values(totals[1]),
+                   "ALL": side_values(totals.sum(axis=0))},
+        "itm_totals": {"CE": side_values(itm[0]), "PE": side_values(itm[1])},
+        "pcr": pcr,
+        "support": max_oi[1],
+        "resistance": max_oi[0],
+        "volume_trend": "bullish" if ce_vol > pe_vol else "bearish",
+        "ltp_trend": ("falling" if ce_ltpch < 0 and pe_ltpch < 0 else
+                      "rising" if ce_ltpch > 0 and pe_ltpch > 0 else "sideways"),
+        "bias": None if pcr is None else "bearish" if pcr > 1 else "bullish" if pcr < 0.8 else "neutral",
+    }
+
+def side_column(chain, name, option_type):
+    """One side's column aligned to the sorted strikes, 0 where the strike or value is missing"""
+    rows = chain["rows"][option_type]
+    values = chain_column(chain, name, rows)
+    return np.where((rows >= 0) & ~np.isnan(values), values, 0.0)
+
+def oi_analytics(chain):
+    """Max pain, cumulative OI profiles and OI-weighted support/resistance bands for a full chain
+
+    Everything is a handful of cumulative sums over the strike-aligned CE/PE
+    columns, so max pain costs O(n) rather than pricing every strike's payout
+    at every other strike.
+    """
+    strikes, strikes_all, spot_price = chain["strike_values"], chain["strikes"], chain["spot"]
+    ce_oi, pe_oi = side_column(chain, "oi", "CE"), side_column(chain, "oi", "PE")
+    ce_oich, pe_oich = side_column(chain, "oich", "CE"), side_column(chain, "oich", "PE")
+
+    # Payout to option holders if expiry settles at strike j:
+    #   calls below j pay sum(ce_i * (K_j - K_i)) = K_j * (CE OI below) - (CE OI x strike below)
+    #   puts above j pay sum(pe_i * (K_i - K_j)) = (PE OI x strike above) - K_j * (PE OI above)
+    ce_below = np.cumsum(ce_oi) - ce_oi
+    ce_value_below = np.cumsum(ce_oi * strikes) - ce_oi * strikes
+    pe_above = pe_oi.sum() - np.cumsum(pe_oi)
+    pe_value_above = (pe_oi * strikes).sum() - np.cumsum(pe_oi * strikes)
+    payouts = strikes * ce_below - ce_value_below + pe_value_above - strikes * pe_above
+    max_pain = strikes_all[int(np.argmin(payouts))] if (ce_oi.any() or pe_oi.any()) else None
+
+    # Put writers defend strikes at or below spot, call writers those at or above it
+    below, above = strikes <= spot_price, strikes >= spot_price
+    support_band = oi_band([s for s, keep in zip(strikes_all, below.tolist()) if keep], strikes[below], pe_oi[below])
+    resistance_band = oi_band([s for s, keep in zip(strikes_all, above.tolist()) if keep], strikes[above], ce_oi[above])
+
+    return {
+        "max_pain": max_pain,
+        "support_band": support_band,
+        "resistance_band": resistance_band,
+        "oi_profile": {
+            "strikes": strikes_all,
+            "ce_oi": ce_oi.tolist(),
+            "pe_oi": pe_oi.tolist(),
+            # Running totals from the lowest strike up
+            "ce_oi_cumulative": np.cumsum(ce_oi).tolist(),
+            "pe_oi_cumulative": np.cumsum(pe_oi).tolist(),
+            "ce_oich_cumulative": np.cumsum(ce_oich).tolist(),
+            "pe_oich_cumulative": np.cumsum(pe_oich).tolist(),
+        },
+    }
+
+def oi_band(strikes_all, strikes, weights):
+    """Strikes holding the middle OI_BAND share of the OI, and the OI-weighted mean strike"""
+    total = weights.sum()
+    if total <= 0:
+        return None
+    low, high = np.searchsorted(np.cumsum(weights) / total, OI_BAND)
+    return {"low": strikes_all[min(low, len(strikes_all) - 1)], "high": strikes_all[min(high, len(strikes_all) - 1)],
+            "center": round(float((weights * strikes).sum() / total), 2)}
+
+def highest_row(values):
+    """Position of the first largest positive value, None when nothing is positive"""
+    if len(values) == 0:
+        return None
+    values = np.where(np.isnan(values), -np.inf, values)
+    best = int(np.argmax(values))
+    return best if values[best] > 0 else None
+
+def change_classes(changes, highest, highest_class):
+    """CSS class per row for a change column, highlighting the highest one"""
+    classes = np.where(changes > 0, "profit", np.where(changes < 0, "loss", "neutral")).tolist()
+    if highest is not None:
+        classes[highest] = highest_class
+    return classes
+
+CHAIN_PAGE = app.jinja_env.from_string("""
     <!doctype html>
     <html>
     <head>
-        <title>{index_name} Option Chain (ATM ±3)</title>
+        <title>{{ index_name }} Option Chain ({{ strikes_label }})</title>
         <style>
-            body {{ font-family: Arial, sans-serif; padding: 16px; }}
-            h2 {{ text-align:center; color:#1a73e8; }}
-            table {{ width:100%; border-collapse: collapse; font-size:12px; }}
-            th, td {{ border:1px solid #ddd; padding:6px; text-align:center; }}
-            th {{ background:#1a73e8; color:#fff; }}
-            tr:nth-child(even) {{ background:#f7f7f7; }}
-            .dropdown {{ margin:12px 0; text-align:center; }}
-            #analysis {{ background:#eef; padding:10px; border-radius:5px; margin-top:15px; }}
-            .profit {{ color: #0f9d58; font-weight: bold; }}
-            .loss {{ color: #db4437; font-weight: bold; }}
-            .neutral {{ color: #666; }}
-            .interval-selector {{ display: inline-block; margin: 0 10px; }}
-            .interval-selector label {{ font-weight: bold; margin-right: 5px; }}
-            .interval-selector select {{ padding: 5px; border-radius: 4px; }}
+            body { font-family: Arial, sans-serif; padding: 16px; }
+            h2 { text-align:center; color:#1a73e8; }
+            table { width:100%; border-collapse: collapse; font-size:12px; }
+            th, td { border:1px solid #ddd; padding:6px; text-align:center; }
+            th { background:#1a73e8; color:#fff; }
+            tr:nth-child(even) { background:#f7f7f7; }
+            .dropdown { margin:12px 0; text-align:center; }
+            #analysis { background:#eef; padding:10px; border-radius:5px; margin-top:15px; }
+            .profit { color: #0f9d58; font-weight: bold; }
+            .loss { color: #db4437; font-weight: bold; }
+            .neutral { color: #666; }
+            .interval-selector { display: inline-block; margin: 0 10px; }
+            .interval-selector label { font-weight: bold; margin-right: 5px; }
+            .interval-selector select { padding: 5px; border-radius: 4px; }
+            tr.atm, tr.tot, tr.itm, tr.all { font-weight: bold; }
+            tr.atm { background-color: #ffeb3b; }
+            tr.tot { background-color: #c8e6c9; }
+            tr.itm { background-color: #b3e5fc; }
+            tr.all { background-color: #ffd699; }
         </style>
     </head>
     <body>
-        <h2 id="spot-title">{index_name} Option Chain (ATM ±3) — Spot: {spot_price}</h2>
+        <h2 id="spot-title">{{ index_name }} Option Chain ({{ strikes_label }}) — Spot: -</h2>
 
         <div class="dropdown">
             <form method="get" action="/chain">
                 <label for="index">Select Index: </label>
                 <select name="index" id="index" onchange="this.form.submit()">
-                    <option value="NIFTY50" {"selected" if index_name=="NIFTY50" else ""}>NIFTY50</option>
-                    <option value="BANKNIFTY" {"selected" if index_name=="BANKNIFTY" else ""}>BANKNIFTY</option>
-                    <option value="FINNIFTY" {"selected" if index_name=="FINNIFTY" else ""}>FINNIFTY</option>
-                    <option value="MIDCAPNIFTY" {"selected" if index_name=="MIDCAPNIFTY" else ""}>MIDCAPNIFTY</option>
-                    <option value="SENSEX" {"selected" if index_name=="SENSEX" else ""}>SENSEX</option>
+                    <option value="NIFTY50" {{ "selected" if index_name == "NIFTY50" }}>NIFTY50</option>
+                    <option value="BANKNIFTY" {{ "selected" if index_name == "BANKNIFTY" }}>BANKNIFTY</option>
+                    <option value="FINNIFTY" {{ "selected" if index_name == "FINNIFTY" }}>FINNIFTY</option>
+                    <option value="MIDCAPNIFTY" {{ "selected" if index_name == "MIDCAPNIFTY" }}>MIDCAPNIFTY</option>
+                    <option value="SENSEX" {{ "selected" if index_name == "SENSEX" }}>SENSEX</option>
                 </select>
 
+                <div class="interval-selector">
+                    <label for="expiry">Expiry:</label>
+                    <select name="expiry" id="expiry" onchange="this.form.submit()">
+                        {% for label, timestamp in expiries %}
+                        <option value="{{ "" if loop.first else timestamp }}" {{ "selected" if timestamp == expiry or (loop.first and not expiry) }}>
+                            {{ label }}{{ " (nearest)" if loop.first }}</option>
+                        {% else %}<option value="">Nearest</option>{% endfor %}
+                    </select>
+                </div>
+
                 <div class="interval-selector">
                     <label for="vol_interval">Volume Δ:</label>
                     <select name="vol_interval" id="vol_interval" onchange="this.form.submit()">
-                        <option value="1" {"selected" if vol_interval==1 else ""}>1 min</option>
-                        <option value="2" {"selected" if vol_interval==2 else ""}>2 min</option>
-                        <option value="5" {"selected" if vol_interval==5 else ""}>5 min</option>
-                        <option value="10" {"selected" if vol_interval==10 else ""}>10 min</option>
+                        {{ interval_options(vol_interval)|safe }}
                     </select>
                 </div>
 
                 <div class="interval-selector">
                     <label for="oi_interval">OI Δ:</label>
                     <select name="oi_interval" id="oi_interval" onchange="this.form.submit()">
-                        <option value="1" {"selected" if oi_interval==1 else ""}>1 min</option>
-                        <option value="2" {"selected" if oi_interval==2 else ""}>2 min</option>
-                        <option value="5" {"selected" if oi_interval==5 else ""}>5 min</option>
-                        <option value="10" {"selected" if oi_interval==10 else ""}>10 min</option>
+                        {{ interval_options(oi_interval)|safe }}
+                    </select>
+                </div>
+
+                <div class="interval-selector">
+                    <label for="window">Strikes:</label>
+                    <select name="window" id="window" onchange="this.form.submit()">
+                        {% for w in CHAIN_WINDOWS %}<option value="{{ w }}" {{ "selected" if w == window }}>{{ "ATM ±%d" % w if w else "Full chain" }}</option>{% endfor %}
                     </select>
                 </div>
             </form>
         </div>
 
         <table id="option-chain-table">
-            <thead><tr>{ce_headers}<th>STRIKE</th>{pe_headers}</tr></thead>
-            <tbody>{table_html}</tbody>
+            <thead><tr>{{ ce_headers|safe }}<th>STRIKE</th>{{ pe_headers|safe }}</tr></thead>
+            <tbody><tr><td colspan="{{ column_count }}">Loading...</td></tr></tbody>
         </table>
 
-        <div id="analysis">{analysis_html}</div>
+        <div id="analysis"></div>
 
         <script>
-            const indexName = "{index_name}";
-            const volInterval = {vol_interval};
-            const oiInterval = {oi_interval};
-
-            async function refreshTableRows() {{
-                try {{
-                    const resp = await fetch(`/chain_rows_diff?index=${{indexName}}&vol_interval=${{volInterval}}&oi_interval=${{oiInterval}}`);
-                    const result = await resp.json();
-                    if (result.rows) {{
-                        document.querySelector("#option-chain-table tbody").innerHTML = result.rows;
-                        document.querySelector("#spot-title").innerHTML = `${{indexName}} Option Chain (ATM ±3) — Spot: ${{result.spot}}`;
-                        document.querySelector("#analysis").innerHTML = result.analysis;
-                    }}
-                }} catch (err) {{
+            const indexName = "{{ index_name }}";
+            const expiry = "{{ expiry }}";
+            const volInterval = {{ vol_interval }};
+            const oiInterval = {{ oi_interval }};
+            const strikeWindow = {{ window }};
+            let chainVersion = null;
+
+            async function refreshTableRows() {
+                try {
+                    const resp = await fetch(`/chain_rows_diff?index=${indexName}&expiry=${expiry}&vol_interval=${volInterval}&oi_interval=${oiInterval}&window=${strikeWindow}&since=${chainVersion ?? ""}`);
+                    applyRows(await resp.json());
+                } catch (err) {
                     console.error("Error refreshing rows:", err);
-                }}
-            }}
-            setInterval(refreshTableRows, 1000);
+                }
+            }
+
+            function applyRows(result) {
+                const tbody = document.querySelector("#option-chain-table tbody");
+                if (result.full) {
+                    tbody.innerHTML = result.rows;
+                } else {
+                    // Patch only the cells that changed since our version
+                    for (const [row, col, html] of result.cells) {
+                        tbody.rows[row].cells[col].outerHTML = html;
+                    }
+                }
+                if (result.analysis !== undefined) {
+                    document.querySelector("#analysis").innerHTML = result.analysis;
+                }
+                document.querySelector("#spot-title").innerHTML = `${indexName} Option Chain ({{ strikes_label }}) — Spot: ${result.spot}`;
+                chainVersion = result.version;
+            }
+
+            if (window.EventSource) {
+                const source = new EventSource(`/stream?view=chain&index=${indexName}&expiry=${expiry}&vol_interval=${volInterval}&oi_interval=${oiInterval}&window=${strikeWindow}&since=${chainVersion ?? ""}`);
+                source.onmessage = (event) => applyRows(JSON.parse(event.data));
+            } else {
+                setInterval(refreshTableRows, 1000);
+                refreshTableRows();
+            }
         </script>
     </body>
     </html>
-    """
-    return render_template_string(html)
+    """)
+
+@app.route("/chain")
+def fetch_option_chain():
+    global fyers
+    if fyers is None:
+        return "<h3>⚠ Please <a href='/login'>login</a> first!</h3>"
+
+    index_name = chain_index(request.args.get("index", "NIFTY50"))
+    note_view(index_name)
+    vol_interval = int(request.args.get("vol_interval", 1))
+    oi_interval = int(request.args.get("oi_interval", 1))
+    window = int(request.args.get("window", CHAIN_WINDOW))
+    strikes_label = f"ATM ±{window}" if window else "Full Chain"
+    get_snapshot(index_name)  # The expiry list arrives with the first nearest-expiry snapshot
+    key = chain_key(index_name, request.args.get("expiry"))
+    note_view(key)
+    # The page is a shell with no live data, so it is cacheable; rows arrive over /stream or polling
+    ce_headers, pe_headers = generate_headers(vol_interval, oi_interval)
+    column_count = 2 * ce_headers.count("<th>") + 1
+    return shell_response(CHAIN_PAGE, index_name=index_name, vol_interval=vol_interval, oi_interval=oi_interval,
+                          window=window, strikes_label=strikes_label, ce_headers=ce_headers, pe_headers=pe_headers,
+                          column_count=column_count, expiry=split_chain_key(key)[1] or "",
+                          expiries=tuple(get_expiries(index_name)))
 
 @app.route("/chain_rows_diff")
 def chain_rows_diff():
-    global previous_data
-    index_name = request.args.get("index", "NIFTY50")
+    index_name = chain_key(request.args.get("index", "NIFTY50"), request.args.get("expiry"))
+    note_view(index_name)
     vol_interval = int(request.args.get("vol_interval", 1))
     oi_interval = int(request.args.get("oi_interval", 1))
-    symbol = symbols_map.get(index_name, "NSE:NIFTY50-INDEX")
-
-    rows_html, spot_price, analysis_html, _, _ = generate_rows(index_name, symbol, vol_interval, oi_interval)
-
-    current_data = {"rows": rows_html, "analysis": analysis_html}
-
-    diff_rows = ""
-    if previous_data.get(index_name) != current_data["rows"]:
-        diff_rows = current_data["rows"]
-        previous_data[index_name] = current_data["rows"]
-
-    return json.dumps({"rows": diff_rows, "spot": spot_price, "analysis": analysis_html})
-
-def generate_full_table(index_name, symbol, vol_interval, oi_interval):
-    rows_html, spot_price, analysis_html, ce_headers, pe_headers = generate_rows(index_name, symbol, vol_interval, oi_interval)
-    return rows_html, spot_price, analysis_html, ce_headers, pe_headers
-
-def generate_rows(index_name, symbol, vol_interval, oi_interval):
-    global fyers
-    data = {"symbol": symbol, "strikecount": 50}
-    response = fyers.optionchain(data=data)
-    data_section = response.get("data", {}) if isinstance(response, dict) else {}
-    options_data = data_section.get("optionsChain") or data_section.get("options_chain") or []
-
-    if not options_data:
-        return "", "", "<p>No option chain data available.</p>", "", ""
-
-    df = pd.json_normalize(options_data)
-    if "strike_price" not in df.columns:
-        possible_strike_cols = [c for c in df.columns if "strike" in c.lower()]
-        if possible_strike_cols:
-            df = df.rename(columns={possible_strike_cols[0]: "strike_price"})
-
-    num_cols = ["strike_price", "ask", "bid", "ltp", "oi", "oich", "oichp", "prev_oi", "volume", "ltpch"]
-    for col in num_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    spot_price = None
-    for key in ("underlying_value", "underlyingValue", "underlying", "underlying_value_instrument"):
-        if data_section.get(key) is not None:
-            try:
-                spot_price = float(data_section.get(key))
-                break
-            except Exception:
-                pass
-
-    strikes_all = sorted(df["strike_price"].dropna().unique())
-    if spot_price is None:
-        spot_price = float(strikes_all[len(strikes_all)//2]) if strikes_all else 0
-
-    atm_strike = min(strikes_all, key=lambda s: abs(s - spot_price)) if strikes_all else 0
-    atm_index = strikes_all.index(atm_strike) if atm_strike in strikes_all else 0
-    low = max(0, atm_index - 3)
-    high = min(len(strikes_all), atm_index + 4)
-    strikes_to_show = strikes_all[low:high] if strikes_all else []
-
-    df = df[df["strike_price"].isin(strikes_to_show)]
-    ce_df = df[df["option_type"] == "CE"].set_index("strike_price", drop=False) if "option_type" in df.columns else pd.DataFrame()
-    pe_df = df[df["option_type"] == "PE"].set_index("strike_price", drop=False) if "option_type" in df.columns else pd.DataFrame()
-
-    lr_cols = [c for c in ["ask", "bid", "ltp", "ltpch", "volume", "vol_change", "oi", "oi_change", "oich", "oichp", "prev_oi"] if c in df.columns or c in ["vol_change", "oi_change"]]
-
-    ce_itm_df = ce_df[ce_df["strike_price"] < spot_price] if not ce_df.empty else pd.DataFrame()
-    pe_itm_df = pe_df[pe_df["strike_price"] > spot_price] if not pe_df.empty else pd.DataFrame()
-
-    rows_html = ""
-    for strike in strikes_to_show:
-        ce_cells = ""
-        pe_cells = ""
-
-        for c in lr_cols:
-            if c == "vol_change":
-                # CE Volume Change
-                if not ce_df.empty and strike in ce_df.index:
-                    ce_volume = ce_df.loc[strike, "volume"] if "volume" in ce_df.columns else 0
-                    update_historical_data(index_name, strike, "CE", ce_volume, ce_df.loc[strike, "oi"] if "oi" in ce_df.columns else 0)
-                    vol_change, _ = get_change_data(index_name, strike, "CE", vol_interval)
-                    if vol_change is not None:
-                        vol_class = "profit" if vol_change > 0 else ("loss" if vol_change < 0 else "neutral")
-                        ce_cells += f"<td class='{vol_class}'>{vol_change:+,.0f}</td>"
-                    else:
-                        ce_cells += "<td>-</td>"
-                else:
-                    ce_cells += "<td>-</td>"
-
-                # PE Volume Change
-                if not pe_df.empty and strike in pe_df.index:
-                    pe_volume = pe_df.loc[strike, "volume"] if "volume" in pe_df.columns else 0
-                    update_historical_data(index_name, strike, "PE", pe_volume, pe_df.loc[strike, "oi"] if "oi" in pe_df.columns else 0)
-                    vol_change, _ = get_change_data(index_name, strike, "PE", vol_interval)
-                    if vol_change is not None:
-                        vol_class = "profit" if vol_change > 0 else ("loss" if vol_change < 0 else "neutral")
-                        pe_cells += f"<td class='{vol_class}'>{vol_change:+,.0f}</td>"
-                    else:
-                        pe_cells += "<td>-</td>"
-                else:
-                    pe_cells += "<td>-</td>"
-
-            elif c == "oi_change":
-                # CE OI Change
-                if not ce_df.empty and strike in ce_df.index:
-                    _, oi_change = get_change_data(index_name, strike, "CE", oi_interval)
-                    if oi_change is not None:
-                        oi_class = "profit" if oi_change > 0 else ("loss" if oi_change < 0 else "neutral")
-                        ce_cells += f"<td class='{oi_class}'>{oi_change:+,.0f}</td>"
-                    else:
-                        ce_cells += "<td>-</td>"
-                else:
-                    ce_cells += "<td>-</td>"
-
-                # PE OI Change
-                if not pe_df.empty and strike in pe_df.index:
-                    _, oi_change = get_change_data(index_name, strike, "PE", oi_interval)
-                    if oi_change is not None:
-                        oi_class = "profit" if oi_change > 0 else ("loss" if oi_change < 0 else "neutral")
-                        pe_cells += f"<td class='{oi_class}'>{oi_change:+,.0f}</td>"
-                    else:
-                        pe_cells += "<td>-</td>"
+    window = int(request.args.get("window", CHAIN_WINDOW))
+    since = request.args.get("since", type=int)
+
+    # The ETag names the version of the frame the body is built from, which may be newer than a snapshot read earlier
+    frames, frame = get_chain_frame(index_name, vol_interval, oi_interval, window)
+    etag = f"{SERVER_EPOCH}-chain-{index_name}-{vol_interval}-{oi_interval}-{window}-{since}-{frame['version']}"
+    return conditional_response(
+        etag, lambda: chain_delta_body(index_name, vol_interval, oi_interval, window, since, frames, frame))
+
+def chain_delta_body(index_name, vol_interval, oi_interval, window, since, frames, frame):
+    """The chain update from `frame` for clients holding `since` as JSON, built once per view and frame version"""
+    return render_cache.get(
+        ("chain", index_name, vol_interval, oi_interval, window, since), frame["version"],
+        lambda: compact_json(build_chain_delta(frames, frame, since)))
+
+def get_chain_frame(index_name, vol_interval, oi_interval, window=CHAIN_WINDOW):
+    """Return (recent frames, latest frame) for a view, rendering each frame version once"""
+    snapshot = get_snapshot(index_name)
+    version = frame_version(index_name, snapshot)
+    view = (index_name, vol_interval, oi_interval, window)
+    with frames_lock:
+        frames = chain_frames.get(view)
+        if frames and frames[-1]["version"] >= version:
+            chain_frames.move_to_end(view)
+            return list(frames), frames[-1]
+        view_lock = frame_locks.setdefault(view, threading.Lock())
+
+    with view_lock:
+        # Another viewer may have rendered this version while we waited
+        with frames_lock:
+            frames = chain_frames.get(view)
+            if frames and frames[-1]["version"] >= version:
+                return list(frames), frames[-1]
+
+        frame = render_chain_frame(snapshot, index_name, vol_interval, oi_interval, window)
+        with frames_lock:
+            frames = chain_frames.setdefault(view, deque(maxlen=FRAME_HISTORY))
+            chain_frames.move_to_end(view)
+            if not frames or frames[-1]["version"] < frame["version"]:
+                frames.append(frame)
+            while len(chain_frames) > MAX_FRAME_VIEWS:
+                evicted, _ = chain_frames.popitem(last=False)
+                frame_locks.pop(evicted, None)
+            return list(frames), frames[-1]
+
+def diff_chain_frames(base, frame):
+    """List [row, column, html] for every cell that changed, None if the layout changed"""
+    if base["styles"] != frame["styles"] or [len(r) for r in base["grid"]] != [len(r) for r in frame["grid"]]:
+        return None
+
+    cells = []
+    for r, (old_row, new_row) in enumerate(zip(base["grid"], frame["grid"])):
+        if old_row != new_row:
+            cells.extend([r, c, html] for c, (old, html) in enumerate(zip(old_row, new_row)) if old != html)
+    return cells
+
+def build_chain_delta(frames, frame, since=None):
+    """Build the update to `frame` for a client holding version `since`
+
+    Sends only the changed cells when the client's version is still in the
+    view's frame history, and a full frame when it is unknown or too far behind.
+    """
+    payload = {"version": frame["version"], "spot": frame["spot"]}
+    if since == frame["version"]:
+        payload["cells"] = []
+        return payload
+
+    base = next((f for f in frames if f["version"] == since), None)
+    cells = diff_chain_frames(base, frame) if base is not None else None
+    if cells is None:
+        payload.update(full=True, rows=frame_rows_html(frame), analysis=frame["analysis"])
+    else:
+        payload["cells"] = cells
+        if base["analysis"] != frame["analysis"]:
+            payload["analysis"] = frame["analysis"]
+    return payload
+
+@app.route("/stream")
+def stream():
+    """Push chain or scalping updates to the client whenever a new snapshot lands"""
+    view = request.args.get("view", "chain")
+    index_name = chain_index(request.args.get("index", "NIFTY50"))
+    vol_interval = int(request.args.get("vol_interval", 1))
+    oi_interval = int(request.args.get("oi_interval", 1))
+    window = int(request.args.get("window", SCALPING_WINDOW if view == "scalping" else CHAIN_WINDOW))
+    # EventSource resends the last id on reconnect, so resume from there when present
+    since = request.headers.get("Last-Event-ID", type=int) or request.args.get("since", type=int)
+    key = chain_key(index_name, request.args.get("expiry"))
+
+    def events():
+        start_pollers()
+        with state_lock:
+            stream_clients[index_name] = stream_clients.get(index_name, 0) + 1
+        last_version = since
+        try:
+            while True:
+                note_view(key)
+                with snapshot_condition:
+                    # Samples land without a notification, so changes they alone bring go out at the keepalive
+                    snapshot_condition.wait_for(
+                        lambda: frame_version(key, chain_snapshots.get(key)) != last_version,
+                        timeout=STREAM_KEEPALIVE
+                    )
+                    snapshot = chain_snapshots.get(key)
+
+                version = frame_version(key, snapshot)
+                if snapshot is None or version == last_version:
+                    yield ": keepalive\n\n"
+                    continue
+
+                # Every client of a view shares one rendered body per version
+                if view == "scalping":
+                    position_book.sync()
+                    body = scalping_body(key, vol_interval, oi_interval, window,
+                                         (version, position_book.fingerprint(position_contract(key))))
+                    last_version = version
                 else:
-                    pe_cells += "<td>-</td>"
-            else:
-                ce_val = ce_df.loc[strike, c] if (not ce_df.empty and strike in ce_df.index and c in ce_df.columns) else ""
-                pe_val = pe_df.loc[strike, c] if (not pe_df.empty and strike in pe_df.index and c in pe_df.columns) else ""
-
-                # Format volume and OI in crore
-                if c == "volume" and ce_val != "":
-                    ce_val = format_to_crore(ce_val)
-                if c == "volume" and pe_val != "":
-                    pe_val = format_to_crore(pe_val)
-                if c == "oi" and ce_val != "":
-                    ce_val = format_to_crore(ce_val)
-                if c == "oi" and pe_val != "":
-                    pe_val = format_to_crore(pe_val)
+                    # The frame may be newer than the snapshot that woke us; its version labels the body
+                    frames, frame = get_chain_frame(key, vol_interval, oi_interval, window)
+                    body = chain_delta_body(key, vol_interval, oi_interval, window, last_version, frames, frame)
+                    last_version = frame["version"]
+                yield f"id: {last_version}\ndata: {body}\n\n"
+        finally:
+            with state_lock:
+                stream_clients[index_name] -= 1
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+OVERVIEW_PAGE = app.jinja_env.from_string("""
+    <!doctype html>
+    <html>
+    <head>
+        <title>All Indices Overview</title>
+        <style>
+            body { font-family: Arial, sans-serif; padding: 16px; }
+            h2 { text-align:center; color:#1a73e8; }
+            table { width:100%; border-collapse: collapse; font-size:13px; }
+            th, td { border:1px solid #ddd; padding:8px; text-align:center; }
+            th { background:#1a73e8; color:#fff; }
+            tr:nth-child(even) { background:#f7f7f7; }
+            .profit { color: #0f9d58; font-weight: bold; }
+            .loss { color: #db4437; font-weight: bold; }
+            #refresh { text-align:center; color:#666; margin-top:10px; }
+        </style>
+    </head>
+    <body>
+        <h2>🌐 All Indices Overview</h2>
+        <table>
+            <thead>
+                <tr>
+                    <th>Index</th><th>Spot</th><th>ATM</th><th>CE OI (Cr)</th><th>PE OI (Cr)</th><th>PCR</th>
+                    <th>CE Volume (Cr)</th><th>PE Volume (Cr)</th><th>Support (PE OI)</th><th>Resistance (CE OI)</th>
+                    <th>Max Pain</th><th>Data Age</th><th>Links</th>
+                </tr>
+            </thead>
+            <tbody id="overview-body"><tr><td colspan="13">Loading...</td></tr></tbody>
+        </table>
+        <div id="refresh"></div>
 
-                ce_cells += f"<td>{ce_val}</td>"
-                pe_cells += f"<td>{pe_val}</td>"
+        <script>
+            async function refreshOverview() {
+                try {
+                    const resp = await fetch("/overview_data");
+                    const data = await resp.json();
+                    document.getElementById("overview-body").innerHTML = data.rows;
+                    document.getElementById("refresh").innerText = data.refresh;
+                } catch (err) {
+                    console.error("Error refreshing overview:", err);
+                }
+            }
+            setInterval(refreshOverview, 1000);
+            refreshOverview();
+        </script>
+    </body>
+    </html>
+    """)
 
-        row_style = "style='background-color: #ffeb3b; font-weight: bold;'" if strike == atm_strike else ""
-        rows_html += f"<tr {row_style}>{ce_cells}<td><b>{strike}</b></td>{pe_cells}</tr>"
+@app.route("/overview")
+def overview():
+    if fyers is None:
+        return "<h3>⚠ Please <a href='/login'>login</a> first!</h3>"
+    start_pollers()
+    return OVERVIEW_PAGE.render()
+
+@app.route("/overview_data")
+def overview_data():
+    start_pollers()
+    rows = "".join(overview_row(index_name) for index_name in symbols_map)
+    refresh = "Waiting for first refresh..."
+    if fetch_stats:
+        refresh = (f"Last broker batch {fetch_stats['finished']} IST: {fetch_stats['indices']} indices in "
+                   f"{fetch_stats['wall_ms']:.0f} ms after {fetch_stats['queue_ms']:.0f} ms queueing")
+    return json.dumps({"rows": rows, "refresh": refresh})
+
+def overview_row(index_name):
+    """One overview table row summarising an index's full chain"""
+    links = (f"<a href='/chain?index={index_name}' target='_blank'>Chain</a> | "
+             f"<a href='/scalping?index={index_name}' target='_blank'>Scalping</a>")
+    chain = get_parsed_chain(index_name, wait=0)
+    if chain is None:
+        status = poll_errors.get(index_name, "Waiting for data...")
+        return f"<tr><td><b>{index_name}</b></td><td colspan='11'>{status}</td><td>{links}</td></tr>"
+
+    insights = chain["insights"]
+    totals, spot_price, pcr = insights["totals"], insights["spot"], insights["pcr"]
+    pcr_class = "loss" if pcr is not None and pcr > 1 else ("profit" if pcr is not None and pcr < 0.8 else "")
+    ce_oi, pe_oi = totals["CE"].get("oi", 0), totals["PE"].get("oi", 0)
+    ce_vol, pe_vol = totals["CE"].get("volume", 0), totals["PE"].get("volume", 0)
+    atm_strike, support, resistance, max_pain = ("-" if insights[key] is None else insights[key]
+                                                 for key in ("atm_strike", "support", "resistance", "max_pain"))
+    snapshot = chain_snapshots.get(index_name)
+    age = f"{get_mumbai_time().timestamp() - snapshot['timestamp']:.1f}s" if snapshot else "-"
+    if index_name in poll_errors:
+        age += f" ⚠ {poll_errors[index_name]}"
+
+    return (f"<tr><td><b>{index_name}</b></td><td>{spot_price:,.2f}</td><td>{atm_strike}</td>"
+            f"<td>{format_to_crore(ce_oi)}</td><td>{format_to_crore(pe_oi)}</td><td class='{pcr_class}'>{pcr}</td>"
+            f"<td>{format_to_crore(ce_vol)}</td><td>{format_to_crore(pe_vol)}</td><td>{support}</td><td>{resistance}</td>"
+            f"<td>{max_pain}</td><td>{age}</td><td>{links}</td></tr>")
+
+def frame_rows_html(frame):
+    """Join a rendered frame into <tr> rows"""
+    return "".join([f"<tr {style}>{''.join(cells)}</tr>" for style, cells in zip(frame["styles"], frame["grid"])])
+
+def render_chain_frame(snapshot, index_name, vol_interval, oi_interval, window=CHAIN_WINDOW):
+    """Render one snapshot into row styles, a grid of <td> cells, spot and analysis"""
+    version = frame_version(index_name, snapshot)
+    chain = parse_snapshot(index_name, snapshot) if snapshot else None
+
+    if chain is None:
+        return {"version": version, "styles": [], "grid": [], "spot": "",
+                "analysis": "<p>No option chain data available.</p>", "ce_headers": "", "pe_headers": ""}
+
+    started = time.perf_counter()
+    spot_price, strikes_all = chain["spot"], chain["strikes"]
+    atm_index = atm_position(chain["strike_values"], spot_price)
+    atm_strike = strikes_all[atm_index] if strikes_all else 0
+    if window:
+        low = max(0, atm_index - window)
+        high = min(len(strikes_all), atm_index + window + 1)
+    else:
+        low, high = 0, len(strikes_all)
+    strikes_to_show = strikes_all[low:high]
+    strikes = chain["strike_values"][low:high]
+    display = chain_display(chain)
+    lr_cols = display["lr_cols"]
+
+    # Volume and OI changes for every shown strike, both sides and both intervals in one lookup,
+    # ending at this snapshot's own values whether or not the sampler has recorded it yet
+    ce_rows, pe_rows = chain["rows"]["CE"][low:high], chain["rows"]["PE"][low:high]
+    keys = [get_strike_key(strike, option_type) for option_type in ("CE", "PE") for strike in strikes_to_show]
+    rows = np.concatenate([ce_rows, pe_rows])
+    current = [np.where(rows >= 0, chain_column(chain, name, rows), np.nan) for name in ("volume", "oi")]
+    vol_changes, oi_changes = get_change_matrix(index_name, keys, [vol_interval, oi_interval], current)
+    changes = {"vol_change": vol_changes[:, 0], "oi_change": oi_changes[:, 1]}
+
+    ce_present, pe_present = ce_rows >= 0, pe_rows >= 0
+    ce_values, pe_values = display["values"][ce_rows], display["values"][pe_rows]
+    grid = format_option_rows(display, low, high, ce_rows, pe_rows, changes)
+    row_styles = [ATM_ROW_STYLE if strike == atm_strike else "" for strike in strikes_to_show]
 
     # Calculate totals (excluding vol_change and oi_change from sum)
-    sum_cols = [c for c in lr_cols if c not in ["vol_change", "oi_change"]]
-    ce_totals = ce_df[sum_cols].sum(numeric_only=True) if not ce_df.empty else pd.Series(0, index=sum_cols)
-    pe_totals = pe_df[sum_cols].sum(numeric_only=True) if not pe_df.empty else pd.Series(0, index=sum_cols)
-    ce_itm_totals = ce_itm_df[sum_cols].sum(numeric_only=True) if not ce_itm_df.empty else pd.Series(0, index=sum_cols)
-    pe_itm_totals = pe_itm_df[sum_cols].sum(numeric_only=True) if not pe_itm_df.empty else pd.Series(0, index=sum_cols)
+    ce_totals = np.nansum(ce_values[ce_present], axis=0)
+    pe_totals = np.nansum(pe_values[pe_present], axis=0)
+    ce_itm_totals = np.nansum(ce_values[ce_present & (strikes < spot_price)], axis=0)
+    pe_itm_totals = np.nansum(pe_values[pe_present & (strikes > spot_price)], axis=0)
+    all_totals = ce_totals + pe_totals
+
+    empty_cells = ["<td>-</td>"] * len(lr_cols)
+    all_totals_cells = format_totals_cells(all_totals, lr_cols, "{:,.2f}")
+    grid.append(format_totals_cells(ce_totals, lr_cols) + ["<td>CE TOTAL</td>"] + empty_cells)
+    grid.append(empty_cells + ["<td>PE TOTAL</td>"] + format_totals_cells(pe_totals, lr_cols))
+    grid.append(format_totals_cells(ce_itm_totals, lr_cols) + ["<td>CE ITM TOTAL</td>"] + empty_cells)
+    grid.append(empty_cells + ["<td>PE ITM TOTAL</td>"] + format_totals_cells(pe_itm_totals, lr_cols))
+    grid.append(all_totals_cells + ["<td>ALL TOTAL</td>"] + all_totals_cells)
+    row_styles += [TOTALS_ROW_STYLE, TOTALS_ROW_STYLE, ITM_TOTALS_ROW_STYLE, ITM_TOTALS_ROW_STYLE, ALL_TOTALS_ROW_STYLE]
 
     ce_headers, pe_headers = generate_headers(vol_interval, oi_interval)
-
-    # CE Totals
-    ce_totals_cells = ""
-    for c in lr_cols:
-        if c in ["vol_change", "oi_change"]:
-            ce_totals_cells += "<td>-</td>"
-        else:
-            if c in ["volume", "oi"]:
-                ce_totals_cells += f"<td><b>{format_to_crore(ce_totals[c])}</b></td>"
-            else:
-                ce_totals_cells += f"<td><b>{ce_totals[c]:.2f}</b></td>"
-    rows_html += f"<tr style='background-color: #c8e6c9; font-weight: bold;'>{ce_totals_cells}<td>CE TOTAL</td>{'<td>-</td>' * len(lr_cols)}</tr>"
-
-    # PE Totals
-    pe_totals_cells = ""
-    for c in lr_cols:
-        if c in ["vol_change", "oi_change"]:
-            pe_totals_cells += "<td>-</td>"
-        else:
-            if c in ["volume", "oi"]:
-                pe_totals_cells += f"<td><b>{format_to_crore(pe_totals[c])}</b></td>"
-            else:
-                pe_totals_cells += f"<td><b>{pe_totals[c]:.2f}</b></td>"
-    rows_html += f"<tr style='background-color: #c8e6c9; font-weight: bold;'>{'<td>-</td>' * len(lr_cols)}<td>PE TOTAL</td>{pe_totals_cells}</tr>"
-
-    # CE ITM Totals
-    ce_itm_totals_cells = ""
-    for c in lr_cols:
-        if c in ["vol_change", "oi_change"]:
-            ce_itm_totals_cells += "<td>-</td>"
-        else:
-            if c in ["volume", "oi"]:
-                ce_itm_totals_cells += f"<td><b>{format_to_crore(ce_itm_totals[c])}</b></td>"
-            else:
-                ce_itm_totals_cells += f"<td><b>{ce_itm_totals[c]:.2f}</b></td>"
-    rows_html += f"<tr style='background-color: #b3e5fc; font-weight: bold;'>{ce_itm_totals_cells}<td>CE ITM TOTAL</td>{'<td>-</td>' * len(lr_cols)}</tr>"
-
-    # PE ITM Totals
-    pe_itm_totals_cells = ""
-    for c in lr_cols:
-        if c in ["vol_change", "oi_change"]:
-            pe_itm_totals_cells += "<td>-</td>"
+    analysis_html = generate_market_insights(chain["insights"])
+    observe_stage("render", index_name, started)
+
+    return {"version": version, "styles": row_styles, "grid": grid, "spot": spot_price,
+            "analysis": analysis_html, "ce_headers": ce_headers, "pe_headers": pe_headers}
+
+def chain_display(chain):
+    """Per-version display state of a parsed chain, built by its first render and shared by every view
+
+    Holds the shown columns (lr_cols), the numeric values (records x lr_cols,
+    NaN for change, Greek and missing columns, summed into the totals rows),
+    the display values and %-formats of the formatted columns (volume and OI
+    already in crore), the cells a format cannot express ('-' for a missing
+    Greek, 0.00 for a zero volume or OI) and the strike cells. Record cells
+    are formatted on first use by display_cells, so each is formatted once per
+    version however many views show it.
+    """
+    display = chain.get("display")
+    if display is not None:
+        return display
+
+    columns = chain["columns"]
+    lr_cols = [c for c in CHAIN_COLUMNS if c in columns or c in CHANGE_COLUMNS]
+    records = len(chain["types"])
+    values = np.full((records, len(lr_cols)), np.nan)
+    shown, shown_values, formats, patches, patched = [], [], [], [], []
+    for i, c in enumerate(lr_cols):
+        column = columns.get(c)
+        if c in CHANGE_COLUMNS or column is None:
+            continue  # Changes are formatted per view, missing columns are blank
+        floats = column.astype(float)
+        if c in GREEK_COLUMNS:
+            # Left out of the values so they stay out of the totals rows
+            formats.append(f"<td>{GREEK_FORMATS[c]}</td>")
+            patches.append("<td>-</td>")
+            patched.append(np.isnan(floats))
+        elif c in CRORE_COLUMNS:
+            formats.append("<td>%.2f Cr</td>")
+            patches.append("<td>0.00</td>")
+            patched.append((floats == 0) | np.isnan(floats))
+            values[:, i] = floats
+            floats = floats / 10000000
         else:
-            if c in ["volume", "oi"]:
-                pe_itm_totals_cells += f"<td><b>{format_to_crore(pe_itm_totals[c])}</b></td>"
-            else:
-                pe_itm_totals_cells += f"<td><b>{pe_itm_totals[c]:.2f}</b></td>"
-    rows_html += f"<tr style='background-color: #b3e5fc; font-weight: bold;'>{'<td>-</td>' * len(lr_cols)}<td>PE ITM TOTAL</td>{pe_itm_totals_cells}</tr>"
-
-    # All Totals
-    all_totals = ce_totals.add(pe_totals, fill_value=0)
-    all_totals_cells = ""
-    for c in lr_cols:
-        if c in ["vol_change", "oi_change"]:
-            all_totals_cells += "<td>-</td>"
+            formats.append("<td>%d</td>" if column.dtype.kind in "iu" else "<td>%s</td>")
+            patches.append(None)
+            patched.append(np.zeros(records, dtype=bool))
+            values[:, i] = floats
+        shown.append(i)
+        shown_values.append(floats)
+
+    display = chain["display"] = {
+        "lr_cols": lr_cols, "values": values, "formats": tuple(formats), "shown": np.array(shown, dtype=int),
+        "shown_values": np.column_stack(shown_values) if shown else np.empty((records, 0)),
+        "patches": np.array(patches, dtype=object),
+        "patched": np.column_stack(patched) if shown else np.empty((records, 0), dtype=bool),
+        "cells": np.empty((records, len(shown)), dtype=object), "formatted": np.zeros(records, dtype=bool),
+        "strike_cells": np.array([f"<td><b>{strike}</b></td>" for strike in chain["strikes"]], dtype=object),
+        "changes": [i for i, c in enumerate(lr_cols) if c in CHANGE_COLUMNS],
+        "missing": [i for i, c in enumerate(lr_cols) if c not in CHANGE_COLUMNS and c not in columns]}
+    return display
+
+def display_cells(display, rows):
+    """<td> cells of the given records' formatted columns, formatting the records no view has shown yet
+
+    The new records are formatted by one %-template compiled once per layout
+    and record count, then the patched cells are filled in.
+    """
+    new = np.unique(rows[~display["formatted"][rows]])
+    if len(new) and len(display["formats"]):
+        template = record_template(display["formats"], len(new))
+        flat = (template % tuple(display["shown_values"][new].ravel().tolist())).split(CELL_SEPARATOR)
+        cells = np.array(flat, dtype=object).reshape(len(new), len(display["formats"]))
+        display["cells"][new] = np.where(display["patched"][new], display["patches"], cells)
+    display["formatted"][new] = True
+    return display["cells"][rows]
+
+def record_template(formats, records):
+    """%-template formatting the shown columns of `records` records in one operation, compiled once per layout"""
+    template = record_templates.get((formats, records))
+    if template is None:
+        template = record_templates[(formats, records)] = CELL_SEPARATOR.join(list(formats) * records)
+    return template
+
+def format_option_rows(display, low, high, ce_rows, pe_rows, changes):
+    """Assemble the <td> cells of the shown strikes, one row per strike with CE cells, the strike and PE cells
+
+    ce_rows and pe_rows hold the record row of each shown strike on that side,
+    -1 when the strike is missing; changes holds the vol_change and oi_change
+    of every shown strike, CE strikes then PE strikes. Record cells come from
+    the chain's display, so only the change columns are formatted per view.
+    """
+    rows, width = high - low, len(display["lr_cols"])
+    if rows <= 0:
+        return []
+    grid = np.empty((rows, 2 * width + 1), dtype=object)
+    grid[:, width] = display["strike_cells"][low:high]
+
+    for side, (offset, side_rows) in enumerate(((0, ce_rows), (width + 1, pe_rows))):
+        present = side_rows >= 0
+        side_cells = np.full((rows, len(display["shown"])), "<td></td>", dtype=object)
+        side_cells[present] = display_cells(display, side_rows[present])
+        grid[:, display["shown"] + offset] = side_cells
+        for i in display["missing"]:
+            grid[:, offset + i] = "<td></td>"
+        for i in display["changes"]:
+            change = np.where(present, changes[display["lr_cols"][i]][side * rows:(side + 1) * rows], np.nan)
+            css = np.where(change > 0, "profit", np.where(change < 0, "loss", "neutral")).tolist()
+            # %-formatting has no thousands separator, so these go through str.format
+            change_cells = np.array(list(map("<td class='{}'>{:+,.0f}</td>".format, css, change.tolist())), dtype=object)
+            change_cells[np.isnan(change)] = "<td>-</td>"
+            grid[:, offset + i] = change_cells
+    return grid.tolist()
+
+def format_totals_cells(totals, lr_cols, number_format="{:.2f}"):
+    """Format one side of a totals row (bold through the row class), volume and OI in crore, '-' for change and Greek columns"""
+    cells = []
+    for c, total in zip(lr_cols, totals.tolist()):
+        if c in CHANGE_COLUMNS or c in GREEK_COLUMNS:
+            cells.append("<td>-</td>")
+        elif c in CRORE_COLUMNS:
+            cells.append(f"<td>{format_to_crore(total)}</td>")
         else:
-            if c in ["volume", "oi"]:
-                all_totals_cells += f"<td><b>{format_to_crore(all_totals[c])}</b></td>"
-            else:
-                all_totals_cells += f"<td><b>{all_totals[c]:,.2f}</b></td>"
-    rows_html += f"<tr style='background-color: #ffd699; font-weight: bold;'>{all_totals_cells}<td>ALL TOTAL</td>{all_totals_cells}</tr>"
-
-    analysis_html = generate_market_insights(ce_df, pe_df, spot_price)
-
-    return rows_html, spot_price, analysis_html, ce_headers, pe_headers
+            cells.append(f"<td>{number_format.format(total)}</td>")
+    return cells
 
 def generate_headers(vol_interval=1, oi_interval=1):
-    cols = ["ASK", "BID", "LTP", "LTPCH", "VOLUME (Cr)", f"VOL Δ({vol_interval}m)", "OI (Cr)", f"OI Δ({oi_interval}m)", "OICH", "OICHP", "PREV_OI"]
+    cols = ["ASK", "BID", "LTP", "LTPCH", "VOLUME (Cr)", f"VOL Δ({interval_label(vol_interval)})", "OI (Cr)", f"OI Δ({interval_label(oi_interval)})", "OICH", "OICHP", "PREV_OI",
+            "IV", "DELTA", "GAMMA", "THETA", "VEGA"]
     ce_headers = "".join([f"<th>{c}</th>" for c in cols])
     pe_headers = "".join([f"<th>{c}</th>" for c in cols])
     return ce_headers, pe_headers
 
-def generate_market_insights(ce_df, pe_df, spot_price):
-    try:
-        total_ce_oi = ce_df["oi"].sum() if not ce_df.empty else 0
-        total_pe_oi = pe_df["oi"].sum() if not pe_df.empty else 0
-        pcr = round(total_pe_oi / total_ce_oi, 2) if total_ce_oi > 0 else None
-
-        strongest_support = pe_df.loc[pe_df["oi"].idxmax(), "strike_price"] if not pe_df.empty else None
-        strongest_resistance = ce_df.loc[ce_df["oi"].idxmax(), "strike_price"] if not ce_df.empty else None
-
-        ce_vol = ce_df["volume"].sum() if not ce_df.empty else 0
-        pe_vol = pe_df["volume"].sum() if not pe_df.empty else 0
-        volume_trend = "CE Volume > PE Volume → Bullish" if ce_vol > pe_vol else "PE Volume > CE Volume → Bearish"
-
-        ltp_trend = "LTP falling 📉" if (ce_df["ltpch"].mean() < 0 and pe_df["ltpch"].mean() < 0) else \
-                    "LTP rising 📈" if (ce_df["ltpch"].mean() > 0 and pe_df["ltpch"].mean() > 0) else "Sideways ⚖️"
-
-        trend_bias = ""
-        if pcr is not None:
-            if pcr > 1:
-                trend_bias = "Bearish 📉"
-            elif pcr < 0.8:
-                trend_bias = "Bullish 📈"
-            else:
-                trend_bias = "Neutral ⚖️"
+def format_oi_band(band):
+    return f"{band['low']} – {band['high']} (OI-weighted {band['center']})" if band else "-"
 
+def generate_market_insights(insights):
+    """Market insights panel for a chain's full-chain aggregates"""
+    try:
         return f"""
         <h3>🔎 Market Insights</h3>
         <ul>
-            <li><b>Spot Price:</b> {spot_price}</li>
-            <li><b>Total CE OI:</b> {format_to_crore(total_ce_oi)} Cr</li>
-            <li><b>Total PE OI:</b> {format_to_crore(total_pe_oi)} Cr</li>
-            <li><b>Put-Call Ratio (PCR):</b> {pcr}</li>
-            <li><b>Volume Trend:</b> {volume_trend}</li>
-            <li><b>Strongest Support (PE OI):</b> {strongest_support}</li>
-            <li><b>Strongest Resistance (CE OI):</b> {strongest_resistance}</li>
-            <li><b>Trend Bias:</b> {trend_bias}</li>
+            <li><b>Spot Price:</b> {insights["spot"]}</li>
+            <li><b>Total CE OI:</b> {format_to_crore(insights["totals"]["CE"]["oi"])}</li>
+            <li><b>Total PE OI:</b> {format_to_crore(insights["totals"]["PE"]["oi"])}</li>
+            <li><b>Put-Call Ratio (PCR):</b> {insights["pcr"]}</li>
+            <li><b>Volume Trend:</b> {VOLUME_TREND_LABELS[insights["volume_trend"]]}</li>
+            <li><b>Strongest Support (PE OI):</b> {insights["support"]}</li>
+            <li><b>Strongest Resistance (CE OI):</b> {insights["resistance"]}</li>
+            <li><b>Max Pain:</b> {insights["max_pain"]}</li>
+            <li><b>Support Band (PE OI):</b> {format_oi_band(insights["support_band"])}</li>
+            <li><b>Resistance Band (CE OI):</b> {format_oi_band(insights["resistance_band"])}</li>
+            <li><b>Trend Bias:</b> {BIAS_LABELS[insights["bias"]]}</li>
         </ul>
         """
     except Exception as e:
         return f"<p>Error in analysis: {e}</p>"
 
+@app.route("/api/insights")
+def api_insights():
+    """Full-chain totals, PCR, max-OI strikes and bias for an index (nearest or `expiry`) as JSON"""
+    index_name = request.args.get("index", "NIFTY50")
+    if index_name not in symbols_map:
+        return Response(json.dumps({"error": f"Unknown index {index_name}"}), status=404, mimetype="application/json")
+    key = chain_key(index_name, request.args.get("expiry"))
+    note_view(key)
+    chain = get_parsed_chain(key)
+    expiry = split_chain_key(key)[1]
+    if chain is None:
+        error = poll_errors.get(key, "Waiting for data...")
+        return Response(json.dumps({"index": index_name, "expiry": expiry, "error": error}), status=503,
+                        mimetype="application/json")
+
+    snapshot = chain_snapshots.get(key)
+    return Response(json.dumps({
+        "index": index_name,
+        "expiry": expiry,
+        "version": chain["version"],
+        "timestamp": snapshot["timestamp"] if snapshot else None,
+        **chain["insights"],
+    }), mimetype="application/json")
+
+@app.route("/add_alert", methods=["POST"])
+def add_alert():
+    """Compile an alert rule, e.g. ?rule=CE vol Δ(2m) > 50000&cooldown=120"""
+    try:
+        cooldown = float(request.args.get("cooldown", ALERT_COOLDOWN))
+        with state_lock:
+            sync_alert_rules()
+            rule = alert_engine.add(request.args.get("rule", ""), cooldown)
+            share_alert_rules()
+    except ValueError as e:
+        return Response(json.dumps({"status": "error", "error": str(e)}), status=400, mimetype="application/json")
+    return Response(json.dumps({"status": "success", "rule": rule}), mimetype="application/json")
+
+@app.route("/remove_alert", methods=["POST"])
+def remove_alert():
+    rule_id = request.args.get("id", type=int)
+    with state_lock:
+        sync_alert_rules()
+        removed = alert_engine.remove(rule_id)
+        share_alert_rules()
+    if removed is None:
+        return Response(json.dumps({"status": "error", "error": f"No alert rule {rule_id}"}), status=404,
+                        mimetype="application/json")
+    return Response(json.dumps({"status": "success"}), mimetype="application/json")
+
+@app.route("/alert_rules")
+def alert_rules():
+    sync_alert_rules()
+    return Response(json.dumps(alert_engine.export()["rules"]), mimetype="application/json")
+
+@app.route("/alerts")
+def alerts():
+    """Alerts fired after ?since=<seq>, optionally for one ?index="""
+    sequence, fired = alert_engine.since(request.args.get("since", 0, type=int), request.args.get("index"))
+    return Response(json.dumps({"seq": sequence, "alerts": fired}), mimetype="application/json")
+
+@app.route("/alert_stream")
+def alert_stream():
+    """Push alerts to the client as they fire, resuming after Last-Event-ID on reconnect"""
+    index_name = request.args.get("index")
+    since = request.headers.get("Last-Event-ID", type=int) or request.args.get("since", type=int)
+
+    def events():
+        start_pollers()
+        last_sequence = alert_engine.sequence if since is None else since
+        while True:
+            with alert_engine.condition:
+                alert_engine.condition.wait_for(lambda: alert_engine.sequence != last_sequence,
+                                                timeout=STREAM_KEEPALIVE)
+            last_sequence, fired = alert_engine.since(last_sequence, index_name)
+            if not fired:
+                yield ": keepalive\n\n"
+                continue
+            for alert in fired:
+                yield f"id: {alert['seq']}\ndata: {json.dumps(alert)}\n\n"
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/replay_status")
+def replay_status():
+    if not replay_stats:
+        return json.dumps({"replaying": False})
+    start_pollers()
+    return json.dumps({
+        "replaying": not replay_stats["finished"],
+        "day": replay_stats["day"],
+        "speed": replay_stats["speed"],
+        "clock": get_mumbai_time().strftime("%H:%M:%S") if replay_clock is not None else None,
+        "ticks": replay_stats["ticks"],
+        "total": replay_stats["total"],
+        "timings_ms": {stage: {k: round(float(v), 3) for k, v in ms.items()} for stage, ms in replay_timings().items()},
+    })
+
+def metric_labels(key):
+    """Prometheus labels of a chain key: its index, plus its expiry for other expiries"""
+    index_name, expiry = split_chain_key(key)
+    return f'index="{index_name}",expiry="{expiry}"' if expiry else f'index="{index_name}"'
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus text exposition of stage latencies, broker errors, freshness and memory
+
+    Counters are summed over every serving process, so any worker answers for all of them.
+    """
+    lines = [
+        "# HELP option_chain_stage_seconds Time spent per chain in each stage of the chain pipeline.",
+        "# TYPE option_chain_stage_seconds histogram",
+    ]
+    counts, sums = {}, {}
+    errors, timeouts, renders, clients = {}, {}, {}, {}
+    dropped = 0
+    for process in collect_metrics():
+        for stage, key, values, total in process["stages"]:
+            summed = counts.setdefault((stage, key), [0] * len(values))
+            summed[:] = [count + value for count, value in zip(summed, values)]
+            sums[(stage, key)] = sums.get((stage, key), 0) + total
+        for target, name in ((errors, "broker_errors"), (timeouts, "broker_timeouts"), (renders, "render"),
+                             (clients, "stream_clients")):
+            for key, value in process[name].items():
+                target[key] = target.get(key, 0) + value
+        dropped += process["archive_dropped"]
+    for (stage, key), values in sorted(counts.items()):
+        labels = f'stage="{stage}",{metric_labels(key)}'
+        cumulative = 0
+        for bound, count in zip(METRIC_BUCKETS + ["+Inf"], values):
+            cumulative += count
+            lines.append(f'option_chain_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"option_chain_stage_seconds_sum{{{labels}}} {sums[(stage, key)]:.6f}")
+        lines.append(f"option_chain_stage_seconds_count{{{labels}}} {cumulative}")
+
+    now = get_mumbai_time().timestamp()
+    gauges = [
+        ("option_chain_broker_errors_total", "counter", "Broker fetches that failed.",
+         {**dict.fromkeys(symbols_map, 0), **errors}),
+        ("option_chain_broker_timeouts_total", "counter", "Broker fetches abandoned after the fetch timeout.",
+         {**dict.fromkeys(symbols_map, 0), **timeouts}),
+        ("option_chain_snapshot_age_seconds", "gauge", "Seconds since the latest snapshot was fetched.",
+         {key: round(now - snapshot["timestamp"], 3) for key, snapshot in list(chain_snapshots.items())}),
+        ("option_chain_snapshot_version", "gauge", "Version of the latest snapshot, bumped when the chain changes.",
+         {key: snapshot["version"] for key, snapshot in list(chain_snapshots.items())}),
+        ("option_chain_stream_clients", "gauge", "Connected /stream clients.",
+         {index_name: clients.get(index_name, 0) for index_name in symbols_map}),
+        ("option_chain_history_bytes", "gauge", "Memory held by the volume/OI history buffers, other expiries included.",
+         {index_name: history.nbytes() + sum(other.nbytes() for (other_index, _), other in list(expiry_histories.items())
+                                             if other_index == index_name)
+          for index_name, history in list(historical_data.items())}),
+    ]
+    for name, kind, help_text, values in gauges:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{{{metric_labels(key)}}} {value}" for key, value in sorted(values.items())]
+    lines += ["# HELP option_chain_archive_dropped_total Snapshots dropped because the archive writer fell behind.",
+              "# TYPE option_chain_archive_dropped_total counter",
+              f"option_chain_archive_dropped_total {dropped}",
+              "# HELP option_chain_render_cache_total Page and payload requests served from the render cache or rendered.",
+              "# TYPE option_chain_render_cache_total counter",
+              f'option_chain_render_cache_total{{result="hit"}} {renders.get("hits", 0)}',
+              f'option_chain_render_cache_total{{result="render"}} {renders.get("renders", 0)}']
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
+    if REPLAY_DAY:
+        enable_replay(REPLAY_DAY)
+        print(f"Replaying {REPLAY_DAY} at {REPLAY_SPEED}x, progress at /replay_status")
     port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    if WORKERS > 0:
+        serve(WORKERS, port)
+    else:
+        # The same threaded server the workers run, without the debugger or the reloader
+        print(f"Serving on port {port} from one process")
+        make_server("0.0.0.0", port, app, threaded=True).serve_forever()
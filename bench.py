@@ -0,0 +1,224 @@
+"""Benchmarks for the option chain, delta and scalping hot paths on synthetic chains
+
+Builds Fyers-shaped optionsChain payloads at several strike counts, fills the
+volume/OI history to a full session's depth and times each stage. Results are
+printed as one JSON document so runs can be compared across commits:
+
+    python bench.py > bench_output.txt
+"""
+import argparse
+import gc
+import json
+import math
+import platform
+import subprocess
+import time
+
+import numpy as np
+import pandas as pd
+
+import app
+
+BENCH_INDEX = "NIFTY50"
+STRIKE_COUNTS = [50, 200, 1000]
+STRIKE_STEP = 50.0
+SPOT = 24812.35
+SESSION_SECONDS = 6 * 3600 + 15 * 60  # 09:15 to 15:30 IST
+POSITIONS = 20  # Open scalping positions priced every tick
+ALERT_RULES = 200  # Strike rules over assorted metrics and intervals, plus a few PCR rules
+
+# Background pollers, the sampler and the archive writer would race the timed stages
+app.start_pollers = lambda: None
+app.ARCHIVE_DIR = ""
+app.position_book = app.PositionBook("")  # Keep bench positions out of the local position database
+
+def synthetic_columns(strikes, seed=0, tick=0):
+    """Spot, strike grid and (strikes x [CE, PE]) volume/OI arrays for one tick
+
+    Volume and OI start from the same base every tick and drift with `tick`,
+    like the cumulative day figures Fyers reports.
+    """
+    rng = np.random.default_rng(seed * 1000003 + tick)
+    base = np.random.default_rng(seed)
+    spot = SPOT + rng.uniform(-10, 10)  # ATM stays put so frame layouts line up for deltas
+    atm = round(SPOT / STRIKE_STEP) * STRIKE_STEP
+    strike_prices = atm + (np.arange(strikes) - strikes // 2) * STRIKE_STEP
+    prev_oi = base.integers(100_000, 9_000_000, size=(strikes, 2))
+    volumes = base.integers(10_000, 5_000_000, size=(strikes, 2)) + tick * rng.integers(0, 5_000, size=(strikes, 2))
+    ois = prev_oi + tick * rng.integers(-300, 400, size=(strikes, 2))
+    return rng, spot, strike_prices, prev_oi, volumes, ois
+
+def synthetic_chain(strikes, seed=0, tick=0):
+    """One optionchain data section with `strikes` strikes around SPOT, CE and PE for each"""
+    rng, spot, strike_prices, prev_oi, volumes, ois = synthetic_columns(strikes, seed, tick)
+    records = [{"ask": 0, "bid": 0, "description": "NIFTY50-INDEX", "ex_symbol": "NIFTY", "exchange": "NSE",
+                "fyToken": "101", "ltp": round(spot, 2), "ltpch": 12.5, "ltpchp": 0.05, "option_type": "",
+                "strike_price": -1, "symbol": "NSE:NIFTY50-INDEX"}]
+    for i, strike in enumerate(strike_prices.tolist()):
+        for j, option_type in enumerate(("CE", "PE")):
+            intrinsic = max(0.0, spot - strike) if option_type == "CE" else max(0.0, strike - spot)
+            ltp = round(intrinsic + 60 * math.exp(-abs(spot - strike) / 400) + rng.uniform(0, 2), 2)
+            records.append({
+                "ask": round(ltp + 0.05, 2), "bid": round(max(0.0, ltp - 0.05), 2), "fyToken": f"{int(strike)}{j}",
+                "ltp": ltp, "ltpch": round(rng.uniform(-5, 5), 2), "ltpchp": round(rng.uniform(-3, 3), 2),
+                "oi": int(ois[i, j]), "oich": int(ois[i, j] - prev_oi[i, j]),
+                "oichp": round((ois[i, j] - prev_oi[i, j]) / prev_oi[i, j] * 100, 2),
+                "option_type": option_type, "prev_oi": int(prev_oi[i, j]), "strike_price": strike,
+                "symbol": f"NSE:NIFTY26OCT{int(strike)}{option_type}", "volume": int(volumes[i, j]),
+            })
+    expiry = int(time.time()) + 7 * 86400
+    return {"callOi": 0, "putOi": 0, "expiryData": [{"date": time.strftime("%d-%m-%Y", time.localtime(expiry)),
+                                                     "expiry": str(expiry)}], "optionsChain": records}
+
+def session_times(end):
+    """Sample times that fill every history tier, as the sampler would over a full session"""
+    times = set()
+    for resolution, capacity in app.HISTORY_TIERS:
+        span = min(SESSION_SECONDS, resolution * (capacity - 1))
+        times.update(np.arange(end - span, end + 1, resolution).tolist())
+    return sorted(times)
+
+def fill_history(strikes, end):
+    """Reset the bench index's history and fill it to a full session's depth"""
+    app.historical_data[BENCH_INDEX] = app.TieredHistory(max_keys=max(app.HISTORY_KEYS, 2 * strikes))
+    times = session_times(end)
+    strike_prices = synthetic_columns(strikes)[2].tolist()
+    keys = [app.get_strike_key(strike, option_type) for strike in strike_prices for option_type in ("CE", "PE")]
+    for tick, timestamp in enumerate(times):
+        _, _, _, _, volumes, ois = synthetic_columns(strikes, tick=tick)
+        app.update_historical_data(BENCH_INDEX, keys, volumes.ravel(), ois.ravel(), timestamp)
+    return len(times)
+
+def publish(data_section):
+    app.parsed_chains.pop(BENCH_INDEX, None)
+    app.publish_snapshot(BENCH_INDEX, data_section)
+    return app.chain_snapshots[BENCH_INDEX]
+
+def change_single(strike, option_type, minutes):
+    """Volume and OI change of one strike key, the way the per-strike lookups used to ask"""
+    key = app.get_strike_key(strike, option_type)
+    vol_changes, oi_changes = app.get_change_matrix(BENCH_INDEX, [key], [minutes])
+    return vol_changes[0, 0], oi_changes[0, 0]
+
+def time_stage(func, repeat, setup=None):
+    """Run func `repeat` times and summarise the wall time in milliseconds"""
+    if setup is None:
+        func()  # Warm caches and lazy imports outside the timed runs
+    samples = []
+    for run in range(repeat):
+        args = setup(run) if setup else ()
+        gc.collect()
+        gc.disable()  # Like timeit, keep collector pauses out of the timed call
+        started = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+        gc.enable()
+    samples = np.array(samples)
+    return {"runs": repeat, "mean_ms": samples.mean(), "p50_ms": np.percentile(samples, 50),
+            "p95_ms": np.percentile(samples, 95), "min_ms": samples.min()}
+
+def new_display(snapshot):
+    """Drop a snapshot's formatted cells so the next render formats them like the first view of a new version"""
+    app.parse_snapshot(BENCH_INDEX, snapshot).pop("display", None)
+    return ()
+
+def coerce(df):
+    for col in ["strike_price", "ask", "bid", "ltp", "oi", "oich", "oichp", "prev_oi", "volume", "ltpch"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+def bench_strikes(strikes, repeat):
+    """Time every stage for one chain size"""
+    end = app.get_mumbai_time().timestamp()
+    samples = fill_history(strikes, end)
+    chains = [synthetic_chain(strikes, tick=samples + i) for i in range(repeat + 1)]
+    options = chains[0]["optionsChain"]
+    snapshot = publish(chains[0])
+    keys = app.chain_history_arrays(chains[0])[0]
+    atm = round(SPOT / STRIKE_STEP) * STRIKE_STEP
+
+    parsed = [app.parse_chain(chain) for chain in chains]
+    for previous, chain in zip([None] + parsed, parsed):
+        app.chain_insights(chain, previous)  # Each version's aggregates, for folding the next one's delta
+
+    contract = app.position_contract(BENCH_INDEX)
+    app.position_book.clear(contract)
+    for i in range(POSITIONS):
+        app.position_book.add(contract, {
+            "id": str(i), "strike": atm + (i % 10 - 5) * STRIKE_STEP, "type": "CE" if i % 2 else "PE",
+            "entry_ltp": 100.0, "entry_time": "09:15:00", "lot_size": 75, "lots": 1, "opened_at": float(i)})
+    frames = [app.render_chain_frame(publish(chain), BENCH_INDEX, 5, 1, 0) for chain in chains[:2]]
+
+    alerts = app.AlertEngine()
+    for i in range(ALERT_RULES):
+        alerts.add(f"{('CE', 'PE')[i % 2]} {('vol', 'oi')[i % 3 == 0]} Δ({(1, 2, 5, 15)[i % 4]}m) > {1000 * (i + 1)}")
+    for i in range(10):
+        alerts.add(f"{BENCH_INDEX} pcr crosses {0.6 + i * 0.1:.1f}")
+    alert_samples = [app.chain_history_arrays(chain) for chain in chains]
+    alerts.evaluate(BENCH_INDEX, *alert_samples[0], end)
+
+    stages = {
+        "json_normalize": time_stage(lambda: pd.json_normalize(options), repeat),
+        "numeric_coercion": time_stage(coerce, repeat, lambda run: (pd.json_normalize(options),)),
+        "parse_chain": time_stage(lambda: app.parse_chain(chains[0]), repeat),
+        "history_append": time_stage(
+            lambda chain, timestamp: app.update_historical_data(BENCH_INDEX, *app.chain_history_arrays(chain), timestamp),
+            repeat, lambda run: (chains[run], end + 1 + run)),
+        "change_matrix": time_stage(lambda: app.get_change_matrix(BENCH_INDEX, keys, app.TRACKING_INTERVALS), repeat),
+        "change_single": time_stage(lambda: change_single(atm, "CE", 5), repeat),
+        # The first view of a version formats its record cells; the other views of that version reuse them
+        "render_atm_window": time_stage(
+            lambda: app.frame_rows_html(app.render_chain_frame(snapshot, BENCH_INDEX, 5, 1, app.CHAIN_WINDOW)),
+            repeat, lambda run: new_display(snapshot)),
+        "render_full_chain": time_stage(
+            lambda: app.frame_rows_html(app.render_chain_frame(snapshot, BENCH_INDEX, 5, 1, 0)),
+            repeat, lambda run: new_display(snapshot)),
+        "render_full_chain_shared": time_stage(
+            lambda: app.frame_rows_html(app.render_chain_frame(snapshot, BENCH_INDEX, 1, 5, 0)), repeat),
+        "chain_delta": time_stage(lambda: app.diff_chain_frames(frames[0], frames[1]), repeat),
+        "insights_full": time_stage(lambda: app.chain_insights(parsed[0]), repeat),
+        "insights_delta": time_stage(app.chain_insights, repeat, lambda run: (parsed[run + 1], parsed[run])),
+        "oi_analytics": time_stage(lambda: app.oi_analytics(parsed[0]), repeat),
+        "greeks_cold": time_stage(lambda: app.chain_greeks("bench-cold", parsed[0]), repeat,
+                                  lambda run: (app.implied_vols.pop("bench-cold", None), ())[1]),
+        "greeks_warm": time_stage(lambda chain: app.chain_greeks(BENCH_INDEX, chain), repeat,
+                                  lambda run: (parsed[run + 1],)),
+        "alert_rules": time_stage(lambda sample, timestamp: alerts.evaluate(BENCH_INDEX, *sample, timestamp), repeat,
+                                  lambda run: (alert_samples[run + 1], end + 1 + run)),
+        # The same sample again: no value crosses a threshold, the common tick between fetches
+        "alert_rules_quiet": time_stage(lambda: alerts.evaluate(BENCH_INDEX, *alert_samples[repeat], end + 1 + repeat),
+                                        repeat),
+        "scalping_update": time_stage(lambda: app.build_scalping_update(BENCH_INDEX, 5, 1), repeat,
+                                      lambda run: (publish(chains[run]), ())[1]),
+    }
+    return {"strikes": strikes, "rows": len(options), "history_samples": samples,
+            "history_bytes": app.historical_data[BENCH_INDEX].nbytes(),
+            "stages": {name: {k: round(float(v), 4) if k != "runs" else v for k, v in result.items()}
+                       for name, result in stages.items()}}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--strikes", type=int, nargs="+", default=STRIKE_COUNTS)
+    parser.add_argument("--repeat", type=int, default=30, help="timed runs per stage")
+    args = parser.parse_args()
+
+    results = [bench_strikes(strikes, args.repeat) for strikes in args.strikes]
+    print(json.dumps({
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "repeat": args.repeat,
+        "results": results,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
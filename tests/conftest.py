@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+# Keep the suite away from the local position database and the snapshot archive
+os.environ["POSITIONS_DB"] = ""
+os.environ["ARCHIVE_DIR"] = ""
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+app.start_pollers = lambda: None  # Tests feed snapshots by hand; nothing may call the broker
+
+
+def option_record(strike, option_type, **values):
+    """One Fyers optionsChain record with quiet defaults"""
+    record = {"strike_price": strike, "option_type": option_type, "symbol": f"NSE:TEST{int(strike)}{option_type}",
+              "ltp": 10.0, "ltpch": 0.0, "ltpchp": 0.0, "bid": 9.5, "ask": 10.5, "volume": 1000, "oi": 10000,
+              "oich": 0, "oichp": 0.0, "prev_oi": 10000}
+    record.update(values)
+    return record
+
+
+def chain_section(strikes, spot, expiries=(), **columns):
+    """An optionchain data section: the underlying plus a CE and a PE record per strike
+
+    Keyword columns give per-record values as {name: ([CE values], [PE values])}.
+    """
+    records = [{"strike_price": -1, "option_type": "", "symbol": "NSE:TEST-INDEX", "ltp": spot, "ltpch": 0.0}]
+    for i, strike in enumerate(strikes):
+        for side, option_type in enumerate(("CE", "PE")):
+            records.append(option_record(strike, option_type,
+                                         **{name: values[side][i] for name, values in columns.items()}))
+    return {"optionsChain": records, "expiryData": [{"date": str(e), "expiry": str(e)} for e in expiries]}
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
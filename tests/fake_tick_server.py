@@ -0,0 +1,71 @@
+import json
+import socket
+import threading
+import time
+
+
+class FakeTickServer:
+    """Local newline-delimited JSON tick feed, the protocol LocalTickSocket speaks
+
+    Records the symbols the current connection subscribed to, sends ticks to
+    every connected client and can drop its clients to open a gap in the feed.
+    """
+
+    def __init__(self):
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.address = f"127.0.0.1:{self.server.getsockname()[1]}"
+        self.clients = []
+        self.subscriptions = set()  # Symbols the latest connection subscribed to
+        self.connections = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.accept, name="fake-tick-server", daemon=True).start()
+
+    def accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            with self.lock:
+                self.clients.append(conn)
+                self.connections += 1
+                self.subscriptions = set()
+            threading.Thread(target=self.read, args=(conn,), daemon=True).start()
+
+    def read(self, conn):
+        try:
+            for line in conn.makefile("r", encoding="utf-8"):
+                message = json.loads(line)
+                with self.lock:
+                    self.subscriptions.update(message.get("subscribe", ()))
+                    self.subscriptions.difference_update(message.get("unsubscribe", ()))
+        except OSError:
+            pass
+
+    def send(self, tick):
+        """Send one tick to every connected client; with none connected it is lost"""
+        line = (json.dumps(tick) + "\n").encode()
+        with self.lock:
+            for conn in self.clients:
+                conn.sendall(line)
+
+    def drop(self):
+        """Disconnect every client, as a network blip would"""
+        with self.lock:
+            clients, self.clients = self.clients, []
+        for conn in clients:
+            conn.shutdown(socket.SHUT_RDWR)
+            conn.close()
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if condition(self):
+                    return
+            time.sleep(0.01)
+        raise AssertionError("fake tick feed never reached the expected state")
+
+    def close(self):
+        self.drop()
+        self.server.close()
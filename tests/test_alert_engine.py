@@ -0,0 +1,108 @@
+import numpy as np
+
+import app
+
+START = 1_800_000_000.0
+KEYS = [app.get_strike_key(strike, option_type) for option_type in ("CE", "PE") for strike in (24_700, 24_800)]
+
+
+def tick(engine, timestamp, volumes=(0, 0, 0, 0), ois=(100, 100, 100, 100), index_name="NIFTY50"):
+    """Evaluate one sample and return the fired (rule text, strike key) pairs"""
+    alerts = engine.evaluate(index_name, KEYS, np.array(volumes, dtype=float), np.array(ois, dtype=float), timestamp)
+    return [(alert["text"], app.get_strike_key(alert["strike"], alert["type"]) if alert["strike"] else None)
+            for alert in alerts]
+
+
+def test_comparison_fires_when_it_turns_true_not_while_it_stays_true():
+    engine = app.AlertEngine()
+    engine.add("24800 CE vol > 5000", cooldown=60)
+    fired = ("24800 CE vol > 5000", "24800.0_CE")
+
+    assert tick(engine, START, (0, 1000, 9000, 9000)) == []  # Other strikes and the PE side are out of scope
+    assert tick(engine, START + 1, (0, 6000, 0, 0)) == [fired]
+    assert tick(engine, START + 2, (0, 7000, 0, 0)) == []
+    assert tick(engine, START + 3, (0, 5000, 0, 0)) == []  # Equal is not above
+
+
+def test_cooldown_holds_back_a_refire_and_rearms_after_it():
+    engine = app.AlertEngine()
+    engine.add("CE vol > 5000", cooldown=60)
+
+    assert tick(engine, START, (6000, 0, 0, 0)) == [("CE vol > 5000", "24700.0_CE")]
+    assert tick(engine, START + 10, (0, 0, 0, 0)) == []
+    assert tick(engine, START + 20, (6000, 6000, 0, 0)) == [("CE vol > 5000", "24800.0_CE")]  # Cooldown is per strike
+    assert tick(engine, START + 61, (6000, 6000, 0, 0)) == []  # Cooled down but never re-armed: still true
+    assert tick(engine, START + 62, (0, 0, 0, 0)) == []
+    assert tick(engine, START + 63, (6000, 6000, 0, 0)) == [("CE vol > 5000", "24700.0_CE")]
+    assert tick(engine, START + 90, (0, 0, 0, 0)) == []
+    assert tick(engine, START + 91, (6000, 6000, 0, 0)) == [("CE vol > 5000", "24800.0_CE")]
+
+
+def test_sorted_thresholds_fire_exactly_the_rules_a_value_moved_past():
+    engine = app.AlertEngine()
+    for threshold in (3000, 1000, 2000):
+        engine.add(f"CE vol >= {threshold}", cooldown=0)
+
+    fired = tick(engine, START, (2500, 1000, 0, 0))
+    assert sorted(fired) == [("CE vol >= 1000", "24700.0_CE"), ("CE vol >= 1000", "24800.0_CE"),
+                             ("CE vol >= 2000", "24700.0_CE")]
+    fired = tick(engine, START + 1, (3500, 2999, 0, 0))
+    assert sorted(fired) == [("CE vol >= 2000", "24800.0_CE"), ("CE vol >= 3000", "24700.0_CE")]
+    assert tick(engine, START + 2, (0, 2999, 0, 0)) == []
+    assert sorted(tick(engine, START + 3, (2000, 3000, 0, 0))) == [
+        ("CE vol >= 1000", "24700.0_CE"), ("CE vol >= 2000", "24700.0_CE"), ("CE vol >= 3000", "24800.0_CE")]
+
+
+def test_less_than_rules_compare_the_other_way():
+    engine = app.AlertEngine()
+    engine.add("PE oi < 50", cooldown=0)
+    assert tick(engine, START, ois=(100, 100, 100, 100)) == []
+    assert tick(engine, START + 1, ois=(10, 10, 100, 40)) == [("PE oi < 50", "24800.0_PE")]
+
+
+def test_crossings_wait_for_a_move_across_the_threshold():
+    engine = app.AlertEngine()
+    engine.add("pcr crosses 1.0", cooldown=0)
+    engine.add("pcr crosses above 1.5", cooldown=0)
+
+    assert tick(engine, START, ois=(100, 100, 150, 150)) == []  # Already above 1.0: no crossing yet
+    assert tick(engine, START + 1, ois=(100, 100, 50, 50)) == [("pcr crosses 1.0", None)]
+    assert tick(engine, START + 2, ois=(100, 100, 200, 200)) == [("pcr crosses 1.0", None),
+                                                                  ("pcr crosses above 1.5", None)]
+    assert tick(engine, START + 3, ois=(100, 100, 120, 120)) == []  # Falling through 1.5 is not "above"
+
+
+def test_rules_added_later_join_without_replaying_old_moves():
+    engine = app.AlertEngine()
+    engine.add("CE vol > 1000", cooldown=0)
+    assert len(tick(engine, START, (5000, 0, 0, 0))) == 1
+
+    engine.add("CE vol > 2000", cooldown=0)
+    engine.add("pcr crosses 0.5", cooldown=0)
+    assert tick(engine, START + 1, (5000, 0, 0, 0)) == [("CE vol > 2000", "24700.0_CE")]
+    assert tick(engine, START + 2, (5000, 0, 0, 0)) == []
+
+
+def test_interval_rules_read_the_index_history(monkeypatch):
+    history = app.TieredHistory(tiers=[(1, 121)])
+    monkeypatch.setitem(app.historical_data, "TESTINDEX", history)
+    engine = app.AlertEngine()
+    engine.add("CE vol Δ(1m) > 500", cooldown=0)
+    engine.add("NIFTY50 CE vol > 0", cooldown=0)  # Another index's rule takes no part
+
+    for t in range(61):
+        history.append(START + t, KEYS, [t, 10 * t, 0, 0], [0, 0, 0, 0])
+    assert tick(engine, START + 60, (60, 600, 0, 0), index_name="TESTINDEX") == [
+        ("CE vol Δ(1m) > 500", "24800.0_CE")]
+
+
+def test_fired_alerts_are_queued_in_sequence():
+    engine = app.AlertEngine()
+    engine.add("CE vol > 1000", cooldown=0)
+    tick(engine, START, (5000, 5000, 0, 0))
+    tick(engine, START + 1, (0, 0, 0, 0), index_name="BANKNIFTY")
+    tick(engine, START + 2, (5000, 0, 0, 0), index_name="BANKNIFTY")
+
+    sequence, alerts = engine.since(0)
+    assert sequence == 3 and [alert["seq"] for alert in alerts] == [1, 2, 3]
+    assert [alert["index"] for alert in engine.since(1, "BANKNIFTY")[1]] == ["BANKNIFTY"]
@@ -0,0 +1,49 @@
+import pytest
+
+import app
+
+
+def test_strike_rule_reads_every_part():
+    rule = app.compile_alert_rule("nifty50 24800 ce vol Δ(5m) > 1.5L", cooldown=30)
+    assert {name: rule[name] for name in ("index", "strike", "side", "metric", "minutes", "op", "threshold")} == {
+        "index": "NIFTY50", "strike": 24_800.0, "side": "CE", "metric": "volume", "minutes": 5, "op": ">",
+        "threshold": 150_000.0}
+    assert rule["cooldown"] == 30.0
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("pcr crosses 1.0", {"metric": "pcr", "op": "crosses", "threshold": 1.0, "index": None, "minutes": None}),
+    ("BANKNIFTY pcr CROSSES  below 0.8", {"metric": "pcr", "op": "crosses below", "index": "BANKNIFTY"}),
+    ("PE oi chg(0) >= 2Cr", {"metric": "oi", "minutes": app.DAY_OPEN, "side": "PE", "threshold": 2e7}),
+    ("oi change 15m <= −1,500k", {"metric": "oi", "minutes": 15, "op": "<=", "threshold": -1.5e6}),
+    ("volume < 2e3", {"metric": "volume", "minutes": None, "strike": None, "threshold": 2000.0}),
+])
+def test_rule_variants(text, expected):
+    rule = app.compile_alert_rule(text)
+    assert {name: rule[name] for name in expected} == expected
+    assert rule["text"] == " ".join(text.split())
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    None,
+    "hello",
+    "CE vol > lots",
+    "vol >> 5",
+    "NIFTY99 vol > 5",
+    "24800 pcr > 1",
+    "PE pcr > 1",
+    "pcr Δ(5m) > 1",
+    "vol Δ(999m) > 1",
+])
+def test_rules_that_do_not_read_are_rejected(text):
+    with pytest.raises(ValueError):
+        app.compile_alert_rule(text)
+
+
+def test_longest_interval_the_history_keeps_is_accepted():
+    seconds, length = app.HISTORY_TIERS[-1]
+    longest = seconds * (length - 1) // 60
+    assert app.compile_alert_rule(f"oi Δ({longest}m) > 1")["minutes"] == longest
+    with pytest.raises(ValueError):
+        app.compile_alert_rule(f"oi Δ({longest + 1}m) > 1")
@@ -0,0 +1,61 @@
+import numpy as np
+
+import app
+from conftest import chain_section
+
+STRIKES = [24_000 + 100 * i for i in range(11)]
+
+
+def parse(section):
+    chain = app.parse_chain(section)
+    assert chain is not None
+    return chain
+
+
+def brute_force_max_pain(strikes, ce_oi, pe_oi):
+    payouts = [sum(c * max(settle - k, 0) + p * max(k - settle, 0) for k, c, p in zip(strikes, ce_oi, pe_oi))
+               for settle in strikes]
+    return strikes[payouts.index(min(payouts))]
+
+
+def test_max_pain_matches_a_brute_force_payout_scan():
+    rng = np.random.default_rng(7)
+    for _ in range(25):
+        ce_oi = rng.integers(0, 500_000, len(STRIKES)).tolist()
+        pe_oi = rng.integers(0, 500_000, len(STRIKES)).tolist()
+        chain = parse(chain_section(STRIKES, 24_430.0, oi=(ce_oi, pe_oi)))
+        assert app.oi_analytics(chain)["max_pain"] == brute_force_max_pain(STRIKES, ce_oi, pe_oi)
+
+
+def test_oi_profile_and_bands():
+    ce_oi = [0] * 6 + [100, 200, 700, 0, 0]
+    pe_oi = [0, 0, 0, 900, 100] + [0] * 6
+    analytics = app.oi_analytics(parse(chain_section(STRIKES, 24_550.0, oi=(ce_oi, pe_oi))))
+    assert analytics["oi_profile"]["ce_oi_cumulative"][-1] == 1000
+    assert analytics["oi_profile"]["pe_oi"] == pe_oi
+    assert analytics["support_band"]["low"] == 24_300
+    assert analytics["support_band"]["center"] == 24_310.0
+    assert analytics["resistance_band"]["high"] == 24_800
+
+
+def test_max_pain_is_none_without_open_interest():
+    zeros = [0] * len(STRIKES)
+    assert app.oi_analytics(parse(chain_section(STRIKES, 24_500.0, oi=(zeros, zeros))))["max_pain"] is None
+
+
+def test_folded_insights_equal_a_full_recompute():
+    rng = np.random.default_rng(11)
+    oi = [rng.integers(1_000, 90_000, len(STRIKES)).tolist() for _ in range(2)]
+    volume = [rng.integers(0, 9_000, len(STRIKES)).tolist() for _ in range(2)]
+    previous = parse(chain_section(STRIKES, 24_500.0, oi=tuple(oi), volume=tuple(volume)))
+    app.chain_insights(previous)
+    for _ in range(40):
+        side, i = rng.integers(0, 2), rng.integers(0, len(STRIKES))
+        oi[side][i] = int(rng.integers(0, 200_000))
+        volume[side][i] += int(rng.integers(0, 500))
+        chain = parse(chain_section(STRIKES, 24_500.0, oi=tuple(oi), volume=tuple(volume)))
+        folded = app.chain_insights(chain, previous)
+        assert chain["aggregates"]["updates"] > 0  # The small delta was folded, not summed afresh
+        assert folded == app.chain_insights(parse(chain_section(STRIKES, 24_500.0, oi=tuple(oi),
+                                                                volume=tuple(volume))))
+        previous = chain
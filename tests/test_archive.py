@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+import app
+from conftest import chain_section
+
+START = 1_800_000_000.0
+NEAR, NEXT = 1_800_259_200, 1_800_864_000  # Three days and ten days out
+STRIKES = [24_700, 24_800, 24_900]
+DAY = app.archive_day(START)
+
+
+def section(volume, expiries=(NEAR, NEXT)):
+    return chain_section(STRIKES, 24_810.0, expiries, volume=([volume] * 3, [volume + 1] * 3))
+
+
+def write(root, key, timestamp, data_section, expiry):
+    archive = app.TickArchive(key, DAY, root=str(root))
+    archive.append(app.chain_archive_columns(timestamp, data_section, expiry))
+    archive.close()
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(app, "replay_clock", START + 10)
+    return tmp_path
+
+
+def test_rows_carry_the_contract_expiry(archive_dir):
+    write(archive_dir, "NIFTY50", START, section(100), str(NEAR))
+    write(archive_dir, "NIFTY50", START + 1, section(200), None)
+    columns = app.read_archive("NIFTY50", DAY)
+    assert columns["expiry"].tolist() == [NEAR] * 7 + [0] * 7
+    assert columns["volume"][columns["option_type"] == 1].tolist() == [100] * 3 + [200] * 3
+
+
+def test_days_archived_without_an_expiry_column_read_and_append(archive_dir):
+    write(archive_dir, "NIFTY50", START, section(100), str(NEAR))
+    path = os.path.join(archive_dir, "NIFTY50", DAY.isoformat())
+    os.remove(os.path.join(path, "expiry.bin"))
+    with open(os.path.join(path, "ltp.bin"), "ab") as handle:
+        handle.write(b"\0\0")  # Half a row left by a crash mid-append
+    assert app.read_archive("NIFTY50", DAY)["expiry"].tolist() == [0] * 7
+
+    write(archive_dir, "NIFTY50", START + 1, section(200), str(NEAR))
+    columns = app.read_archive("NIFTY50", DAY)
+    assert columns["expiry"].tolist() == [0] * 7 + [NEAR] * 7
+    assert columns["timestamp"].tolist() == [START] * 7 + [START + 1] * 7
+    assert columns["ltp"].tolist() == columns["ltp"][:7].tolist() * 2
+
+
+def test_replay_answers_each_archived_expiry_with_its_expiry_list(archive_dir):
+    write(archive_dir, "NIFTY50", START, section(100), str(NEAR))
+    write(archive_dir, f"NIFTY50@{NEXT}", START + 0.5, section(500), str(NEXT))
+    write(archive_dir, "NIFTY50", START + 1, section(200), str(NEAR))
+    replay = app.ReplayFyers(DAY)
+    symbol = app.symbols_map["NIFTY50"]
+    assert replay.timeline().tolist() == [START, START + 0.5, START + 1]
+
+    nearest = replay.optionchain(app.chain_request(symbol))["data"]
+    assert app.listed_expiries(nearest) == [("18-01-2027", str(NEAR)), ("25-01-2027", str(NEXT))]
+    assert app.chain_history_arrays(nearest)[1].tolist() == [200, 201] * 3
+    assert app.chain_expiry("NIFTY50", nearest) == str(NEAR)
+    assert app.parse_chain(nearest)["expiry"] is not None  # Greeks need the time to expiry
+
+    following = replay.optionchain(app.chain_request(symbol, expiry=str(NEXT)))["data"]
+    assert app.chain_history_arrays(following)[1].tolist() == [500, 501] * 3
+    assert replay.optionchain(app.chain_request(symbol, expiry=str(NEAR)))["data"] == nearest
+    assert replay.optionchain(app.chain_request(symbol, expiry="1800950400"))["code"] == -1
+
+
+def test_restored_history_keeps_the_archived_expiry(archive_dir, monkeypatch):
+    monkeypatch.setattr(app, "historical_data", {})
+    write(archive_dir, "NIFTY50", START, section(100), str(NEAR))
+    write(archive_dir, "NIFTY50", START + 1, section(200), str(NEAR))
+    assert app.restore_history("NIFTY50") == 2
+    history = app.historical_data["NIFTY50"]
+    assert history.expiry[0] == NEAR
+
+    # The next live sample of the same contract carries on instead of starting over
+    keys, volumes, ois = app.chain_history_arrays(section(300))
+    app.update_historical_data("NIFTY50", keys, volumes, ois, START + 2, NEAR)
+    assert history.tiers[0][1].count == 3
+
+
+def test_sampling_archives_every_chain_key_with_its_expiry(monkeypatch):
+    monkeypatch.setattr(app, "ARCHIVE_DIR", "unused")
+    monkeypatch.setattr(app, "replay_clock", None)
+    monkeypatch.setattr(app, "archive_queue", app.queue.Queue())
+    monkeypatch.setattr(app, "historical_data", {})
+    monkeypatch.setattr(app, "chain_snapshots", {
+        "NIFTY50": {"version": 1, "timestamp": START, "data": section(100), "key": "NIFTY50", "expiry": str(NEAR)},
+        f"NIFTY50@{NEXT}": {"version": 4, "timestamp": START, "data": section(500), "key": f"NIFTY50@{NEXT}",
+                            "expiry": str(NEXT)}})
+    monkeypatch.setattr(app, "expiry_histories", {})
+    app.sample_snapshots({}, START + 1)
+
+    queued = [app.archive_queue.get_nowait() for _ in range(app.archive_queue.qsize())]
+    assert sorted((key, expiry) for key, _, _, expiry in queued) == [("NIFTY50", str(NEAR)),
+                                                                     (f"NIFTY50@{NEXT}", str(NEXT))]
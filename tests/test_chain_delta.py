@@ -0,0 +1,50 @@
+import app
+
+
+def frame(version, grid, styles=None, analysis="<p>calm</p>"):
+    return {"version": version, "styles": styles or [""] * len(grid), "grid": grid, "spot": 100.0 + version,
+            "analysis": analysis}
+
+
+def test_diff_lists_only_the_changed_cells():
+    base = frame(1, [["<td>1</td>", "<td>2</td>"], ["<td>3</td>", "<td>4</td>"]])
+    new = frame(2, [["<td>1</td>", "<td>5</td>"], ["<td>6</td>", "<td>4</td>"]])
+    assert app.diff_chain_frames(base, new) == [[0, 1, "<td>5</td>"], [1, 0, "<td>6</td>"]]
+    assert app.diff_chain_frames(base, base) == []
+
+
+def test_diff_gives_up_when_the_layout_changes():
+    base = frame(1, [["<td>1</td>", "<td>2</td>"]])
+    assert app.diff_chain_frames(base, frame(2, [["<td>1</td>", "<td>2</td>"], ["<td>3</td>", "<td>4</td>"]])) is None
+    assert app.diff_chain_frames(base, frame(2, [["<td>1</td>"]])) is None
+    assert app.diff_chain_frames(base, frame(2, [["<td>1</td>", "<td>2</td>"]], styles=["atm"])) is None
+
+
+def test_delta_for_a_client_that_is_current_is_empty():
+    latest = frame(3, [["<td>1</td>"]])
+    assert app.build_chain_delta([latest], latest, since=3) == {"version": 3, "spot": 103.0, "cells": []}
+
+
+def test_delta_from_a_known_version_sends_cells_and_changed_analysis():
+    old = frame(1, [["<td>1</td>", "<td>2</td>"]])
+    same = frame(2, [["<td>1</td>", "<td>3</td>"]])
+    moved = frame(3, [["<td>1</td>", "<td>4</td>"]], analysis="<p>busy</p>")
+
+    payload = app.build_chain_delta([old, same], same, since=1)
+    assert payload == {"version": 2, "spot": 102.0, "cells": [[0, 1, "<td>3</td>"]]}
+
+    payload = app.build_chain_delta([old, same, moved], moved, since=2)
+    assert payload["cells"] == [[0, 1, "<td>4</td>"]]
+    assert payload["analysis"] == "<p>busy</p>"
+    assert "full" not in payload
+
+
+def test_delta_from_an_unknown_version_sends_the_full_frame():
+    old = frame(1, [["<td>1</td>"]])
+    latest = frame(5, [["<td>2</td>"]], styles=["style='x'"])
+    for since in (None, 4):
+        payload = app.build_chain_delta([old, latest], latest, since=since)
+        assert payload["full"] is True
+        assert payload["rows"] == "<tr style='x'><td>2</td></tr>"
+        assert payload["analysis"] == latest["analysis"]
+        assert "cells" not in payload
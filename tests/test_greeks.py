@@ -0,0 +1,84 @@
+import math
+
+import numpy as np
+import pytest
+
+import app
+
+
+def closed_form(spot, strike, years, vol, call, rate):
+    """Textbook Black-Scholes price and Greeks for one option, via math.erf"""
+    cdf = lambda x: 0.5 * (1 + math.erf(x / math.sqrt(2)))  # noqa: E731
+    pdf = lambda x: math.exp(-x * x / 2) / math.sqrt(2 * math.pi)  # noqa: E731
+    root = math.sqrt(years)
+    d1 = (math.log(spot / strike) + (rate + vol * vol / 2) * years) / (vol * root)
+    d2 = d1 - vol * root
+    discounted = strike * math.exp(-rate * years)
+    if call:
+        price = spot * cdf(d1) - discounted * cdf(d2)
+        delta = cdf(d1)
+        theta = -spot * pdf(d1) * vol / (2 * root) - rate * discounted * cdf(d2)
+    else:
+        price = discounted * cdf(-d2) - spot * cdf(-d1)
+        delta = cdf(d1) - 1
+        theta = -spot * pdf(d1) * vol / (2 * root) + rate * discounted * cdf(-d2)
+    return {"price": price, "delta": delta, "gamma": pdf(d1) / (spot * vol * root), "theta": theta / 365,
+            "vega": spot * pdf(d1) * root / 100}
+
+
+def test_norm_cdf_matches_erfc_across_the_range():
+    x = np.linspace(-37, 37, 2001)
+    expected = np.array([0.5 * math.erfc(-v / math.sqrt(2)) for v in x])
+    assert np.allclose(app.norm_cdf(x), expected, rtol=0, atol=1e-15)
+    tail = x < -1  # Far tails stay accurate relative to their own size, not just absolutely
+    assert np.allclose(app.norm_cdf(x[tail]), expected[tail], rtol=1e-8, atol=0)
+
+
+def test_black_scholes_reproduces_the_textbook_example(monkeypatch):
+    # Hull, Options, Futures and Other Derivatives: S=42, K=40, r=10%, sigma=20%, six months
+    monkeypatch.setattr(app, "RISK_FREE_RATE", 0.10)
+    prices = app.black_scholes(42.0, np.array([40.0, 40.0]), 0.5, np.array([0.2, 0.2]), np.array([True, False]))[0]
+    assert prices[0] == pytest.approx(4.76, abs=5e-3)
+    assert prices[1] == pytest.approx(0.81, abs=5e-3)
+
+
+def test_greeks_match_closed_forms():
+    spot, years = 24_800.0, 7 / 365
+    strikes = np.array([24_000.0, 24_800.0, 25_600.0] * 2)
+    vols = np.array([0.11, 0.14, 0.18, 0.2, 0.15, 0.12])
+    calls = np.repeat([True, False], 3)
+    greeks = app.option_greeks(spot, strikes, years, vols, calls)
+    prices = app.black_scholes(spot, strikes, years, vols, calls)[0]
+    for i in range(len(strikes)):
+        expected = closed_form(spot, strikes[i], years, vols[i], calls[i], app.RISK_FREE_RATE)
+        assert prices[i] == pytest.approx(expected["price"], rel=1e-9, abs=1e-9)
+        for name in ("delta", "gamma", "theta", "vega"):
+            assert greeks[name][i] == pytest.approx(expected[name], rel=1e-9, abs=1e-12)
+        assert greeks["iv"][i] == pytest.approx(vols[i] * 100)
+
+
+@pytest.mark.parametrize("years", [1 / 365, 30 / 365, 1.0])
+def test_implied_volatility_recovers_the_pricing_volatility(years):
+    spot = 24_800.0
+    strikes = np.tile(np.linspace(22_000, 27_600, 15), 4)
+    vols = np.repeat([0.08, 0.15, 0.3, 0.6], 15)
+    calls = np.tile(np.arange(15) % 2 == 0, 4)
+    prices, vegas = app.black_scholes(spot, strikes, years, vols, calls)[:2]
+    # The solver stops within IV_TOLERANCE rupees, which pins the volatility wherever vega is material
+    sensitive = vegas > 100
+
+    for guess in (None, vols * 1.1):
+        solved = app.implied_volatility(prices, spot, strikes, years, calls, guess=guess)
+        solvable = ~np.isnan(solved)
+        assert solvable.sum() > 40 and sensitive.sum() > 10
+        repriced = app.black_scholes(spot, strikes[solvable], years, solved[solvable], calls[solvable])[0]
+        assert np.abs(repriced - prices[solvable]).max() < app.IV_TOLERANCE
+        assert np.allclose(solved[sensitive], vols[sensitive], rtol=0, atol=1e-6)
+
+
+def test_implied_volatility_is_nan_outside_the_no_arbitrage_bounds():
+    spot, years = 100.0, 0.25
+    strikes = np.array([80.0, 120.0, 100.0, 0.0])
+    calls = np.array([True, False, True, True])
+    prices = np.array([15.0, 15.0, 150.0, 5.0])  # Below intrinsic, below intrinsic, above spot, no strike
+    assert np.isnan(app.implied_volatility(prices, spot, strikes, years, calls)).all()
@@ -0,0 +1,79 @@
+import math
+
+import numpy as np
+
+import app
+
+START = 1_800_000_000.0  # 13:30 IST, so a few hours of samples stay within one trading day
+
+
+def test_buffer_keeps_newest_samples_contiguous_after_wraparound():
+    buffer = app.HistoryBuffer(capacity=4, max_keys=4)
+    for t in range(1, 7):
+        buffer.append(START + t, ["a", "b"], [t * 10, t * 100], [t, t])
+
+    start, stop = buffer.window()
+    assert stop - start == 4
+    assert buffer.timestamps[start:stop].tolist() == [START + t for t in (3, 4, 5, 6)]
+
+    volumes, ois = buffer.samples_at(["a", "b", "missing"], [START, START + 4.5, math.inf])
+    assert volumes[0].tolist() == [30, 50, 60]  # Too old falls back to the oldest, past the end to the newest
+    assert volumes[1].tolist() == [300, 500, 600]
+    assert np.isnan(volumes[2]).all() and np.isnan(ois[2]).all()
+
+
+def test_buffer_reclaims_rows_of_strikes_gone_from_the_window():
+    buffer = app.HistoryBuffer(capacity=2, max_keys=2)
+    buffer.append(START, ["a", "b"], [1, 2], [1, 2])
+    buffer.append(START + 1, ["a"], [1], [1])
+    buffer.append(START + 2, ["a"], [1], [1])  # "b" has no sample left in the window
+    buffer.append(START + 3, ["a", "c"], [5, 7], [5, 7])
+
+    assert set(buffer.rows) == {"a", "c"}
+    volumes, _ = buffer.samples_at(["c"], [math.inf])
+    assert volumes[0, 0] == 7
+
+
+def test_tier_for_picks_the_finest_tier_spanning_the_interval():
+    history = app.TieredHistory(tiers=[(1, 121), (10, 61), (60, 11)])
+    fine, medium, coarse = (buffer for _, buffer in history.tiers)
+    assert history.tier_for(1) is fine
+    assert history.tier_for(2) is fine
+    assert history.tier_for(5) is medium
+    assert history.tier_for(10) is medium
+    assert history.tier_for(30) is coarse  # Longer than any tier spans: the coarsest has the most
+    assert history.tier_for(app.DAY_OPEN) is coarse
+
+
+def test_tiered_changes_end_at_the_given_current_values():
+    history = app.TieredHistory(tiers=[(1, 121), (10, 61)])
+    for t in range(121):
+        history.append(START + t, ["a"], [1000 + t], [50])
+    now = START + 120
+
+    vol_changes, oi_changes = history.changes(["a"], [1], now)
+    assert vol_changes[0, 0] == 60  # Newest sample minus the one a minute earlier
+    assert oi_changes[0, 0] == 0
+
+    vol_changes, oi_changes = history.changes(["a"], [1], now, (np.array([5000.0]), np.array([80.0])))
+    assert vol_changes[0, 0] == 5000 - 1060
+    assert oi_changes[0, 0] == 30
+
+
+def test_rollups_keep_the_first_sample_of_each_bucket():
+    history = app.TieredHistory(tiers=[(1, 5), (10, 5)])
+    for t in range(35):
+        history.append(START + t, ["a"], [t], [t])
+    coarse = history.tiers[1][1]
+    start, stop = coarse.window()
+    assert (coarse.timestamps[start:stop] - START).tolist() == [0, 10, 20, 30]
+
+
+def test_history_starts_over_when_the_expiry_rolls():
+    history = app.TieredHistory(tiers=[(1, 10)])
+    history.append(START, ["a"], [1], [1], expiry=111)
+    history.append(START + 1, ["a"], [2], [2], expiry=111)
+    history.append(START + 2, ["a"], [3], [3], expiry=222)
+
+    assert history.tiers[0][1].count == 1
+    assert history.expiry[0] == 222
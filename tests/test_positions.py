@@ -0,0 +1,111 @@
+import sqlite3
+import time
+
+import pytest
+
+import app
+
+CONTRACT = ("NIFTY50", "1800000000")
+
+
+def position(pos_id, strike, option_type="CE", entry_ltp=100.0, lots=1, lot_size=75):
+    return {"id": pos_id, "strike": strike, "type": option_type, "entry_ltp": entry_ltp, "entry_time": "10:00:00",
+            "lot_size": lot_size, "lots": lots, "opened_at": time.time()}
+
+
+def wait_for_writer(book):
+    for _ in range(100):
+        with book.lock:
+            if not book.pending:
+                return
+        time.sleep(0.05)
+    raise AssertionError("position writer never committed")
+
+
+def test_net_quantity_and_average_price_follow_adds_and_exits():
+    book = app.PositionBook("")
+    book.add(CONTRACT, position("a", 24_800, entry_ltp=100.0))
+    book.add(CONTRACT, position("b", 24_800, entry_ltp=130.0, lots=2))
+    book.add(CONTRACT, position("c", 24_900, option_type="PE", entry_ltp=50.0))
+    book.add(("NIFTY50", "1800600000"), position("d", 24_800))
+
+    assert [p["id"] for p in book.open_positions(CONTRACT)] == ["a", "b", "c"]
+    assert sorted(book.net_positions(CONTRACT)) == [(24_800.0, "CE", 225, 120.0), (24_900.0, "PE", 75, 50.0)]
+
+    book.exit(CONTRACT, "b")
+    assert sorted(book.net_positions(CONTRACT)) == [(24_800.0, "CE", 75, 100.0), (24_900.0, "PE", 75, 50.0)]
+
+    book.exit(CONTRACT, "a")
+    book.exit(CONTRACT, "missing")
+    assert book.net_positions(CONTRACT) == [(24_900.0, "PE", 75, 50.0)]  # A strike netted to zero is dropped
+    assert book.has_open(("NIFTY50", "1800600000"))
+
+    book.clear(CONTRACT)
+    assert book.open_positions(CONTRACT) == [] and book.net_positions(CONTRACT) == []
+    assert book.net_positions(("NIFTY50", "1800600000")) == [(24_800.0, "CE", 75, 100.0)]
+
+
+def test_readding_a_position_replaces_its_quantity():
+    book = app.PositionBook("")
+    book.add(CONTRACT, position("a", 24_800, lots=1))
+    book.add(CONTRACT, position("a", 24_800, lots=3))
+    assert book.net_positions(CONTRACT) == [(24_800.0, "CE", 225, 100.0)]
+
+
+def test_book_survives_a_reopen(tmp_path):
+    path = str(tmp_path / "positions.db")
+    book = app.PositionBook(path)
+    book.add(CONTRACT, position("a", 24_800))
+    book.add(CONTRACT, position("b", 24_900, option_type="PE"))
+    book.exit(CONTRACT, "a")
+    wait_for_writer(book)
+
+    reopened = app.PositionBook(path)
+    reopened.ensure_open()
+    assert [p["id"] for p in reopened.open_positions(CONTRACT)] == ["b"]
+    assert reopened.net_positions(CONTRACT) == [(24_900.0, "PE", 75, 100.0)]
+
+
+def test_rows_from_before_the_expiry_column_are_split_by_contract(tmp_path):
+    path = str(tmp_path / "positions.db")
+    db = sqlite3.connect(path)
+    db.execute("""CREATE TABLE positions (
+        id TEXT PRIMARY KEY, index_name TEXT NOT NULL, strike REAL NOT NULL, option_type TEXT NOT NULL,
+        entry_ltp REAL NOT NULL, entry_time TEXT NOT NULL, lot_size INTEGER NOT NULL,
+        lots INTEGER NOT NULL, opened_at REAL NOT NULL)""")
+    db.execute("INSERT INTO positions VALUES ('a', 'NIFTY50@1800000000', 24800, 'CE', 100, '10:00:00', 75, 1, 1)")
+    db.execute("INSERT INTO positions VALUES ('b', 'NIFTY50', 24900, 'PE', 50, '10:00:00', 75, 2, 2)")
+    db.commit()
+    db.close()
+
+    book = app.PositionBook(path)
+    book.ensure_open()
+    assert [p["id"] for p in book.open_positions(CONTRACT)] == ["a"]
+    assert [p["id"] for p in book.open_positions(("NIFTY50", None))] == ["b"]
+    assert book.undated == {"NIFTY50"}
+
+
+@pytest.mark.parametrize("query", [
+    "strike=24800&type=CE&ltp=100&lots=0",
+    "strike=24800&type=CE&ltp=100&lots=-2",
+    "strike=24800&type=XX&ltp=100",
+    "type=CE&ltp=100",
+    "strike=nan&type=CE&ltp=100",
+    "strike=24800&type=CE&ltp=abc",
+])
+def test_add_position_rejects_bad_input(client, query):
+    response = client.post(f"/add_position?index=NIFTY50&{query}")
+    assert response.status_code == 400
+    assert response.get_json()["status"] == "error"
+
+
+def test_add_position_opens_a_lot(client):
+    contract = app.position_contract("NIFTY50")
+    try:
+        response = client.post("/add_position?index=NIFTY50&strike=24800&type=CE&ltp=101.5&lots=2")
+        assert response.status_code == 200
+        [opened] = app.position_book.open_positions(contract)
+        assert (opened["strike"], opened["type"], opened["entry_ltp"], opened["lots"]) == (24_800.0, "CE", 101.5, 2)
+        assert opened["lot_size"] == app.LOT_SIZES["NIFTY50"]
+    finally:
+        app.position_book.clear(contract)
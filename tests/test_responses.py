@@ -0,0 +1,57 @@
+import gzip
+
+import app
+
+LARGE = '{"rows": "' + "<td>1,234.56</td>" * 200 + '"}'
+
+
+def respond(etag, body, **headers):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return body
+
+    with app.app.test_request_context(headers=headers):
+        response = app.conditional_response(etag, build)
+    return response, len(calls)
+
+
+def test_matching_etag_gets_not_modified_without_building():
+    for tag in ("view-7", "view-7-gz"):
+        response, builds = respond("view-7", LARGE, **{"If-None-Match": f'"{tag}"'})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == f'"{tag}"'
+        assert builds == 0
+
+
+def test_stale_etag_gets_the_body():
+    response, builds = respond("view-8", "{}", **{"If-None-Match": '"view-7"'})
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == "{}"
+    assert response.headers["ETag"] == '"view-8"'
+    assert builds == 1
+
+
+def test_gzip_body_is_compressed_once_per_etag():
+    app.compressed_bodies.clear()
+    response, builds = respond("view-9", LARGE, **{"Accept-Encoding": "gzip, deflate"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"] == '"view-9-gz"'
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(response.get_data()).decode() == LARGE
+    assert builds == 1
+
+    again, builds = respond("view-9", LARGE, **{"Accept-Encoding": "gzip"})
+    assert again.get_data() == response.get_data()
+    assert builds == 0
+
+
+def test_small_or_unaccepted_bodies_go_out_plain():
+    response, _ = respond("view-10", "{}", **{"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["ETag"] == '"view-10"'
+
+    response, _ = respond("view-11", LARGE)
+    assert "Content-Encoding" not in response.headers
+    assert response.get_data(as_text=True) == LARGE
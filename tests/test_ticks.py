@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+import app
+from conftest import chain_section
+from fake_tick_server import FakeTickServer
+
+KEY = "FINNIFTY"
+STRIKES = [23_000, 23_100, 23_200, 23_300, 23_400]
+
+
+def symbol(strike, option_type):
+    return f"NSE:TEST{strike}{option_type}"
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "tick never reached the chain"
+        time.sleep(0.01)
+
+
+def published():
+    """Records of the chain key's latest snapshot by symbol"""
+    return {record["symbol"]: record for record in app.chain_snapshots[KEY]["data"]["optionsChain"]}
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    """A fake tick server wired to the app's tick routing, with fresh chain state"""
+    server = FakeTickServer()
+    for name in ("chain_snapshots", "strike_caches", "tick_symbols", "tick_chains"):
+        monkeypatch.setattr(app, name, {})
+    socket_feed = app.LocalTickSocket(server.address, app.dispatch_tick)
+    monkeypatch.setattr(app, "tick_feed", socket_feed)
+    yield server
+    socket_feed.close()
+    server.close()
+
+
+def start_chain(feed, section):
+    chain = app.TickChain(KEY)
+    app.route_ticks(chain, *chain.resync(lambda strikecount: section))
+    symbols = {symbol(strike, option_type) for strike in STRIKES for option_type in ("CE", "PE")}
+    feed.wait_for(lambda server: server.subscriptions >= symbols)
+    return chain
+
+
+def test_ticks_patch_the_chain_and_publish_once_per_flush(feed):
+    chain = start_chain(feed, chain_section(STRIKES, 23_210.0))
+    first = app.chain_snapshots[KEY]
+
+    feed.send({"symbol": symbol(23_200, "CE"), "ltp": 55.5, "vol_traded_today": 1500})
+    feed.send({"symbol": symbol(23_200, "PE"), "oi": 12_000})
+    feed.send({"symbol": "NSE:NOTHELD", "ltp": 1.0})
+    feed.send({"symbol": symbol(23_300, "CE")})  # Nothing the chain tracks
+    wait_until(lambda: chain.dirty.sum() == 2)
+    chain.flush()
+
+    snapshot = app.chain_snapshots[KEY]
+    assert snapshot["version"] == first["version"] + 1
+    records = published()
+    assert (records[symbol(23_200, "CE")]["ltp"], records[symbol(23_200, "CE")]["volume"]) == (55.5, 1500)
+    assert isinstance(records[symbol(23_200, "CE")]["volume"], int)
+    put = records[symbol(23_200, "PE")]
+    assert (put["oi"], put["oich"], put["oichp"]) == (12_000, 2000, 20.0)  # Against prev_oi 10,000
+    assert records[symbol(23_300, "CE")]["ltp"] == 10.0
+    # Published records are never patched in place
+    assert {r["symbol"]: r for r in first["data"]["optionsChain"]}[symbol(23_200, "CE")]["ltp"] == 10.0
+
+    chain.flush()
+    assert app.chain_snapshots[KEY] is snapshot  # No ticks since: nothing new to publish
+
+
+def test_a_feed_gap_is_filled_by_the_next_resync(feed):
+    chain = start_chain(feed, chain_section(STRIKES, 23_210.0))
+    feed.send({"symbol": symbol(23_000, "CE"), "ltp": 20.0})
+    wait_until(lambda: chain.dirty.any())
+    chain.flush()
+
+    feed.drop()
+    feed.send({"symbol": symbol(23_100, "CE"), "ltp": 99.0})  # Sent during the gap, never delivered
+
+    # The REST resync brings the missed move. It fetches only the ATM window, so the
+    # outer strikes keep their last full fetch with the ticks applied since
+    window = chain_section(STRIKES[1:4], 23_210.0, ltp=([99.0, 30.0, 31.0], [40.0, 41.0, 42.0]))
+    strikecounts = []
+    added, dropped = chain.resync(lambda strikecount: strikecounts.append(strikecount) or window)
+    app.route_ticks(chain, added, dropped)
+    assert strikecounts == [app.HOT_STRIKECOUNT]
+    assert (added, dropped) == (set(), set())
+    records = published()
+    assert records[symbol(23_100, "CE")]["ltp"] == 99.0
+    assert records[symbol(23_300, "PE")]["ltp"] == 42.0
+    assert records[symbol(23_000, "CE")]["ltp"] == 20.0
+    assert records[symbol(23_400, "PE")]["ltp"] == 10.0
+
+    # The socket reconnects on its own, resubscribes everything and ticks flow again
+    feed.wait_for(lambda server: server.connections == 2 and symbol(23_400, "PE") in server.subscriptions)
+    feed.send({"symbol": symbol(23_400, "PE"), "ltp": 7.5})
+    wait_until(lambda: chain.dirty.any())
+    chain.flush()
+    assert published()[symbol(23_400, "PE")]["ltp"] == 7.5
+    assert published()[symbol(23_100, "CE")]["ltp"] == 99.0
+
+
+def test_strikes_leaving_the_full_chain_are_unsubscribed(feed):
+    chain = start_chain(feed, chain_section(STRIKES, 23_210.0))
+    app.strike_caches[KEY].full_at = None  # Make the next resync a full one
+    added, dropped = chain.resync(lambda strikecount: chain_section(STRIKES[1:] + [23_500], 23_310.0))
+    app.route_ticks(chain, added, dropped)
+
+    assert added == {symbol(23_500, "CE"), symbol(23_500, "PE")}
+    assert dropped == {symbol(23_000, "CE"), symbol(23_000, "PE")}
+    feed.wait_for(lambda server: symbol(23_500, "PE") in server.subscriptions
+                  and symbol(23_000, "CE") not in server.subscriptions)
+    assert symbol(23_000, "CE") not in app.tick_symbols